@@ -4,26 +4,25 @@ import os
 import numpy as np
 import pandas as pd
 from ui_components import get_user_inputs_mifid
-from simulation import simulate_multiple_paths, simulate_rolling_bond_process
-from results_display import display_results, display_costs_summary
-from mortality import load_istat_table #, survival_probability
+from results_display import display_results, display_costs_summary, display_tail_metrics
+from mortality_store import load_mortality_table
 from utils import (
     days_between_ages,
-    get_guarantee_cost,
-    get_fonds,
     plausibility_check
 )
-from summary_mifid import generate_mifid_summary_pdf
 #from config import MIFID_FONDS
-from fund_forecast import get_mu_sigma
-from ui_components import plot_bond_growth_over_time
+from quote_engine import DEFAULT_SEED, load_market_parameters
+from result_store import ResultStore
+from pipeline import build_quote_pipeline
+import results_export
+from quote_tables import load_quote_table
 
 # 📄 Layout
 st.set_page_config(page_title="UL Morte – MiFID Profilo", layout="wide")
 st.title("📊 Simulazione basata su profilo di rischio (MiFID II)")
 
 # 📊 Tabelle mortalità
-df_mortality = load_istat_table("Tavole_di_mortalita.csv")
+df_mortality = load_mortality_table()
 
 # 📥 Inputs
 inputs = get_user_inputs_mifid()
@@ -49,96 +48,149 @@ selected_guarantee = st.radio(
     format_func=lambda g: f"{int(g * 100)}%"
 )
 
+# ⚡ Quotazione dalla tabella precalcolata (quote_tables.py), se la richiesta cade nella griglia:
+# la simulazione completa parte solo fuori griglia o su richiesta
+quick_quote = None
+quote_table = load_quote_table()
+if quote_table is not None and inputs["ready"]:
+    try:
+        market = load_market_parameters(mifid_class)  # zwischengespeichert (fund_screening)
+    except Exception as e:
+        market = None
+        st.error(f"❌ Parametri di mercato non disponibili: {e}")
+    if market is not None:
+        quick_quote = quote_table.lookup(inputs, selected_guarantee, initial_costs_pct, market=market)
+    if quick_quote is not None:
+        st.markdown(f"### ⚡ Quotazione – Garanzia {int(selected_guarantee * 100)}%")
+        st.caption(f"Tabella precalcolata, {quick_quote['n_paths']:,} scenari")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("📊 Prestazione media (finale)", f"{quick_quote['mean']:,.0f} EUR")
+        col2.metric("📉 VaR 95%", f"{quick_quote['var_5']:,.0f} EUR")
+        col3.metric("📉 CVaR 95%", f"{quick_quote['cvar_5']:,.0f} EUR")
+        display_costs_summary(costs_percent, quick_quote["guarantee_cost_pct"], quick_quote["total_annual_cost"])
+        quote_table.maybe_spot_check(inputs, selected_guarantee, market=market)
+
 pdf_path = None
 total_paths_by_guarantee = {}
+# Optional: Simulation über den Quote-Service (quote_service.py) statt im Skript-Thread
+quote_service_url = os.environ.get("QUOTE_SERVICE_URL")
+
+# Zielgenauigkeit statt fester Pfadanzahl (nur lokal, nicht über den Quote-Service)
+adaptive = not quote_service_url and (inputs["target_rel_error"] is not None or inputs["target_se"] is not None)
 
-# ▶️ Simulazione
-if inputs["ready"] and st.button("▶️ Avvia simulazione"):
+# Garantie-Tailrisiken (Importance Sampling) nur auf Wunsch: eigene Simulation samt Bootstrap
+tail_risk = not quote_service_url and st.checkbox(
+    "🎯 Calcola anche il rischio di coda della garanzia (simulazione aggiuntiva)", value=False
+)
+
+# Stufen-Pipeline je Sitzung: bei Parameteränderungen werden nur betroffene Stufen neu berechnet
+pipeline_key = "quote_pipeline" + ("_adaptive" if adaptive else "") + ("_tail" if tail_risk else "")
+if pipeline_key not in st.session_state:
+    st.session_state[pipeline_key] = build_quote_pipeline(
+        store=ResultStore("sim_cache"), service_url=quote_service_url, adaptive=adaptive, tail_risk=tail_risk
+    )
+pipeline = st.session_state[pipeline_key]
+
+# Eingaben der angeforderten Simulation: auf dem Raster wird nur für genau diese Anfrage voll simuliert
+request_id = repr(sorted({**inputs, "guarantee_level": selected_guarantee}.items()))
+if quick_quote is None:
+    if inputs["ready"] and st.button("▶️ Avvia simulazione"):
+        st.session_state["mifid_started"] = True
+    run_simulation = inputs["ready"] and st.session_state.get("mifid_started")
+else:
+    if st.button("🔬 Simulazione completa"):
+        st.session_state["mifid_full_request"] = request_id
+    run_simulation = st.session_state.get("mifid_full_request") == request_id
+
+# ▶️ Simulazione (nach dem ersten Start automatisch bei jeder Änderung außerhalb des Rasters)
+if run_simulation:
     try:
-        fonds = get_fonds(mifid_class)
-        if not fonds:
-            st.error("❌ Nessun fondo disponibile per la classe di rischio selezionata.")
-            st.stop()
+        # Vorläufige Anzeige je Szenarioblock; eine Eingabeänderung startet das Skript neu
+        # und bricht den laufenden Durchgang vor dem nächsten Block ab
+        preview = st.empty()
+
+        def show_preview(snapshot):
+            stats = snapshot["stats"]
+            growth = stats["mean"] / snapshot["unit_s0"]
+            spread = 1.96 * stats["std_error"] / snapshot["unit_s0"]
+            preview.caption(
+                f"⏳ Scenari {snapshot['done']}/{snapshot['n_paths']} – "
+                f"crescita lorda media della quota: ×{growth:.2f} (±{spread:.2f})"
+            )
 
-        fond = fonds[0]["ticker"] if isinstance(fonds[0], dict) else fonds[0]
-        mu, sigma, s0 = get_mu_sigma(fond)
-        sigma = sigma if sigma > 0 and not np.isnan(sigma) else 0.15
+        def show_precision(snapshot):
+            precision = snapshot["precision"]
+            preview.caption(
+                f"⏳ Scenari {snapshot['done']:,} ({snapshot['elapsed']:.1f} s) – "
+                f"errore media ±{precision['mean_rel_error']:.2%}, VaR 95% ±{precision['var_rel_error']:.2%}"
+            )
+
+        outputs = pipeline.run({
+            **inputs,
+            "guarantee_level": selected_guarantee,
+            "seed": DEFAULT_SEED,
+            "initial_costs_pct": initial_costs_pct,
+        }, targets=[name for name in ("statistics", "tail_risk", "charts", "report") if name in pipeline.stages],
+           progress={"statistics": show_precision} if adaptive else {"scenarios": show_preview})
+        preview.empty()
+        result = outputs["statistics"]
+        if "precision" in result:
+            precision = result["precision"]
+            status = "✅ obiettivo raggiunto" if precision["target_met"] else "⚠️ tempo massimo esaurito"
+            st.caption(
+                f"🎯 {precision['n_paths']:,} scenari in {precision['elapsed']:.1f} s – "
+                f"prestazione media ±{precision['mean_rel_error']:.2%} (errore standard {precision['mean_se']:,.0f} EUR), "
+                f"VaR 95% ±{precision['var_rel_error']:.2%} – {status}"
+            )
+        mu, sigma = result["mu"], result["sigma"]
+        guarantee_cost_pct = result["guarantee_cost_pct"]
+        total_annual_cost = result["total_annual_cost"]
+        guaranteed_amount = result["guaranteed_amount"]
+        final_fund_values = result["final_fund_values"]
+        end_values = result["end_values"]
 
-        net_contribution = contribution * (1 - initial_costs_pct / 100)
-        n_shares = net_contribution / s0
-        guarantee_cost_pct = get_guarantee_cost(contribution, selected_guarantee, T, sigma)
+        if "exit_shares" in result:
+            shares = ", ".join(f"{label} {share:.1%}" for label, share in result["exit_shares"].items())
+            st.caption(f"🚪 Uscita dal contratto: {shares} – durata media {result['mean_exit_years']:.1f} anni")
 
         if use_bond_simulation:
-            theta = 0.2
-            s0 = mu  # Simuliere Startzins als mu
-            growth_factors = simulate_rolling_bond_process(
-                y0=s0,
-                mu=mu,
-                theta=theta,
-                sigma=sigma,
-                total_days=days,
-                n_paths=n_paths,
-                roll_years=10
-            )
-            final_fund_values = growth_factors * contribution
-            paths_value = np.tile(final_fund_values, (days, 1))
-            end_values = final_fund_values.copy()
-            asset_label = "Obbligazione (roll.)"
-            st.caption(f"📌 Valore medio finale obbligazione: {np.mean(final_fund_values):,.2f} EUR")
-        else:
-            paths = simulate_multiple_paths(s0, mu, sigma, days, n_paths)
-            paths_value = paths * n_shares
-            final_fund_values = paths_value[-1, :]
-            end_values = final_fund_values
-            asset_label = "Fondo"
-
-        total_annual_cost = costs_percent + guarantee_cost_pct
-        if total_annual_cost > 0:
-            for year in range(1, days // 252 + 1):
-                idx = year * 252
-                if idx < paths_value.shape[0]:
-                    paths_value[idx, :] *= (1 - total_annual_cost / 100)
-
-        guaranteed_amount = contribution * selected_guarantee
-        end_values = np.maximum(end_values, guaranteed_amount)
+            st.caption(f"📌 Valore medio finale obbligazione: {result['mean_fund']:,.2f} EUR")
 
         # 🎯 Risultati
         st.markdown(f"### 🎯 Simulazione – Garanzia {int(selected_guarantee * 100)}%")
         col1, col2, col3 = st.columns(3)
-        col1.metric("💶 Capitale garantito", f"{guaranteed_amount:,.0f} EUR")
+        if result["lock_in_pct"] > 0:
+            col1.metric("💶 Capitale garantito (medio, lock-in)", f"{result['mean_floor']:,.0f} EUR")
+        else:
+            col1.metric("💶 Capitale garantito", f"{guaranteed_amount:,.0f} EUR")
         col2.metric("📈 Media fondo (simulata)", f"{np.mean(final_fund_values):,.0f} EUR")
         col3.metric("📊 Prestazione media (finale)", f"{np.mean(end_values):,.0f} EUR")
 
         # 📁 Visualizzazione simulazione
         st.subheader("📁 Visualizzazione simulazione")
         if use_bond_simulation:
-            plot_bond_growth_over_time(
-                s0=1.0,  # Startzins
-                mu=mu,
-                theta=theta,
-                sigma=sigma,
-                total_years=T,
-                n_paths=n_paths,
-                roll_years=10,
-                initial_investment=contribution
-            )
-
+            st.plotly_chart(outputs["charts"], use_container_width=True)
         else:
-            display_results(end_values, paths_value, death_age)
+            display_results(end_values, result["sample_paths"], death_age, fig=outputs["charts"])
 
-        display_costs_summary(costs_percent, guarantee_cost_pct, total_annual_cost)
+        display_costs_summary(costs_percent, guarantee_cost_pct, total_annual_cost,
+                              sensitivities=result.get("guarantee_sensitivities"))
+        if "tail_risk" in outputs:
+            display_tail_metrics(outputs["tail_risk"])
 
         for msg in plausibility_check(guaranteed_amount, np.mean(end_values), mu, sigma, label=f"Garanzia {int(selected_guarantee * 100)}%"):
             st.warning(msg)
 
         # 📄 PDF
-        pdf_path = generate_mifid_summary_pdf(
-            age, contribution, death_age, mifid_class, mu, sigma,
-            costs_percent, n_paths, {selected_guarantee: paths_value}
-        )
+        pdf_path = outputs["report"]
         if pdf_path:
             st.session_state["pdf_path_mifid"] = pdf_path
 
+        # 💾 Export colonnare (Arrow) per le analisi del risk management
+        if results_export.pa is not None and st.button("💾 Esporta risultati (Arrow)"):
+            export_path = results_export.export_results({f"Garanzia {int(selected_guarantee * 100)}%": result})
+            st.success(f"✅ Risultati esportati in {export_path}")
+
     except Exception as e:
         st.error(f"❌ Errore durante la simulazione: {e}")
 
@@ -152,6 +204,8 @@ if pdf_path_session and os.path.exists(pdf_path_session):
             file_name="Report_MiFID.pdf",
             mime="application/pdf"
         )
+elif quick_quote is not None:
+    st.info("ℹ️ Premi 'Simulazione completa' per generare il report.")
 elif inputs["ready"]:
     st.warning("⚠️ Premi prima 'Avvia simulazione' per generare il report.")
 else:
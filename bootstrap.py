@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from market_data import fetch_many, DEFAULT_START, DEFAULT_END
+
+BOOTSTRAP_BLOCK_DAYS = 21           # Blocklänge: ein Börsenmonat (erhält Volatilitäts-Cluster)
+BOOTSTRAP_BLOCK_BYTES = 64 * 1024**2  # Obergrenze für die kumulierten Renditen eines Pfadblocks
+
+
+def historical_log_returns(tickers, start=DEFAULT_START, end=DEFAULT_END, source=None, max_workers=4):
+    """
+    Tägliche Log-Renditen mehrerer Fonds auf gemeinsamen Handelstagen.
+
+    Die Kurse werden über market_data (mit Cache) geladen und auf die Tage
+    ausgerichtet, an denen alle Fonds notieren; Renditen über Feiertage einzelner
+    Börsen fallen so in den nächsten gemeinsamen Tag und gehen nicht verloren.
+
+    Returns:
+        dict: tickers, dates, log_returns (Tage × Fonds), s0 (letzter Kurs je Fonds)
+    Raises:
+        ValueError: wenn für mindestens einen Ticker keine Daten vorliegen.
+    """
+    tickers = list(dict.fromkeys(tickers))
+    prices, errors = fetch_many(tickers, start=start, end=end, source=source, max_workers=max_workers)
+    if errors:
+        details = "; ".join(f"{t}: {e}" for t, e in errors.items())
+        raise ValueError(f"Keine Daten für Ticker gefunden – {details}")
+
+    frame = pd.concat({t: prices[t] for t in tickers}, axis=1, join="inner").dropna()
+    if len(frame) < 2:
+        raise ValueError("Zu wenige gemeinsame Handelstage für das Bootstrap.")
+    values = frame.to_numpy(dtype=float)
+    return {
+        "tickers": tickers,
+        "dates": frame.index[1:],
+        "log_returns": np.diff(np.log(values), axis=0),
+        "s0": values[-1],
+    }
+
+
+def bootstrap_indices(n_history, days, n_paths, block_days=BOOTSTRAP_BLOCK_DAYS, rng=None):
+    """
+    Zeilenindizes eines zirkulären Block-Bootstraps, shape = (days, n_paths).
+
+    Je Pfad werden ceil(days / block_days) zufällige Startpunkte gezogen und zu
+    aufeinanderfolgenden Blöcken verlängert (am Ende der Historie zurück zum Anfang).
+    Dieselben Indizes für alle Fonds erhalten die Abhängigkeit zwischen den Fonds.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    block_days = max(1, min(int(block_days), n_history))
+    n_blocks = -(-int(days) // block_days)
+    starts = rng.integers(0, n_history, size=(n_blocks, n_paths))
+    offsets = np.arange(block_days)[None, :, None]
+    index = (starts[:, None, :] + offsets) % n_history
+    dtype = np.int32 if n_history < 2**31 else np.int64
+    return index.reshape(n_blocks * block_days, n_paths)[:days].astype(dtype, copy=False)
+
+
+def block_bootstrap_paths(log_returns, days, n_paths, block_days=BOOTSTRAP_BLOCK_DAYS, rng=None, S0=1.0,
+                          rows=None, index=None, block_bytes=BOOTSTRAP_BLOCK_BYTES, dtype=np.float64, seed=None):
+    """
+    Kurspfade aus historischen Log-Renditen per Block-Bootstrap (ohne Schleife über Pfade).
+
+    Die Pfade entstehen durch Gather der Renditen über die Bootstrap-Indizes und
+    kumulierte Summe entlang der Zeit – derselbe Aufwand wie bei GBM (Normalzahlen
+    + cumsum), aber mit den dicken Rändern und Volatilitäts-Clustern der Historie.
+
+    Args:
+        log_returns (np.ndarray): Historie, shape = (Tage,) für einen Fonds oder
+            (Tage, Fonds) für gemeinsame Szenarien.
+        days (int): Anzahl simulierter Börsentage.
+        S0 (float | np.ndarray): Startkurs (je Fonds bei 2D-Historie).
+        rows (np.ndarray, optional): nur diese Tageszeilen (0-basiert, Wert nach
+            row + 1 Tagen) ausgeben, z.B. ein Monatsraster.
+        index (np.ndarray, optional): vorgegebene Indizes aus bootstrap_indices
+            (sonst je Pfadblock neu gezogen).
+        seed (int | SeedSequence, optional): je Pfadblock ein eigener Zufallsstrom aus
+            SeedSequence(seed); ohne seed ziehen die Blöcke nacheinander aus `rng`.
+    Returns:
+        np.ndarray: (Zeilen, n_paths) bzw. (Fonds, Zeilen, n_paths); Zeilen = days
+            (wie simulate_multiple_paths) oder len(rows).
+
+    Die Indizes werden je Pfadblock gezogen, der Speicherbedarf bleibt so auch bei
+    langen Horizonten und vielen Pfaden durch block_bytes begrenzt. block_bytes legt
+    damit auch die Aufteilung der Pfade auf die Zufallsströme fest (wie bei
+    path_storage.write_gbm_paths): andere block_bytes ergeben andere Pfade.
+    """
+    history = np.asarray(log_returns, dtype=float)
+    single = history.ndim == 1
+    if single:
+        history = history[:, None]
+    n_history, n_funds = history.shape
+    n_rows = days if rows is None else len(rows)
+    S0 = np.broadcast_to(np.asarray(S0, dtype=float), (n_funds,))
+
+    by_fund = np.ascontiguousarray(history.T)  # je Fonds zusammenhängend → schneller Gather
+    out = np.empty((n_funds, n_rows, n_paths), dtype=dtype)
+    block = max(1, block_bytes // (8 * days))
+    starts = range(0, n_paths, block)
+    streams = None
+    if index is None:
+        if seed is not None:
+            seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+            streams = [np.random.default_rng(stream) for stream in seed.spawn(len(starts))]
+        elif rng is None:
+            rng = np.random.default_rng()
+
+    for b, start in enumerate(starts):
+        stop = min(start + block, n_paths)
+        if index is not None:
+            idx = index[:, start:stop]
+        else:
+            idx = bootstrap_indices(n_history, days, stop - start, block_days, streams[b] if streams else rng)
+        for f in range(n_funds):
+            cumulative = np.cumsum(by_fund[f][idx], axis=0)
+            if rows is not None:
+                cumulative = cumulative[rows]
+            out[f, :, start:stop] = S0[f] * np.exp(cumulative)
+    return out[0] if single else out
+
+
+def simulate_bootstrap_paths(S0, log_returns, days, n_paths=100, block_days=BOOTSTRAP_BLOCK_DAYS, rng=None):
+    """Einzelfonds-Gegenstück zu simulate_multiple_paths (Kurspfade, shape = (days, n_paths))."""
+    return block_bootstrap_paths(log_returns, days, n_paths, block_days=block_days, rng=rng, S0=S0)
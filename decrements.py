@@ -0,0 +1,103 @@
+import numpy as np
+
+# Stornoquoten je Vertragsjahr (letzter Wert gilt für alle weiteren Jahre)
+LAPSE_CURVES = {
+    "none": (0.0,),
+    "standard": (0.08, 0.07, 0.06, 0.05, 0.04, 0.03),
+    "high": (0.15, 0.12, 0.10, 0.08, 0.06, 0.05),
+}
+
+# Ausscheideursachen
+EXIT_MATURITY = 0
+EXIT_DEATH = 1
+EXIT_LAPSE = 2
+EXIT_CAUSES = {EXIT_MATURITY: "scadenza", EXIT_DEATH: "decesso", EXIT_LAPSE: "riscatto"}
+
+
+def qx_from_table(df, max_age=120):
+    """qx je Alter 0..max_age aus einer Tafel im Format von load_istat_table (nach der Tafel: 1)."""
+    qx = np.ones(max_age + 1)
+    ages = df["Età"].to_numpy(dtype=int)
+    inside = ages <= max_age
+    qx[ages[inside]] = np.clip(df["qx"].to_numpy(dtype=float)[inside], 0.0, 1.0)
+    return qx
+
+
+def lapse_rates(curve, n_years):
+    """Stornoquote je Vertragsjahr 0..n_years-1 (Kurve wird mit dem letzten Wert fortgeschrieben)."""
+    curve = np.asarray(LAPSE_CURVES[curve] if isinstance(curve, str) else curve, dtype=float)
+    years = np.minimum(np.arange(n_years), len(curve) - 1)
+    return np.clip(curve[years], 0.0, 1.0)
+
+
+def decrement_probabilities(current_ages, n_years, qx, lapse_curve="none", lapse_multiplier=1.0):
+    """
+    Abhängige Ausscheidewahrscheinlichkeiten je Vertrag und Vertragsjahr.
+
+    Tod und Storno werden als unabhängige Ursachen mit Gleichverteilung im Jahr
+    kombiniert: q(Tod) = qx · (1 − qw/2), q(Storno) = qw · (1 − qx/2).
+
+    Returns:
+        np.ndarray: q_death, q_lapse, shape = (Verträge, n_years)
+    """
+    current_ages = np.atleast_1d(np.asarray(current_ages, dtype=int))
+    ages = np.minimum(current_ages[:, None] + np.arange(n_years)[None, :], len(qx) - 1)
+    q_d = qx[ages]
+    q_w = np.broadcast_to(np.minimum(lapse_rates(lapse_curve, n_years) * lapse_multiplier, 1.0), q_d.shape)
+    return q_d * (1 - q_w / 2), q_w * (1 - q_d / 2)
+
+
+def sample_exits(current_ages, term_years, qx, lapse_curve="none", lapse_multiplier=1.0, rng=None, n=None):
+    """
+    Zieht Ausscheidezeitpunkt und -ursache (Tod, Storno, Ablauf) für alle Verträge
+    bzw. Pfade in einem vektorisierten Durchgang.
+
+    Je Vertrag wird die Ausscheideverteilung über die Vertragsjahre aufgebaut; eine
+    Gleichverteilte bestimmt das Jahr (erste kumulierte Wahrscheinlichkeit ≥ u), eine
+    zweite die Ursache in diesem Jahr, eine dritte den Tag im Jahr. Ohne Ausscheiden
+    endet der Vertrag zum Ablauf (term_years).
+
+    Args:
+        current_ages (int | np.ndarray): Alter bei Beginn je Vertrag.
+        term_years (int | np.ndarray): Laufzeit bis Ablauf in Jahren.
+        qx (np.ndarray): Sterbewahrscheinlichkeit je Alter (siehe qx_from_table).
+        lapse_curve (str | sequence): Name aus LAPSE_CURVES oder Stornoquoten je Vertragsjahr.
+        n (int, optional): Anzahl Ziehungen bei skalarem Alter (z.B. Pfade einer Quote).
+    Returns:
+        dict: exit_days (Börsentage ab Beginn, 1..Laufzeit), exit_years, cause
+            (EXIT_MATURITY, EXIT_DEATH, EXIT_LAPSE)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    ages, terms = np.broadcast_arrays(np.asarray(current_ages, dtype=int), np.asarray(term_years, dtype=int))
+    if n is not None:
+        ages, terms = np.broadcast_to(ages, (n,)), np.broadcast_to(terms, (n,))
+    ages, terms = np.atleast_1d(ages), np.atleast_1d(terms)
+    n_years = int(terms.max())
+
+    q_death, q_lapse = decrement_probabilities(ages, n_years, qx, lapse_curve, lapse_multiplier)
+    active = np.arange(n_years)[None, :] < terms[:, None]
+    q_total = np.where(active, q_death + q_lapse, 0.0)
+    survival = np.cumprod(1 - q_total, axis=1)
+    exit_cdf = 1 - survival
+
+    u = rng.random((3, len(ages)))
+    year = (exit_cdf < u[0][:, None]).sum(axis=1)  # erstes Jahr mit kumulierter Wahrscheinlichkeit ≥ u
+    exited = year < terms
+    year_c = np.minimum(year, n_years - 1)
+    rows = np.arange(len(ages))
+    death_share = q_death[rows, year_c] / np.maximum(q_total[rows, year_c], 1e-300)
+
+    cause = np.where(exited, np.where(u[1] < death_share, EXIT_DEATH, EXIT_LAPSE), EXIT_MATURITY)
+    exit_days = np.where(exited, year * 252 + 1 + np.floor(u[2] * 252).astype(int), terms * 252)
+    exit_days = np.minimum(exit_days, terms * 252)
+    return {
+        "exit_days": exit_days,
+        "exit_years": exit_days / 252,
+        "cause": cause,
+    }
+
+
+def exit_shares(cause, weights=None):
+    """Anteile je Ausscheideursache (Bezeichnung → Anteil)."""
+    cause = np.asarray(cause)
+    return {label: float(np.average(cause == code, weights=weights)) for code, label in EXIT_CAUSES.items()}
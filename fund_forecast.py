@@ -1,57 +1,67 @@
-import yfinance as yf
-import pandas as pd
 import numpy as np
 
-import yfinance as yf
-import pandas as pd
-import numpy as np
+from market_data import fetch_price_series, fetch_many
+from premiums import units_from_premiums
+from utils import brownian_likelihood_ratio, shifted_columns
+
+# Gleichzeitig belegte (Tage × Pfade)-Arrays in simulate_multiple_paths: Normalzahlen,
+# Schocks, Log-Renditen, kumulierte Summe, Kurse und ein Zwischenergebnis
+GBM_WORKING_ARRAYS = 6
+
+
+def _ticker_of(fond):
+    if isinstance(fond, dict):
+        return fond.get("ticker", "")
+    return fond
+
 
-def get_mu_sigma(fond):
+def mu_sigma_from_prices(prices):
+    """Berechnet (mu, sigma, letzter Kurs) aus einer Kursreihe mit Tageswerten."""
+    prices = prices.dropna()
+    returns = np.log(prices / prices.shift(1)).dropna()
+    mu = returns.mean() * 252
+    sigma = returns.std() * np.sqrt(252)
+    S0 = prices.iloc[-1]
+    return mu, sigma, S0
+
+
+def get_mu_sigma(fond, source=None):
     """
     Liefert (mu, sigma, letzter Kurs) für einen Fonds-Ticker oder ein Fonds-Objekt mit Ticker-Feld.
     Args:
         fond (str | dict): Ticker-String oder Dict mit 'ticker'
+        source (callable, optional): Alternative Datenquelle (siehe market_data.fetch_price_series)
     Returns:
         mu (float): Erwartete jährliche Rendite
         sigma (float): Jährliche Volatilität
         S0 (float): Aktueller Kurs
     """
-    if isinstance(fond, dict):
-        ticker = fond.get("ticker", "")
-    else:
-        ticker = fond
-
+    ticker = _ticker_of(fond)
     if not ticker:
         raise ValueError("Ticker ist leer oder ungültig.")
 
-    data = yf.download(ticker, start="2015-01-01", end="2024-12-31", auto_adjust=True)
+    prices = fetch_price_series(ticker, source=source)
+    return mu_sigma_from_prices(prices)
 
-    if data.empty:
-        raise ValueError(f"Keine Daten für Ticker {ticker} gefunden.")
 
-    # Fehlerresistente Umwandlung
-    if isinstance(data.columns, pd.MultiIndex):
-        if 'Adj Close' in data.columns.get_level_values(0):
-            price_series = data['Adj Close']
-            if isinstance(price_series, pd.DataFrame):
-                price_df = price_series.rename(columns={price_series.columns[0]: "Price"})
-            else:
-                price_df = price_series.to_frame(name="Price")
-        else:
-            price_df = data.iloc[:, 0].to_frame(name="Price")
-    else:
-        if 'Adj Close' in data.columns:
-            price_df = data[['Adj Close']].rename(columns={'Adj Close': 'Price'})
-        else:
-            price_df = data.iloc[:, 0].to_frame(name="Price")
+def get_mu_sigma_many(fonds, source=None, max_workers=4):
+    """
+    Lädt die Parameter mehrerer Fonds parallel.
 
-    # Renditen berechnen
-    returns = np.log(price_df["Price"] / price_df["Price"].shift(1)).dropna()
-    mu = returns.mean() * 252
-    sigma = returns.std() * np.sqrt(252)
-    S0 = price_df["Price"].iloc[-1]
+    Returns:
+        dict: Ticker → (mu, sigma, S0)
+    Raises:
+        ValueError: wenn für mindestens einen Ticker weder Daten noch Cache vorhanden sind.
+    """
+    tickers = [_ticker_of(f) for f in fonds]
+    if not all(tickers):
+        raise ValueError("Ticker ist leer oder ungültig.")
 
-    return mu, sigma, S0
+    prices, errors = fetch_many(tickers, source=source, max_workers=max_workers)
+    if errors:
+        details = "; ".join(f"{t}: {e}" for t, e in errors.items())
+        raise ValueError(f"Keine Daten für Ticker gefunden – {details}")
+    return {ticker: mu_sigma_from_prices(series) for ticker, series in prices.items()}
 
 
 
@@ -66,7 +76,8 @@ def simulate_fund_path(S0, mu, sigma, days):
         prices.append(price)
     return prices
 
-def simulate_multiple_paths(S0, mu, sigma, days, n_paths=100, seed=None, mode="price", contribution=None, initial_costs_pct=0.0):
+def simulate_multiple_paths(S0, mu, sigma, days, n_paths=100, seed=None, mode="price", contribution=None, initial_costs_pct=0.0,
+                            premiums=None, rng=None, is_drift=None, is_fraction=1.0):
 
     """
     Simuliert Monte-Carlo-Pfade einer geometrischen brownschen Bewegung (Fondskurs oder Portfoliowert).
@@ -80,35 +91,59 @@ def simulate_multiple_paths(S0, mu, sigma, days, n_paths=100, seed=None, mode="p
         seed (int, optional): Seed für Reproduzierbarkeit.
         mode (str): "price" (Standard) oder "portfolio".
         contribution (float, optional): Einmalanlage für "portfolio"-Modus.
-        initial_costs_pct (float): Einmalige Einstiegskosten in % (nur für "portfolio"-Modus).
+        initial_costs_pct (float): Einmalige Einstiegskosten in % (nur für "portfolio"-Modus;
+            bei laufenden Beiträgen Kosten je Beitrag).
+        premiums (tuple, optional): (Zahlungszeilen, Beiträge) aus premiums.premium_schedule –
+            laufende Beiträge statt Einmalanlage im "portfolio"-Modus.
+        rng (np.random.Generator, optional): Zufallsgenerator (threadsicher, je Lauf);
+            ohne rng wird der globale NumPy-Zustand verwendet (`seed` setzt ihn).
+        is_drift (float, optional): Importance Sampling – Pfade werden mit dieser Drift
+            statt `mu` gezogen (z.B. in Richtung Garantieunterschreitung); zusätzlich
+            werden die Likelihood-Quotienten zurück auf `mu` geliefert.
+        is_fraction (float): Anteil der Pfade mit verschobener Drift (Rest mit `mu`,
+            defensive Mischung, siehe utils.brownian_likelihood_ratio).
     Returns:
         np.ndarray: Simulierte Pfade (Fondspreis oder Portfoliowert), shape = (days, n_paths)
+        np.ndarray: Gewichte je Pfad (nur mit is_drift)
     """
 
-    if seed is not None:
+    if rng is None and seed is not None:
         np.random.seed(seed)
+    random = rng if rng is not None else np.random
     dt = 1 / 252
     drift = (mu - 0.5 * sigma**2) * dt
-    shock = sigma * np.random.randn(days, n_paths) * np.sqrt(dt)
+    normals = random.standard_normal((days, n_paths))
+    weights = None
+    if is_drift is not None:
+        # Verschiebung der Brownschen Bewegung: dW → dW + λ·dt mit λ = (is_drift - mu) / σ
+        shift = (is_drift - mu) / sigma
+        mask, fraction = shifted_columns(n_paths, is_fraction)
+        normals[:, mask] += shift * np.sqrt(dt)
+        weights = brownian_likelihood_ratio(normals.sum(axis=0) * np.sqrt(dt), shift, days * dt, fraction)
+    shock = sigma * normals * np.sqrt(dt)
     log_returns = drift + shock
     log_paths = np.cumsum(log_returns, axis=0)
     paths = S0 * np.exp(log_paths)  # Kursverläufe
     if mode == "portfolio":
-        if contribution is None:
-            raise ValueError("Für 'portfolio'-Modus muss ein Beitrag angegeben werden.")
-        net_contribution = contribution * (1 - initial_costs_pct / 100)
-        n_shares = net_contribution / S0
-        return paths * n_shares  # Portfoliowert-Verlauf
-    return paths  # Kursverlauf
+        if premiums is not None:
+            premium_rows, premium_amounts = premiums
+            paths = units_from_premiums(paths, premium_rows, premium_amounts,
+                                        premium_costs_pct=initial_costs_pct)
+        else:
+            if contribution is None:
+                raise ValueError("Für 'portfolio'-Modus muss ein Beitrag angegeben werden.")
+            net_contribution = contribution * (1 - initial_costs_pct / 100)
+            n_shares = net_contribution / S0
+            paths = paths * n_shares  # Portfoliowert-Verlauf
+    return paths if weights is None else (paths, weights)
  
 
-def get_historical_cagr(ticker, start="2015-01-01", end="2024-12-31"):
-    data = yf.download(ticker, start=start, end=end, auto_adjust=True)
-    data = data.dropna()
-    if data.empty:
+def get_historical_cagr(ticker, start="2015-01-01", end="2024-12-31", source=None):
+    prices = fetch_price_series(ticker, start=start, end=end, source=source).dropna()
+    if prices.empty:
         raise ValueError("Keine Daten gefunden.")
-    S0 = data.iloc[0]["Close"] if "Close" in data.columns else data.iloc[0, 0]
-    S1 = data.iloc[-1]["Close"] if "Close" in data.columns else data.iloc[-1, 0]
-    n_years = (data.index[-1] - data.index[0]).days / 365.25
+    S0 = prices.iloc[0]
+    S1 = prices.iloc[-1]
+    n_years = (prices.index[-1] - prices.index[0]).days / 365.25
     cagr = (S1 / S0) ** (1 / n_years) - 1
     return cagr
@@ -0,0 +1,103 @@
+import time
+import threading
+
+import numpy as np
+
+from config import MIFID_FONDS
+from market_data import fetch_many
+from fund_forecast import mu_sigma_from_prices
+from fx import BASE_CURRENCY, fund_currency, currency_pairs, to_base_prices
+from logger import log_info
+from utils import mifid_class_key, mifid_valid_mask, normalize_fund
+
+FUND_SCREEN_MAX_AGE = 3600    # Sekunden, nach denen das Fondsuniversum neu geprüft wird
+FUND_SCREEN_RETRY_AGE = 60    # kürzer, wenn für einzelne Fonds keine Kurse vorlagen
+
+_SCREEN_CACHE = {}
+_SCREEN_LOCK = threading.Lock()
+
+
+def fund_universe(mifid_fonds=MIFID_FONDS):
+    """Alle Fonds aller Klassen als einheitliche dicts (ticker, name, isin, mifid_class) in Konfigurationsreihenfolge."""
+    return [normalize_fund(entry, mifid_class) for mifid_class, entries in mifid_fonds.items() for entry in entries]
+
+
+def screen_funds(universe=None, source=None, max_workers=8, base=BASE_CURRENCY):
+    """
+    Prüft das gesamte Fondsuniversum in einem Durchgang.
+
+    Die Kurse aller Fonds werden gemeinsam über market_data geladen (paralleler
+    Abruf, Cache), mu und sigma je Fonds geschätzt und die MiFID-Grenzen
+    (utils.MIFID_LIMITS) vektorisiert über alle Fonds angewendet. Fonds in
+    Fremdwährung werden vorher mit dem Wechselkurs aus demselben Abruf in die
+    Basiswährung umgerechnet – die Grenzen gelten für das Risiko des Euro-Anlegers.
+    Fonds ohne Kursdaten werden ausgeschlossen statt die Prüfung abzubrechen.
+
+    Returns:
+        dict: funds (alle Fonds mit currency sowie mu, sigma, s0 in Basiswährung,
+            eligible, reason), eligible
+            (Klasse → geeignete Fonds in Konfigurationsreihenfolge), errors
+            (Ticker → Fehler), screened_at
+    """
+    universe = fund_universe() if universe is None else [dict(fund) for fund in universe]
+    for fund in universe:
+        fund["currency"] = fund_currency(fund)
+    tickers = [fund["ticker"] for fund in universe]
+    fx_tickers, fx_index = currency_pairs([fund["currency"] for fund in universe], base)
+    prices, errors = fetch_many(tickers + fx_tickers, source=source, max_workers=max_workers)
+
+    params = {}
+    for ticker, fx in zip(tickers, fx_index):
+        series = prices.get(ticker)
+        if series is not None and fx >= 0:
+            series = to_base_prices(series, prices[fx_tickers[fx]]) if fx_tickers[fx] in prices else None
+        if series is not None:
+            params[ticker] = mu_sigma_from_prices(series)
+
+    values = np.array([params.get(ticker, (np.nan, np.nan, np.nan)) for ticker in tickers], dtype=float).reshape(-1, 3)
+    mu, sigma, s0 = values.T
+    valid = mifid_valid_mask([fund["mifid_class"] for fund in universe], mu, sigma)
+
+    eligible = {}
+    for i, fund in enumerate(universe):
+        fund.update(mu=float(mu[i]), sigma=float(sigma[i]), s0=float(s0[i]), eligible=bool(valid[i]))
+        if fund["ticker"] in errors or not fund["ticker"]:
+            fund["reason"] = "nessun dato di mercato"
+        elif fund["ticker"] not in params:
+            fund["reason"] = f"nessun tasso di cambio {fx_tickers[fx_index[i]]}"
+        elif not valid[i]:
+            fund["reason"] = f"fuori dai limiti MiFID (μ={mu[i]:.2%}, σ={sigma[i]:.2%})"
+        else:
+            fund["reason"] = None
+            eligible.setdefault(fund["mifid_class"], []).append(fund)
+
+    rejected = [f"{fund['ticker']} ({fund['reason']})" for fund in universe if not fund["eligible"]]
+    log_info(f"Screening fondi: {int(valid.sum())}/{len(universe)} idonei"
+             + (f" – esclusi: {', '.join(rejected)}" if rejected else ""))
+    return {"funds": universe, "eligible": eligible, "errors": errors, "screened_at": time.time()}
+
+
+def load_fund_screen(source=None, max_age=FUND_SCREEN_MAX_AGE):
+    """
+    Zwischengespeichertes Screening je Datenquelle (neu nach max_age Sekunden).
+
+    Parallele Anfragen warten auf ein gemeinsames Screening statt das Universum
+    jeweils selbst zu laden.
+    """
+    with _SCREEN_LOCK:
+        screen = _SCREEN_CACHE.get(source)
+        age = time.time() - screen["screened_at"] if screen else None
+        if screen is None or age >= (FUND_SCREEN_RETRY_AGE if screen["errors"] else max_age):
+            screen = screen_funds(source=source)
+            _SCREEN_CACHE[source] = screen
+        return screen
+
+
+def eligible_funds(mifid_class, source=None):
+    """Geeignete Fonds einer MiFID-Klasse mit mu, sigma und s0 (Reihenfolge wie in MIFID_FONDS)."""
+    return load_fund_screen(source)["eligible"].get(mifid_class_key(mifid_class), [])
+
+
+def clear_fund_screen():
+    with _SCREEN_LOCK:
+        _SCREEN_CACHE.clear()
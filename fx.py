@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+from market_data import DEFAULT_START, DEFAULT_END
+from fund_forecast import get_mu_sigma_many
+from bootstrap import historical_log_returns
+
+BASE_CURRENCY = "EUR"    # Beiträge und Garantien lauten auf Euro
+DEFAULT_CURRENCY = "USD"  # Ticker ohne Börsensuffix: US-Listing
+
+# Börsensuffix (Yahoo) → Handelswährung
+EXCHANGE_CURRENCIES = {
+    ".DE": "EUR", ".F": "EUR", ".AS": "EUR", ".PA": "EUR", ".MI": "EUR", ".MC": "EUR",
+    ".BR": "EUR", ".VI": "EUR", ".IR": "EUR", ".LS": "EUR",
+    ".L": "GBP", ".SW": "CHF",
+}
+
+
+def fund_currency(fund):
+    """Handelswährung eines Fonds: Feld "currency" des Fonds-dicts, sonst aus dem Börsensuffix des Tickers."""
+    if isinstance(fund, dict):
+        if fund.get("currency"):
+            return str(fund["currency"]).upper()
+        fund = fund.get("ticker", "")
+    ticker = str(fund).upper()
+    if ticker.endswith("=X"):
+        return ticker[3:6]  # Wechselkurs selbst: notiert in der Kurswährung
+    suffix = ticker[ticker.rfind("."):] if "." in ticker else ""
+    return EXCHANGE_CURRENCIES.get(suffix, DEFAULT_CURRENCY)
+
+
+def fx_ticker(currency, base=BASE_CURRENCY):
+    """Yahoo-Ticker des Wechselkurses Fremdwährung je Basiswährung (z.B. USD → EURUSD=X), None für die Basiswährung."""
+    currency = currency.upper()
+    return None if currency == base else f"{base}{currency}=X"
+
+
+def currency_pairs(currencies, base=BASE_CURRENCY):
+    """
+    Benötigte Wechselkurse für eine Liste von Währungen.
+
+    Returns:
+        list: Wechselkurs-Ticker (ohne Duplikate)
+        np.ndarray: Index in diese Liste je Eintrag (−1 = Basiswährung)
+    """
+    pairs = list(dict.fromkeys(t for t in (fx_ticker(c, base) for c in currencies) if t))
+    index = np.array([pairs.index(fx_ticker(c, base)) if fx_ticker(c, base) else -1 for c in currencies], dtype=int)
+    return pairs, index
+
+
+def to_base_prices(prices, fx_rates):
+    """Kursreihe in Fremdwährung → Basiswährung (Kurs / Wechselkurs) auf den gemeinsamen Tagen."""
+    aligned = pd.concat([prices, fx_rates], axis=1, join="inner").dropna()
+    return (aligned.iloc[:, 0] / aligned.iloc[:, 1]).rename("Price")
+
+
+def _cholesky(corr):
+    """Cholesky-Faktor einer Korrelationsmatrix; numerisch nicht positiv definite Matrizen werden minimal korrigiert."""
+    try:
+        return np.linalg.cholesky(corr)
+    except np.linalg.LinAlgError:
+        values, vectors = np.linalg.eigh(corr)
+        fixed = vectors @ np.diag(np.maximum(values, 1e-10)) @ vectors.T
+        scale = np.sqrt(np.diag(fixed))
+        return np.linalg.cholesky(fixed / np.outer(scale, scale))
+
+
+def calibrate_joint(tickers, currencies=None, base=BASE_CURRENCY, source=None, start=DEFAULT_START,
+                    end=DEFAULT_END, max_workers=4):
+    """
+    Gemeinsame Kalibrierung von Fonds und den benötigten Wechselkursen.
+
+    mu und sigma je Reihe kommen wie bisher aus der eigenen Historie
+    (get_mu_sigma_many), die Korrelationen aus den Log-Renditen der gemeinsamen
+    Handelstage (bootstrap.historical_log_returns). Fonds- und Wechselkursdaten
+    laufen über denselben Kurs-Cache in market_data.
+
+    Args:
+        tickers (list): Fonds-Ticker.
+        currencies (list, optional): Handelswährung je Fonds (Standard: fund_currency).
+    Returns:
+        dict: assets (Fonds, dann Wechselkurse), fx_tickers, fx_index (je Fonds, −1 =
+            Basiswährung), currencies, mu, sigma, corr, s0
+    """
+    tickers = list(tickers)
+    currencies = [fund_currency(t) for t in tickers] if currencies is None else [c.upper() for c in currencies]
+    fx_tickers, fx_index = currency_pairs(currencies, base)
+    assets = tickers + fx_tickers
+    params = get_mu_sigma_many(assets, source=source, max_workers=max_workers)
+    mu = np.array([params[a][0] for a in assets], dtype=float)
+    sigma = np.array([params[a][1] for a in assets], dtype=float)
+    sigma = np.where((sigma > 0) & ~np.isnan(sigma), sigma, 0.15)
+
+    corr = np.eye(len(assets))
+    if len(assets) > 1:
+        history = historical_log_returns(assets, start=start, end=end, source=source, max_workers=max_workers)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            estimated = np.corrcoef(history["log_returns"], rowvar=False)
+        corr = np.where(np.isfinite(estimated), estimated, corr)
+        np.fill_diagonal(corr, 1.0)
+    return {
+        "assets": assets,
+        "fx_tickers": fx_tickers,
+        "fx_index": fx_index,
+        "currencies": currencies,
+        "base": base,
+        "mu": mu,
+        "sigma": sigma,
+        "corr": corr,
+        "s0": np.array([params[a][2] for a in assets], dtype=float),
+    }
+
+
+def simulate_correlated_gbm(mu, sigma, corr, elapsed_days, n_paths, rng=None):
+    """
+    Korrelierte GBM-Wertfaktoren (Start 1.0) mehrerer Reihen exakt auf einem Tagesraster.
+
+    Alle Normalzahlen werden in einem Zug gezogen (Raster × Reihen × Pfade) und über
+    den Cholesky-Faktor der Korrelationsmatrix korreliert.
+
+    Returns:
+        np.ndarray: Reihen × Rasterpunkte × Pfade
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    mu, sigma = np.asarray(mu, dtype=float), np.asarray(sigma, dtype=float)
+    dt = np.diff(np.asarray(elapsed_days)) / 252
+    normals = rng.standard_normal((len(dt), len(mu), n_paths))
+    shocks = np.einsum("ij,tjp->itp", _cholesky(np.asarray(corr, dtype=float)), normals)
+    log_returns = shocks * (sigma[:, None, None] * np.sqrt(dt)[None, :, None])
+    log_returns += (mu - 0.5 * sigma**2)[:, None, None] * dt[None, :, None]
+    values = np.empty((len(mu), len(dt) + 1, n_paths))
+    values[:, 0] = 1.0
+    np.exp(np.cumsum(log_returns, axis=1), out=values[:, 1:])
+    return values
+
+
+def convert_to_base(fund_values, fx_values, fx_index):
+    """
+    Wertfaktoren in Fondswährung → Basiswährung, in place: je Fremdwährung wird der
+    ganze Fondsblock durch den Wechselkursfaktor geteilt (Broadcast über Fonds).
+
+    Args:
+        fund_values (np.ndarray): Fonds × Rasterpunkte × Pfade (Start 1.0).
+        fx_values (np.ndarray): Wechselkurse × Rasterpunkte × Pfade (Start 1.0,
+            Fremdwährung je Basiswährung).
+        fx_index (np.ndarray): Wechselkurs je Fonds (−1 = Basiswährung).
+    """
+    fx_index = np.asarray(fx_index)
+    for c in range(len(fx_values)):
+        foreign = fx_index == c
+        if foreign.any():
+            fund_values[foreign] /= fx_values[c].astype(fund_values.dtype, copy=False)
+    return fund_values
@@ -1,17 +1,18 @@
-import threading
 import tkinter as tk
 from tkinter import ttk
 from config import FONDS, GARANTIEN
-from mortality import load_istat_table, simulate_death_age
-from fund_forecast import get_mu_sigma, simulate_multiple_paths
+from mortality import simulate_death_age
+from mortality_store import load_mortality_table
+from fund_forecast import GBM_WORKING_ARRAYS, get_mu_sigma, simulate_multiple_paths
 from payouts import calculate_payout
+from progressive import ProgressiveRun, iter_path_chunks, iter_adaptive_chunks
 from utils import days_between_ages
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
 
-# Caricamento tavola di mortalità ISTAT
-df_mortality = load_istat_table("Tavole_di_mortalità.csv")
+# Caricamento tavola di mortalità ISTAT (archivio binario, se presente, altrimenti CSV)
+df_mortality = load_mortality_table()
 
 # GUI setup
 root = tk.Tk()
@@ -42,6 +43,20 @@ tk.Scale(
    variable=n_paths_var
 ).pack()
 
+# Alternativ: Pfadanzahl nach Zielgenauigkeit (relativer Fehler von Mittelwert und VaR 95%)
+adaptive_var = tk.BooleanVar(value=False)
+tk.Checkbutton(root, text="Precisione obiettivo invece del numero fisso", variable=adaptive_var).pack()
+precision_frame = tk.Frame(root)
+tk.Label(precision_frame, text="Errore relativo (%):").pack(side=tk.LEFT)
+target_entry = tk.Entry(precision_frame, width=6)
+target_entry.insert(0, "1.0")
+target_entry.pack(side=tk.LEFT)
+tk.Label(precision_frame, text="Tempo massimo (s):").pack(side=tk.LEFT)
+budget_entry = tk.Entry(precision_frame, width=6)
+budget_entry.insert(0, "20")
+budget_entry.pack(side=tk.LEFT)
+precision_frame.pack()
+
 result_var = tk.StringVar()
 tk.Label(root, textvariable=result_var, font=("Arial", 12)).pack(pady=5)
 
@@ -49,7 +64,58 @@ fig, ax = plt.subplots(figsize=(7, 4))
 canvas = FigureCanvasTkAgg(fig, master=root)
 canvas.get_tk_widget().pack()
 
+POLL_MS = 50
+current_run = None
+
+def show_snapshot(snapshot, ticker, guarantee):
+    paths = snapshot["paths"]
+    done = snapshot["done"]
+    stats = snapshot["stats"]
+    if "precision" in snapshot:
+        precision = snapshot["precision"]
+        status = (f" – {done:,} scenari, ±{precision['mean_rel_error']:.2%} (media), "
+                  f"±{precision['var_rel_error']:.2%} (VaR 95%)")
+        if snapshot["finished"] and not snapshot["target_met"]:
+            status += " – tempo esaurito"
+        elif not snapshot["finished"]:
+            status += "…"
+    else:
+        status = "" if snapshot["finished"] else f" – {done}/{snapshot['n_paths']} scenari…"
+
+    result_var.set(
+        f"Età alla morte simulata: {snapshot['death_age']}{status}\n"
+        f"Prestazione garantita ({int(guarantee * 100)}%):\n"
+        f"Media: {stats['mean'] * guarantee:.2f} USD | Min: {stats['min'] * guarantee:.2f} | "
+        f"Max: {stats['max'] * guarantee:.2f}"
+    )
+
+    ax.clear()
+    for i in range(min(paths.shape[1], done, 20)):  # Max 20 per velocità
+        ax.plot(paths[:, i], alpha=0.2, linewidth=0.7)
+    ax.plot(snapshot["mean_path"], linewidth=2, label='Media')
+    ax.set_title(f"{ticker} – Simulazione Monte Carlo fino a {snapshot['death_age']} anni")
+    ax.set_xlabel("Giorni")
+    ax.set_ylabel("Valore del fondo")
+    ax.legend()
+    canvas.draw()
+
+def poll_run(run, ticker, guarantee, shown_done=None):
+    # Läuft im Tk-Thread: Widgets werden nur hier aktualisiert, nie aus dem Worker
+    if run is not current_run:
+        return  # durch einen neuen Klick abgelöst
+    finished = run.finished
+    snapshot = run.latest()
+    if run.error is not None:
+        result_var.set(str(run.error))
+        return
+    if snapshot is not None and snapshot["done"] != shown_done:
+        show_snapshot(snapshot, ticker, guarantee)
+        shown_done = snapshot["done"]
+    if not finished:
+        root.after(POLL_MS, poll_run, run, ticker, guarantee, shown_done)
+
 def run_simulation():
+    global current_run
     ticker = fonds_combo.get()
     if not ticker:
         result_var.set("Seleziona un fondo.")
@@ -64,45 +130,62 @@ def run_simulation():
         return
 
     guarantee = GARANTIEN[guarantee_combo.get()]
-
-    try:
-        mu, sigma, S0 = get_mu_sigma(ticker)
-    except Exception as e:
-        result_var.set(f"Errore durante il caricamento dei dati del fondo: {e}")
-        return
-
-    try:
-        death_age = simulate_death_age(age, df_mortality)
-    except Exception as e:
-        result_var.set(f"Errore nella simulazione dell'età alla morte: {e}")
-        return
-
-    days = days_between_ages(age, death_age)
     n_paths = n_paths_var.get()
-
-    paths = simulate_multiple_paths(S0, mu, sigma, days, n_paths)
-    end_values = paths[-1] * guarantee
-    payout_mean = np.mean(end_values)
-    payout_min = np.min(end_values)
-    payout_max = np.max(end_values)
-
-    result_var.set(
-        f"Età alla morte simulata: {death_age}\n"
-        f"Prestazione garantita ({int(guarantee * 100)}%):\n"
-        f"Media: {payout_mean:.2f} USD | Min: {payout_min:.2f} | Max: {payout_max:.2f}"
-    )
-
-    ax.clear()
-    for i in range(min(n_paths, 20)):  # Max 20 per velocità
-        ax.plot(paths[:, i], alpha=0.2, linewidth=0.7)
-    ax.plot(np.mean(paths, axis=1), linewidth=2, label='Media')
-    ax.set_title(f"{ticker} – Simulazione Monte Carlo fino a {death_age} anni")
-    ax.set_xlabel("Giorni")
-    ax.set_ylabel("Valore del fondo")
-    ax.legend()
-    canvas.draw()
-
-tk.Button(root, text="Avvia simulazione", command=lambda: threading.Thread(target=run_simulation).start()).pack(pady=10)
+    target_rel_error = time_budget = None
+    if adaptive_var.get():
+        try:
+            target_rel_error = float(target_entry.get().replace(",", ".")) / 100
+            time_budget = float(budget_entry.get().replace(",", "."))
+            if target_rel_error <= 0 or time_budget <= 0:
+                raise ValueError
+        except ValueError:
+            result_var.set("Precisione obiettivo o tempo massimo non validi.")
+            return
+
+    def make_snapshots(cancel):
+        # Im Worker-Thread: Download und Simulation mit eigenem Generator
+        rng = np.random.default_rng()
+        try:
+            mu, sigma, S0 = get_mu_sigma(ticker)
+        except Exception as e:
+            raise RuntimeError(f"Errore durante il caricamento dei dati del fondo: {e}") from e
+
+        try:
+            death_age = simulate_death_age(age, df_mortality, rng=rng)
+        except Exception as e:
+            raise RuntimeError(f"Errore nella simulazione dell'età alla morte: {e}") from e
+
+        days = days_between_ages(age, death_age)
+        simulate_chunk = lambda n, rng: simulate_multiple_paths(S0, mu, sigma, days, n, rng=rng)
+        if target_rel_error is None:
+            for snapshot in iter_path_chunks(simulate_chunk, n_paths, rng, cancel=cancel):
+                yield {**snapshot, "death_age": death_age}
+            return
+
+        def simulate_values(n, rng):
+            paths = simulate_chunk(n, rng)
+            return paths, {"end_values": paths[-1]}
+
+        # ganzer Block in einem Aufruf: alle Temporärdaten wachsen mit der Pfadanzahl
+        for snapshot in iter_adaptive_chunks(simulate_values, rng, target_rel_error=target_rel_error,
+                                             time_budget=time_budget, cancel=cancel,
+                                             path_bytes=8 * GBM_WORKING_ARRAYS * days):
+            end_values = snapshot["values"]["end_values"]
+            yield {
+                **snapshot,
+                "paths": snapshot["sample_paths"],
+                "stats": {"mean": float(np.mean(end_values)), "min": float(np.min(end_values)),
+                          "max": float(np.max(end_values))},
+                "death_age": death_age,
+            }
+
+    if current_run is not None:
+        current_run.cancel()
+    result_var.set("Simulazione in corso…")
+    current_run = ProgressiveRun(make_snapshots).start()
+    root.after(POLL_MS, poll_run, current_run, ticker, guarantee)
+
+tk.Button(root, text="Avvia simulazione", command=run_simulation).pack(pady=10)
 
 
 root.mainloop()
@@ -2,6 +2,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import streamlit as st
+from utils import guarantee_floors
 
 
 def apply_costs(paths, annual_costs_pct, days):
@@ -14,10 +15,13 @@ def apply_costs(paths, annual_costs_pct, days):
     return paths
 
 
-def apply_guarantee(paths, contribution, guarantee_level):
-    """Ersetzt den letzten Wert eines jeden Pfades durch max(Garantie, Fonds)."""
-    guaranteed_amount = contribution * guarantee_level
-    paths[-1] = np.maximum(paths[-1], guaranteed_amount)
+def apply_guarantee(paths, contribution, guarantee_level, lock_in_pct=0.0):
+    """
+    Ersetzt den letzten Wert eines jeden Pfades durch max(Garantie, Fonds).
+    Mit lock_in_pct > 0 steigt die Garantie auf diesen Anteil des höchsten Jahrestagswerts.
+    """
+    floors = guarantee_floors(paths, contribution, guarantee_level, lock_in_pct)
+    paths[-1] = np.maximum(paths[-1], floors)
     return paths
 
 
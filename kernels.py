@@ -0,0 +1,66 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # Numba ist optional – ohne Numba läuft der NumPy-Pfad
+    numba = None
+
+# Standard-Backend: Numba, falls installiert, sonst reines NumPy
+DEFAULT_BACKEND = "numba" if numba is not None else "numpy"
+
+
+def _resolve_backend(backend):
+    backend = backend or DEFAULT_BACKEND
+    if backend == "numba" and numba is None:
+        raise ImportError("Backend 'numba' angefordert, aber Numba ist nicht installiert.")
+    if backend not in ("numba", "numpy"):
+        raise ValueError(f"Unbekanntes Kernel-Backend: {backend}")
+    return backend
+
+
+# ---------------------------------------------------------------------------
+# Ornstein-Uhlenbeck-Rekursion
+# ---------------------------------------------------------------------------
+
+def _ou_recursion_numpy(x0, mu, theta, sigma, dW, dt):
+    steps, n_paths = dW.shape
+    X = np.empty((steps + 1, n_paths))
+    X[0] = x0
+    for t in range(steps):
+        X[t + 1] = X[t] + theta * (mu - X[t]) * dt + sigma * dW[t]
+    return X
+
+
+def _ou_recursion_loop(x0, mu, theta, sigma, dW, dt):
+    steps, n_paths = dW.shape
+    X = np.empty((steps + 1, n_paths))
+    for j in range(n_paths):
+        X[0, j] = x0
+    # Zeit außen, Pfade innen: läuft zeilenweise durch die C-geordneten Arrays
+    for t in range(steps):
+        for j in range(n_paths):
+            x = X[t, j]
+            # gleiche Operationsreihenfolge wie _ou_recursion_numpy → bitgleich
+            X[t + 1, j] = x + theta * (mu - x) * dt + sigma * dW[t, j]
+    return X
+
+
+if numba is not None:
+    _ou_recursion_jit = numba.njit(cache=True, nogil=True)(_ou_recursion_loop)
+
+
+def ou_recursion(x0, mu, theta, sigma, dW, dt, backend=None):
+    """
+    Ornstein-Uhlenbeck-Rekursion X[t+1] = X[t] + θ(μ - X[t])dt + σ dW[t].
+
+    Args:
+        x0 (float): Startwert.
+        dW (np.ndarray): Brownsche Inkremente, shape = (steps, n_paths).
+        backend (str, optional): "numba" oder "numpy" (Standard: DEFAULT_BACKEND).
+    Returns:
+        np.ndarray: Pfade, shape = (steps + 1, n_paths); bitgleich in beiden Backends.
+    """
+    dW = np.ascontiguousarray(dW, dtype=np.float64)
+    if _resolve_backend(backend) == "numba":
+        return _ou_recursion_jit(float(x0), float(mu), float(theta), float(sigma), dW, float(dt))
+    return _ou_recursion_numpy(x0, mu, theta, sigma, dW, dt)
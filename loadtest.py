@@ -0,0 +1,378 @@
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # ohne Display: Grafiken nur im Speicher rendern
+
+import io
+import sys
+import json
+import time
+import zlib
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # nicht unter Windows – dann ohne Spitzen-RSS
+    resource = None
+
+from logger import log_info
+from quote_engine import DEFAULT_SEED
+from result_store import ResultStore
+from pipeline import build_quote_pipeline
+from mortality_store import MORTALITY_STORE_DIR
+from fund_screening import fund_universe
+
+# Stufen, die app2.py je Durchlauf anfordert; "render" ist die Darstellung der Grafik
+LOADTEST_TARGETS = ("statistics", "tail_risk", "charts", "report")
+LATENCY_PERCENTILES = (50, 95, 99)
+MIFID_CLASSES = ("1 - Prudente", "2 - Moderato", "3 - Bilanciato", "4 - Dinamico", "5 - Aggressivo")
+GUARANTEE_LEVELS = (0.8, 0.9, 1.0)
+MORTALITY_FILES = ("Tavole_di_mortalita.csv", MORTALITY_STORE_DIR)
+SYNTHETIC_SIGMA = {"1": 0.02, "2": 0.05, "3": 0.12, "4": 0.18, "5": 0.25}  # innerhalb der MiFID-Grenzen
+
+# Anteile der Anfragearten je Mix: neue Vertragsdaten, Änderung eines Reglers
+# (Kosten bzw. Garantie) oder unveränderte Wiederholung der letzten Anfrage der Sitzung
+REQUEST_MIXES = {
+    "cold": {"new": 1.0},
+    "interactive": {"new": 0.2, "tweak": 0.5, "repeat": 0.3},
+    "repeat": {"new": 0.05, "repeat": 0.95},
+}
+
+
+def synthetic_source(latency=0.0):
+    """
+    Kursquelle ohne Netz für market_data.fetch_price_series: je Ticker eine
+    reproduzierbare GBM-Reihe auf Börsentagen mit einer zur MiFID-Klasse passenden
+    Volatilität, optional mit künstlicher Antwortzeit.
+    """
+    classes = {fund["ticker"]: fund["mifid_class"] for fund in fund_universe()}
+
+    def source(ticker, start, end):
+        if latency:
+            time.sleep(latency)
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        dates = pd.bdate_range(start, end)
+        sigma = SYNTHETIC_SIGMA.get(classes.get(ticker), 0.08 if ticker.endswith("=X") else 0.15) / np.sqrt(252)
+        return pd.Series(100 * np.exp(np.cumsum(rng.normal(0.0002, sigma, len(dates)))), index=dates, name="Price")
+    return source
+
+
+def random_request(rng, n_paths=100, target_rel_error=None, time_budget=20.0):
+    """Zufällige Eingaben im Format von get_user_inputs_mifid plus die Laufparameter aus app2.py."""
+    age = int(rng.integers(25, 66))
+    premium_mode = "monthly" if rng.random() < 0.25 else "single"
+    return {
+        "age": age,
+        "death_age": age + int(rng.integers(5, 41)),
+        "contribution": float(rng.choice([5_000, 10_000, 50_000])),
+        "mifid_class": MIFID_CLASSES[int(rng.integers(len(MIFID_CLASSES)))],
+        "costs_percent": round(float(rng.uniform(0.5, 2.5)), 1),
+        "n_paths": int(n_paths),
+        "target_rel_error": target_rel_error,
+        "target_se": None,
+        "time_budget": time_budget,
+        "lock_in_pct": 0.9 if rng.random() < 0.2 else 0.0,
+        "premium_mode": premium_mode,
+        "annual_premium": 1_200.0 if premium_mode != "single" else 0.0,
+        "premium_indexation_pct": 0.0,
+        "guarantee_fee_mode": "flat",
+        "exit_model": None,
+        "guarantee_level": float(rng.choice(GUARANTEE_LEVELS)),
+        "seed": DEFAULT_SEED,
+        "initial_costs_pct": 0.0,
+    }
+
+
+def next_request(rng, mix, last, **kwargs):
+    """Nächste Anfrage einer Sitzung nach dem Mix (ohne vorherige Anfrage immer neu)."""
+    kinds, weights = zip(*REQUEST_MIXES[mix].items())
+    kind = kinds[int(rng.choice(len(kinds), p=np.asarray(weights) / sum(weights)))] if last else "new"
+    if kind == "repeat":
+        return kind, dict(last)
+    if kind == "tweak":
+        params = dict(last)
+        if rng.random() < 0.5:
+            params["costs_percent"] = round(min(max(params["costs_percent"] + float(rng.choice([-0.2, -0.1, 0.1, 0.2])), 0.0), 5.0), 1)
+        else:
+            params["guarantee_level"] = float(rng.choice([g for g in GUARANTEE_LEVELS if g != params["guarantee_level"]]))
+        return kind, params
+    return "new", random_request(rng, **kwargs)
+
+
+def render_outputs(outputs):
+    """Grafik wie in der App darstellen (Matplotlib als PNG, Plotly als JSON) und freigeben."""
+    fig = outputs.get("charts")
+    if fig is None:
+        return
+    if hasattr(fig, "savefig"):
+        import matplotlib.pyplot as plt
+        fig.savefig(io.BytesIO(), format="png")
+        plt.close(fig)
+    else:
+        fig.to_json()
+
+
+def _percentiles(values):
+    if not values:
+        return {f"p{p}": None for p in LATENCY_PERCENTILES}
+    ms = np.percentile(np.asarray(values) * 1000, LATENCY_PERCENTILES)
+    return {f"p{p}": float(v) for p, v in zip(LATENCY_PERCENTILES, ms)}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024  # macOS: Bytes, Linux: KB
+
+
+def profile_stage_memory(params_list, source=None, adaptive=False):
+    """
+    Spitzenspeicher je Stufe (tracemalloc, MB über dem Stand bei Stufenbeginn).
+
+    Läuft seriell mit eigener Pipeline: tracemalloc zählt prozessweit, parallele
+    Anfragen würden sich gegenseitig zugerechnet. Die Anfragen werden ohne
+    Wiederverwendung gerechnet, jede Stufe also tatsächlich ausgeführt.
+    """
+    peaks = defaultdict(float)
+    pipeline = build_quote_pipeline(source=source, store=None, adaptive=adaptive)
+
+    def traced(name, func):
+        def run(params, upstream, **kwargs):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                return func(params, upstream, **kwargs)
+            finally:
+                peaks[name] = max(peaks[name], (tracemalloc.get_traced_memory()[1] - before) / 1024**2)
+        return run
+
+    for stage in pipeline.stages.values():
+        stage.func = traced(stage.name, stage.func)
+
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start()
+    try:
+        for params in params_list:
+            pipeline.clear()
+            outputs = pipeline.run(params, targets=[t for t in LOADTEST_TARGETS if t in pipeline.stages])
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            render_outputs(outputs)
+            peaks["render"] = max(peaks["render"], (tracemalloc.get_traced_memory()[1] - before) / 1024**2)
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    return dict(peaks)
+
+
+def run_load_test(n_requests=50, concurrency=4, mix="interactive", n_paths=100, seed=0, latency=0.0,
+                  target_rel_error=None, time_budget=20.0, memory_samples=3, store_path="sim_cache"):
+    """
+    Lasttest der kompletten MiFID-Strecke wie in app2.py, ohne Oberfläche.
+
+    `concurrency` Sitzungen laufen parallel in Threads (wie die Skript-Threads von
+    Streamlit), jede mit eigener Pipeline und gemeinsamem ResultStore. Die Sitzungen
+    ziehen Anfragen nach `mix` (REQUEST_MIXES), bis `n_requests` erreicht sind.
+    Marktdaten kommen aus synthetic_source; `latency` simuliert die Antwortzeit der
+    Kursquelle (wirksam nur bei Cache-Fehlschlägen in market_data).
+
+    Returns:
+        dict: config, requests, errors, duration_s, throughput_rps, latency_ms
+            (p50/p95/p99/max), stages (je Stufe computed/cached/stored sowie
+            Perzentile der Rechenzeit in ms und peak_mb), peak_rss_mb
+    """
+    if mix not in REQUEST_MIXES:
+        raise ValueError(f"Mix sconosciuto: {mix} (ammessi: {', '.join(REQUEST_MIXES)})")
+    source = synthetic_source(latency)
+    adaptive = target_rel_error is not None
+    request_kwargs = {"n_paths": n_paths, "target_rel_error": target_rel_error, "time_budget": time_budget}
+    store = ResultStore(store_path)
+
+    lock = threading.Lock()
+    issued = [0]
+    latencies, errors, kinds = [], [], defaultdict(int)
+    stage_times, stage_runs = defaultdict(list), defaultdict(lambda: defaultdict(int))
+
+    def session(session_id):
+        rng = np.random.default_rng([seed, session_id])
+        pipeline = build_quote_pipeline(source=source, store=store, adaptive=adaptive)
+        targets = [t for t in LOADTEST_TARGETS if t in pipeline.stages]
+        last = None
+        while True:
+            with lock:
+                if issued[0] >= n_requests:
+                    return
+                issued[0] += 1
+            kind, params = next_request(rng, mix, last, **request_kwargs)
+            started = time.perf_counter()
+            try:
+                outputs = pipeline.run(params, targets=targets)
+                render_started = time.perf_counter()
+                render_outputs(outputs)
+                render_time = time.perf_counter() - render_started
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                last = None
+                continue
+            elapsed = time.perf_counter() - started
+            last = params
+            with lock:
+                latencies.append(elapsed)
+                kinds[kind] += 1
+                for name, how in pipeline.last_run.items():
+                    stage_runs[name][how] += 1
+                for name, seconds in pipeline.last_timings.items():
+                    stage_times[name].append(seconds)
+                stage_runs["render"]["computed"] += 1
+                stage_times["render"].append(render_time)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadtest-session") as pool:
+        for future in [pool.submit(session, i) for i in range(concurrency)]:
+            future.result()
+    duration = time.perf_counter() - started
+
+    peaks = {}
+    if memory_samples:
+        rng = np.random.default_rng([seed, concurrency])
+        peaks = profile_stage_memory([random_request(rng, **request_kwargs) for _ in range(memory_samples)],
+                                     source=source, adaptive=adaptive)
+
+    stages = {}
+    for name in list(stage_runs) + [n for n in peaks if n not in stage_runs]:
+        stages[name] = {
+            **{how: stage_runs[name].get(how, 0) for how in ("computed", "cached", "stored")},
+            **_percentiles(stage_times[name]),
+            "peak_mb": peaks.get(name),
+        }
+    latency_ms = _percentiles(latencies)
+    latency_ms["max"] = float(max(latencies) * 1000) if latencies else None
+    summary = {
+        "config": {"n_requests": n_requests, "concurrency": concurrency, "mix": mix, "n_paths": n_paths,
+                   "seed": seed, "latency": latency, "target_rel_error": target_rel_error,
+                   "time_budget": time_budget},
+        "requests": len(latencies),
+        "request_kinds": dict(kinds),
+        "errors": errors,
+        "duration_s": duration,
+        "throughput_rps": len(latencies) / duration if duration > 0 else 0.0,
+        "latency_ms": latency_ms,
+        "stages": stages,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    log_info(f"Load test: {len(latencies)} richieste in {duration:.1f} s ({summary['throughput_rps']:.2f}/s), "
+             f"p95 {latency_ms['p95'] or 0:.0f} ms, errori {len(errors)}")
+    return summary
+
+
+def compare_to_baseline(summary, baseline, tolerance=0.25):
+    """
+    Regressionen gegenüber einem früheren Lauf mit gleicher Konfiguration:
+    Durchsatz unter (1 − tolerance) × Basis bzw. p95/p99 über (1 + tolerance) × Basis.
+
+    Returns:
+        list: Beschreibungen der Regressionen (leer = keine)
+    """
+    regressions = []
+    if summary["throughput_rps"] < (1 - tolerance) * baseline["throughput_rps"]:
+        regressions.append(f"throughput {summary['throughput_rps']:.2f}/s < {baseline['throughput_rps']:.2f}/s")
+    for p in ("p95", "p99"):
+        now, before = summary["latency_ms"].get(p), baseline["latency_ms"].get(p)
+        if now is not None and before and now > (1 + tolerance) * before:
+            regressions.append(f"latency {p} {now:.0f} ms > {before:.0f} ms")
+    for name, stage in summary["stages"].items():
+        now, before = stage.get("p95"), baseline.get("stages", {}).get(name, {}).get("p95")
+        if now is not None and before and now > (1 + tolerance) * before:
+            regressions.append(f"{name} p95 {now:.0f} ms > {before:.0f} ms")
+    return regressions
+
+
+def format_summary(summary):
+    """Bericht als Text (Gesamtwerte und Tabelle je Stufe)."""
+    latency = summary["latency_ms"]
+    lines = [
+        f"Richieste: {summary['requests']} ({', '.join(f'{k} {v}' for k, v in summary['request_kinds'].items())}), "
+        f"errori: {len(summary['errors'])}, concorrenza: {summary['config']['concurrency']}",
+        f"Throughput: {summary['throughput_rps']:.2f} richieste/s in {summary['duration_s']:.1f} s",
+        "Latenza (ms): " + ", ".join(f"{k} {v:.0f}" for k, v in latency.items() if v is not None),
+    ]
+    if summary["peak_rss_mb"] is not None:
+        lines.append(f"Memoria massima del processo (RSS): {summary['peak_rss_mb']:.0f} MB")
+    lines.append("")
+    lines.append(f"{'fase':<12}{'calc.':>7}{'cache':>7}{'store':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'picco MB':>10}")
+    for name, stage in summary["stages"].items():
+        times = "".join(f"{stage[f'p{p}']:>9.1f}" if stage[f"p{p}"] is not None else f"{'-':>9}"
+                        for p in LATENCY_PERCENTILES)
+        peak = f"{stage['peak_mb']:>10.1f}" if stage["peak_mb"] is not None else f"{'-':>10}"
+        lines.append(f"{name:<12}{stage['computed']:>7}{stage['cached']:>7}{stage['stored']:>7}{times}{peak}")
+    for error in summary["errors"][:5]:
+        lines.append(f"⚠️ {error}")
+    return "\n".join(lines)
+
+
+def prepare_workdir(workdir, data_dir):
+    """Arbeitsverzeichnis für Caches und Berichte; Sterbetafeln werden aus data_dir verlinkt."""
+    os.makedirs(workdir, exist_ok=True)
+    for name in MORTALITY_FILES:
+        src, dst = os.path.join(data_dir, name), os.path.join(workdir, name)
+        if os.path.exists(src) and not os.path.exists(dst):
+            os.symlink(os.path.abspath(src), dst)
+    return workdir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test di carico della pipeline di quotazione MiFID (senza interfaccia)")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mix", choices=list(REQUEST_MIXES), default="interactive")
+    parser.add_argument("--n-paths", type=int, default=100)
+    parser.add_argument("--target-rel-error", type=float, default=None,
+                        help="Pipeline adattiva con questo errore relativo obiettivo (es. 0.01)")
+    parser.add_argument("--time-budget", type=float, default=20.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Ritardo simulato della fonte dati (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory-samples", type=int, default=3, help="Richieste per il profilo di memoria (0 = nessuno)")
+    parser.add_argument("--workdir", default=None, help="Directory per cache e PDF (default: temporanea)")
+    parser.add_argument("--json", default=None, help="Salva il risultato in formato JSON")
+    parser.add_argument("--baseline", default=None, help="Confronta con un risultato JSON precedente")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)  # kein Log je Pipeline-Lauf
+    data_dir = os.getcwd()
+    workdir = prepare_workdir(args.workdir or tempfile.mkdtemp(prefix="loadtest_"), data_dir)
+    os.chdir(workdir)  # data_cache, sim_cache und pdf_output getrennt vom Betrieb
+    try:
+        summary = run_load_test(args.requests, args.concurrency, args.mix, args.n_paths, args.seed, args.latency,
+                                args.target_rel_error, args.time_budget, args.memory_samples)
+    finally:
+        os.chdir(data_dir)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(format_summary(summary))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != summary["config"]:
+            print("⚠️ Configurazione diversa dal riferimento: confronto solo indicativo")
+        regressions = compare_to_baseline(summary, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regressione: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pandas as pd
+import yfinance as yf
+
+from logger import log_warning
+
+# Lokaler Kurs-Cache (letzte erfolgreiche Zeitreihe je Ticker und Zeitraum)
+CACHE_DIR = "data_cache"
+DEFAULT_START = "2015-01-01"
+DEFAULT_END = "2024-12-31"
+
+# Gemeinsamer Pool für Einzelabrufe: ein hängender Abruf blockiert nur einen Slot
+_ATTEMPT_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="market-data")
+_memory_cache = {}
+_cache_lock = threading.Lock()
+
+
+class MarketDataError(ValueError):
+    """Kursdaten konnten weder geladen noch aus dem Cache bedient werden."""
+
+
+def extract_price_series(data):
+    """
+    Extrahiert die Kursspalte aus einem yfinance-DataFrame als pd.Series 'Price'.
+    Bevorzugt 'Adj Close', sonst die erste Spalte (bei auto_adjust=True: 'Close').
+    """
+    if isinstance(data.columns, pd.MultiIndex):
+        if 'Adj Close' in data.columns.get_level_values(0):
+            price_series = data['Adj Close']
+            if isinstance(price_series, pd.DataFrame):
+                price_series = price_series.iloc[:, 0]
+        else:
+            price_series = data.iloc[:, 0]
+    else:
+        if 'Adj Close' in data.columns:
+            price_series = data['Adj Close']
+        else:
+            price_series = data.iloc[:, 0]
+
+    return price_series.rename("Price")
+
+
+def yahoo_source(ticker, start, end):
+    """Standard-Datenquelle: Tageskurse von Yahoo Finance."""
+    data = yf.download(ticker, start=start, end=end, auto_adjust=True, progress=False)
+    if data is None or data.empty:
+        return None
+    return extract_price_series(data)
+
+
+def _cache_path(ticker, start, end, cache_dir):
+    safe = re.sub(r"[^A-Za-z0-9]+", "_", ticker)
+    return os.path.join(cache_dir, f"{safe}_{start}_{end}.csv")
+
+
+def _store_cache(ticker, start, end, series, cache_dir, source=yahoo_source):
+    with _cache_lock:
+        _memory_cache[(ticker, start, end, source)] = (time.time(), series)
+    if cache_dir and source is yahoo_source:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = _cache_path(ticker, start, end, cache_dir)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        series.to_frame(name="Price").to_csv(tmp_path)
+        os.replace(tmp_path, path)
+
+
+def _load_cache(ticker, start, end, cache_dir, source=yahoo_source):
+    """
+    Liefert (Zeitstempel, Serie) aus Speicher- oder Datei-Cache, sonst None.
+
+    Der Speicher-Cache ist je Datenquelle getrennt; der Datei-Cache hält nur
+    Yahoo-Daten, damit Stub- bzw. synthetische Quellen nie als echte Kurse gelten.
+    """
+    with _cache_lock:
+        cached = _memory_cache.get((ticker, start, end, source))
+    if cached is not None:
+        return cached
+    if not cache_dir or source is not yahoo_source:
+        return None
+
+    path = _cache_path(ticker, start, end, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_csv(path, index_col=0, parse_dates=True, float_precision="round_trip")
+    except Exception as e:
+        log_warning(f"Kurs-Cache für {ticker} nicht lesbar: {e}")
+        return None
+    series = df["Price"]
+    loaded_at = os.path.getmtime(path)
+    with _cache_lock:
+        _memory_cache[(ticker, start, end, source)] = (loaded_at, series)
+    return loaded_at, series
+
+
+def fetch_price_series(ticker, start=DEFAULT_START, end=DEFAULT_END, source=None,
+                       timeout=15.0, retries=2, backoff=0.5, max_age=24 * 3600,
+                       cache_dir=CACHE_DIR):
+    """
+    Lädt die Kurshistorie eines Tickers mit Timeout, Wiederholungen und Cache-Fallback.
+
+    Args:
+        ticker (str): Fonds-Ticker.
+        start, end (str): Zeitraum (ISO-Datum).
+        source (callable, optional): (ticker, start, end) → pd.Series; Standard: yahoo_source.
+            Für Tests kann eine lokale Stub-Quelle übergeben werden.
+        timeout (float): Maximale Wartezeit je Abrufversuch in Sekunden.
+        retries (int): Anzahl Wiederholungen nach dem ersten Versuch.
+        backoff (float): Basis-Wartezeit zwischen Versuchen (verdoppelt sich).
+        max_age (float | None): Cache jünger als max_age Sekunden wird ohne Abruf genutzt
+            (0/None = immer neu laden).
+        cache_dir (str | None): Verzeichnis des Datei-Caches (None = nur Speicher; andere
+            Quellen als yahoo_source werden nur im Speicher und je Quelle zwischengespeichert).
+    Returns:
+        pd.Series: Kursreihe 'Price' mit Datumsindex.
+    """
+    if not ticker:
+        raise ValueError("Ticker ist leer oder ungültig.")
+    source = source or yahoo_source
+
+    cached = _load_cache(ticker, start, end, cache_dir, source)
+    if cached is not None and max_age and time.time() - cached[0] < max_age:
+        return cached[1]
+
+    last_error = None
+    for attempt in range(retries + 1):
+        future = _ATTEMPT_POOL.submit(source, ticker, start, end)
+        try:
+            series = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            last_error = TimeoutError(f"Zeitüberschreitung nach {timeout:g}s")
+        except Exception as e:
+            last_error = e
+        else:
+            if series is not None and len(series.dropna()) > 1:
+                series = series.dropna().rename("Price")
+                _store_cache(ticker, start, end, series, cache_dir, source)
+                return series
+            last_error = MarketDataError("leere Zeitreihe")
+
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+
+    if cached is not None:
+        log_warning(f"Kursabruf für {ticker} fehlgeschlagen ({last_error}) – verwende zwischengespeicherte Daten.")
+        return cached[1]
+    raise MarketDataError(f"Keine Daten für Ticker {ticker} gefunden ({last_error}).")
+
+
+def fetch_many(tickers, start=DEFAULT_START, end=DEFAULT_END, max_workers=4, **kwargs):
+    """
+    Lädt mehrere Ticker parallel über einen begrenzten Thread-Pool.
+
+    Weitere Argumente werden an fetch_price_series durchgereicht.
+
+    Returns:
+        dict: Ticker → pd.Series für erfolgreiche Abrufe
+        dict: Ticker → Exception für Ticker ohne Daten
+    """
+    unique = list(dict.fromkeys(t for t in tickers if t))
+    prices, errors = {}, {}
+    if not unique:
+        return prices, errors
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        futures = {
+            ticker: pool.submit(fetch_price_series, ticker, start, end, **kwargs)
+            for ticker in unique
+        }
+        for ticker, future in futures.items():
+            try:
+                prices[ticker] = future.result()
+            except Exception as e:
+                errors[ticker] = e
+    return prices, errors
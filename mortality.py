@@ -1,25 +1,42 @@
 import pandas as pd
 import numpy as np
 
-def load_istat_table(path='Tavole_di_mortalità.csv'):
+def load_istat_table(path='Tavole_di_mortalita.csv'):
     df = pd.read_csv(path)
     df = df[['Età', 'qx']].dropna()
 
-    if df['qx'].max() > 1:
-        df['qx'] /= 100
+    if df['qx'].max() > 1:  # ISTAT: qx in Promille
+        df['qx'] /= 1000
 
+    return life_table_frame(df['Età'], df['qx'])
+
+def life_table_frame(ages, qx):
+    """Tafel als DataFrame (Età, qx, cum_qx) – gemeinsames Format für CSV und mortality_store."""
+    df = pd.DataFrame({'Età': np.asarray(ages), 'qx': np.asarray(qx, dtype=float)})
     df['cum_qx'] = df['qx'].cumsum()
     df['cum_qx'] /= df['cum_qx'].iloc[-1]
     return df
 
-def simulate_death_age(current_age, df):
-    r = np.random.rand()
+def simulate_death_age(current_age, df, rng=None):
+    r = rng.random() if rng is not None else np.random.rand()
     filtered = df[df['Età'] >= current_age]
     match = filtered[filtered['cum_qx'] >= r]
     if not match.empty:
         return int(match['Età'].iloc[0])
     return int(filtered['Età'].max())
 
+def simulate_death_ages(current_ages, df, rng=None):
+    """
+    Vektorisierte Variante von simulate_death_age für viele Personen auf einmal
+    (gleiche Zuordnung Zufallszahl → Alter, ohne Schleife über die Tabelle).
+    """
+    current_ages = np.asarray(current_ages, dtype=int)
+    r = rng.random(current_ages.shape) if rng is not None else np.random.rand(*current_ages.shape)
+    ages = df['Età'].to_numpy(dtype=int)
+    cum_qx = df['cum_qx'].to_numpy()
+    idx = np.minimum(np.searchsorted(cum_qx, r, side='left'), len(ages) - 1)
+    return np.minimum(np.maximum(ages[idx], current_ages), ages.max())
+
 def get_qx_safe(df, age):
     row = df.loc[df['Età'] == age, 'qx']
     if not row.empty:
@@ -0,0 +1,208 @@
+import os
+import json
+import argparse
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from mortality import load_istat_table, life_table_frame
+from logger import log_info
+
+MORTALITY_STORE_DIR = "mortality_store"
+MAX_AGE = 120
+SEXES = ("M", "F", "T")   # maschi, femmine, totale (unisex)
+KINDS = ("period", "cohort")
+STORE_VERSION = 1
+
+_SEX_ALIASES = {
+    "m": "M", "maschi": "M", "maschio": "M", "male": "M",
+    "f": "F", "femmine": "F", "femmina": "F", "female": "F",
+    "t": "T", "totale": "T", "unisex": "T",
+}
+
+
+def sex_code(sex):
+    """Normiert Geschlechtsangaben (M/F/T, maschi/femmine/totale, …) auf M, F oder T."""
+    code = _SEX_ALIASES.get(str(sex).strip().lower())
+    if code is None:
+        raise ValueError(f"Geschlecht '{sex}' unbekannt (erwartet: M, F oder T).")
+    return code
+
+
+def read_istat_qx(path, max_age=MAX_AGE):
+    """qx einer ISTAT-Tafel als Vektor über die Alter 0..max_age (NaN nach dem Endalter der Tafel)."""
+    df = load_istat_table(path)
+    qx = np.full(max_age + 1, np.nan)
+    ages = df["Età"].to_numpy(dtype=int)
+    inside = (ages >= 0) & (ages <= max_age)
+    qx[ages[inside]] = df["qx"].to_numpy(dtype=float)[inside]  # wie load_istat_table, ohne Kappung
+    last = ages[inside].max()
+    if np.isnan(qx[:last + 1]).any():
+        raise ValueError(f"{path}: Tafel ist lückenhaft (fehlende Alter).")
+    return qx
+
+
+def build_mortality_store(tables, path=MORTALITY_STORE_DIR, max_age=MAX_AGE):
+    """
+    Baut den Sterbetafel-Speicher einmalig aus ISTAT-CSV-Dateien.
+
+    Je Tafelart (Periodentafeln nach Kalenderjahr, Generationentafeln nach
+    Geburtsjahr) entsteht eine .npy-Datei mit qx[Alter, Jahr, Geschlecht];
+    index.json hält Jahre, Geschlechter und Quelldateien fest. Nicht gelieferte
+    Kombinationen und Alter nach dem Endalter einer Tafel bleiben NaN.
+
+    Args:
+        tables (iterable): dicts mit path, sex (M/F/T), year und optional kind
+            ("period" oder "cohort", Standard "period").
+        path (str): Zielverzeichnis.
+    Returns:
+        MortalityStore: der neu geöffnete Speicher.
+    """
+    entries = {kind: {} for kind in KINDS}
+    for table in tables:
+        kind = table.get("kind", "period")
+        if kind not in KINDS:
+            raise ValueError(f"Tafelart '{kind}' unbekannt (erwartet: {', '.join(KINDS)}).")
+        entries[kind][(int(table["year"]), sex_code(table["sex"]))] = table["path"]
+    if not any(entries.values()):
+        raise ValueError("Keine Sterbetafeln angegeben.")
+
+    os.makedirs(path, exist_ok=True)
+    index = {"version": STORE_VERSION, "max_age": max_age, "sexes": list(SEXES), "kinds": {}}
+    for kind, tables_of_kind in entries.items():
+        if not tables_of_kind:
+            continue
+        years = sorted({year for year, _ in tables_of_kind})
+        tmp_path = os.path.join(path, f"{kind}_qx.{os.getpid()}.tmp.npy")
+        qx = open_memmap(tmp_path, mode="w+", dtype=np.float64, shape=(max_age + 1, len(years), len(SEXES)))
+        qx[:] = np.nan
+        for (year, sex), source in tables_of_kind.items():
+            qx[:, years.index(year), SEXES.index(sex)] = read_istat_qx(source, max_age)
+        qx.flush()
+        del qx
+        os.replace(tmp_path, os.path.join(path, f"{kind}_qx.npy"))
+        index["kinds"][kind] = {
+            "years": years,
+            "sources": {f"{year}-{sex}": source for (year, sex), source in sorted(tables_of_kind.items())},
+        }
+
+    # Index zuletzt schreiben: erst dann ist der neue Stand für Leser sichtbar
+    index_path = os.path.join(path, "index.json")
+    tmp_index = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, ensure_ascii=False)
+    os.replace(tmp_index, index_path)
+    log_info(f"Sterbetafel-Speicher {path}: " + ", ".join(
+        f"{kind} {len(info['years'])} anni" for kind, info in index["kinds"].items()))
+    return open_mortality_store(path)
+
+
+class MortalityStore:
+    """
+    Schreibgeschützter Zugriff auf den Sterbetafel-Speicher.
+
+    Die Tafeln werden speicherabgebildet geöffnet (np.load mit mmap_mode="r"):
+    Öffnen kostet nur das Lesen von index.json, und mehrere Worker-Prozesse teilen
+    sich dieselben Seiten im Seitencache des Betriebssystems.
+    """
+
+    def __init__(self, path=MORTALITY_STORE_DIR):
+        self.path = path
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != STORE_VERSION:
+            raise ValueError(f"{path}: Version {self.index.get('version')} nicht unterstützt.")
+        self.max_age = self.index["max_age"]
+        self.years = {kind: np.array(info["years"], dtype=int) for kind, info in self.index["kinds"].items()}
+        self.qx = {kind: np.load(os.path.join(path, f"{kind}_qx.npy"), mmap_mode="r")
+                   for kind in self.index["kinds"]}
+
+    def table_index(self, years, sexes, kind="period"):
+        """
+        Tafelauswahl je Vertrag (vektorisiert): Spalte der jüngsten Tafel mit Jahr ≤
+        gewünschtem Jahr (vor der ersten Tafel: die erste) und Geschlechtsindex.
+        """
+        if kind not in self.years:
+            raise KeyError(f"Keine Tafeln der Art '{kind}' im Speicher.")
+        available = self.years[kind]
+        years = np.asarray(years, dtype=int)
+        year_idx = np.clip(np.searchsorted(available, years, side="right") - 1, 0, len(available) - 1)
+        sex_idx = np.vectorize(lambda s: SEXES.index(sex_code(s)), otypes=[int])(sexes)
+        return np.broadcast_arrays(year_idx, sex_idx)
+
+    def qx_at(self, ages, years, sexes, kind="period"):
+        """
+        qx je Vertrag für Alter, Tafeljahr und Geschlecht (Arrays gleicher Form oder
+        Skalare), begrenzt auf [0, 1]; nach dem Endalter der Tafel ist qx = 1.
+        """
+        year_idx, sex_idx = self.table_index(years, sexes, kind)
+        qx = self.qx[kind]
+        if np.isnan(qx[0, year_idx, sex_idx]).any():
+            raise ValueError("Für mindestens eine Kombination aus Jahr und Geschlecht fehlt die Tafel.")
+        ages = np.clip(np.asarray(ages, dtype=int), 0, self.max_age)
+        values = qx[ages, year_idx, sex_idx]
+        return np.where(np.isnan(values), 1.0, np.clip(values, 0.0, 1.0))
+
+    def select(self, sex="T", year=None, birth_year=None):
+        """
+        Passende Tafel für einen Vertrag: Generationentafel, wenn ein Geburtsjahr
+        angegeben ist und solche Tafeln vorliegen, sonst Periodentafel (Standard:
+        jüngstes Jahr). Fehlt das Geschlecht in der gewählten Tafel, wird die
+        Unisex-Tafel verwendet.
+
+        Returns:
+            tuple: (kind, Tafeljahr, Geschlecht, qx ab Alter 0 bis zum Endalter der Tafel)
+        """
+        candidates = []
+        if birth_year is not None and "cohort" in self.years:
+            candidates.append(("cohort", birth_year))
+        if "period" in self.years:
+            candidates.append(("period", year if year is not None else self.years["period"][-1]))
+        for kind, wanted in candidates:
+            column = int(self.table_index(wanted, "T", kind)[0])
+            for code in dict.fromkeys((sex_code(sex), "T")):
+                qx = np.asarray(self.qx[kind][:, column, SEXES.index(code)])
+                if not np.isnan(qx[0]):
+                    return kind, int(self.years[kind][column]), code, qx[~np.isnan(qx)]
+        raise ValueError(f"Keine Tafel für Geschlecht {sex} (Jahr {year}, Geburtsjahr {birth_year}).")
+
+    def life_table(self, sex="T", year=None, birth_year=None):
+        """Tafel im Format von load_istat_table (Età, qx, cum_qx), z.B. für simulate_death_age."""
+        _, _, _, qx = self.select(sex, year, birth_year)
+        return life_table_frame(np.arange(len(qx)), qx)
+
+
+@lru_cache(maxsize=8)
+def _open_cached(path, mtime_ns):
+    return MortalityStore(path)
+
+
+def open_mortality_store(path=MORTALITY_STORE_DIR):
+    """Geöffneter Speicher je Prozess (wird nach einem Neuaufbau neu geöffnet)."""
+    index_path = os.path.join(path, "index.json")
+    return _open_cached(os.path.abspath(path), os.stat(index_path).st_mtime_ns)
+
+
+def load_mortality_table(sex="T", year=None, birth_year=None, store_path=MORTALITY_STORE_DIR,
+                         csv_path="Tavole_di_mortalita.csv"):
+    """Sterbetafel aus dem Speicher, falls vorhanden – sonst aus der einzelnen ISTAT-CSV."""
+    if os.path.exists(os.path.join(store_path, "index.json")):
+        return open_mortality_store(store_path).life_table(sex, year, birth_year)
+    return load_istat_table(csv_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Costruisce l'archivio binario delle tavole di mortalità ISTAT")
+    parser.add_argument("--out", default=MORTALITY_STORE_DIR)
+    parser.add_argument("--period", nargs=3, action="append", default=[], metavar=("SESSO", "ANNO", "CSV"),
+                        help="Tavola di periodo, es. --period M 2022 maschi_2022.csv")
+    parser.add_argument("--cohort", nargs=3, action="append", default=[], metavar=("SESSO", "NASCITA", "CSV"),
+                        help="Tavola per generazione, es. --cohort F 1960 femmine_1960.csv")
+    args = parser.parse_args()
+
+    tables = [{"kind": "period", "sex": s, "year": y, "path": p} for s, y, p in args.period]
+    tables += [{"kind": "cohort", "sex": s, "year": y, "path": p} for s, y, p in args.cohort]
+    store = build_mortality_store(tables, args.out)
+    for kind, years in store.years.items():
+        print(f"{kind}: {years.tolist()}")
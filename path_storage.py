@@ -0,0 +1,142 @@
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from utils import anniversary_cost_factors
+
+# Zielgröße eines Blocks im Arbeitsspeicher (Pfad- bzw. Zeitblöcke)
+DEFAULT_BLOCK_BYTES = 64 * 1024**2
+
+
+class MemmapPaths:
+    """
+    Pfadmatrix (Tage × Pfade) als speicherabgebildete .npy-Datei.
+
+    Für sehr große Läufe (z.B. 1 Mio. Pfade über 70 Jahre): die Matrix wird
+    blockweise geschrieben und gelesen und nie vollständig geladen. Die Datei
+    ist eine normale .npy-Datei und kann später mit np.load(mmap_mode="r")
+    wieder geöffnet werden.
+    """
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        self.data = np.load(path, mmap_mode=mode)
+
+    @classmethod
+    def create(cls, path, days, n_paths, dtype=np.float64):
+        """Legt eine neue, mit Nullen gefüllte Pfaddatei an."""
+        arr = open_memmap(path, mode="w+", dtype=dtype, shape=(int(days), int(n_paths)))
+        arr.flush()
+        del arr
+        return cls(path, mode="r+")
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def path_blocks(self, block_bytes=DEFAULT_BLOCK_BYTES):
+        """Spaltenbereiche (start, stop), deren Block höchstens block_bytes belegt."""
+        days, n_paths = self.shape
+        size = max(1, block_bytes // (days * self.data.itemsize))
+        for start in range(0, n_paths, size):
+            yield start, min(start + size, n_paths)
+
+    def time_blocks(self, block_bytes=DEFAULT_BLOCK_BYTES):
+        """Zeilenbereiche (start, stop), deren Block höchstens block_bytes belegt."""
+        days, n_paths = self.shape
+        size = max(1, block_bytes // (n_paths * self.data.itemsize))
+        for start in range(0, days, size):
+            yield start, min(start + size, days)
+
+    def flush(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+
+def write_gbm_paths(store, S0, mu, sigma, scale=1.0, seed=None, accumulate=False,
+                    block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Simuliert GBM-Pfade blockweise direkt in die Pfaddatei.
+
+    Jeder Pfadblock erhält einen eigenen Zufallsstrom aus SeedSequence(seed).
+    block_bytes legt damit die Aufteilung der Pfade auf die Ströme fest: gleicher
+    Seed und gleiche block_bytes ergeben identische Pfade, andere block_bytes
+    (oder eine andere Pfadanzahl) andere Pfade.
+
+    Args:
+        store (MemmapPaths): Ziel (Tage × Pfade).
+        S0, mu, sigma (float): GBM-Parameter wie simulate_multiple_paths.
+        scale (float): Faktor auf die Kurse (z.B. Anteile → Portfoliowert).
+        seed (int | SeedSequence, optional): Seed für Reproduzierbarkeit.
+        accumulate (bool): Werte addieren statt überschreiben (mehrere Fonds).
+    """
+    days, _ = store.shape
+    dt = 1 / 252
+    drift = (mu - 0.5 * sigma**2) * dt
+    blocks = list(store.path_blocks(block_bytes))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    streams = seed.spawn(len(blocks))
+
+    for (start, stop), stream in zip(blocks, streams):
+        rng = np.random.default_rng(stream)
+        log_paths = drift + sigma * np.sqrt(dt) * rng.standard_normal((days, stop - start))
+        np.cumsum(log_paths, axis=0, out=log_paths)
+        values = np.exp(log_paths, out=log_paths)
+        values *= S0 * scale
+        if accumulate:
+            store.data[:, start:stop] += values
+        else:
+            store.data[:, start:stop] = values
+    store.flush()
+    return store
+
+
+def apply_annual_costs_streaming(store, total_annual_cost, block_bytes=DEFAULT_BLOCK_BYTES):
+    """Wie utils.apply_annual_costs, aber in Zeitblöcken direkt auf der Pfaddatei."""
+    if total_annual_cost <= 0:
+        return store
+    for start, stop in store.time_blocks(block_bytes):
+        factors = anniversary_cost_factors(np.arange(start, stop), total_annual_cost)
+        store.data[start:stop] *= factors[:, None]
+    store.flush()
+    return store
+
+
+def terminal_values(store):
+    """Endwerte aller Pfade (letzte Zeile) als normales Array."""
+    return np.array(store.data[-1])
+
+
+def guaranteed_end_values(store, contribution, guarantee_level):
+    """Endwerte nach Garantie: max(Fondswert, Beitrag × Garantielevel)."""
+    return np.maximum(terminal_values(store), contribution * guarantee_level)
+
+
+def percentile_bands(store, percentiles=(5, 25, 50, 75, 95), step=21,
+                     block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    Perzentilbänder und Mittelwert je Zeitpunkt, gelesen in Zeitblöcken.
+
+    Args:
+        step (int): Abstand der Zeitpunkte in Tagen (Standard: monatlich);
+            der letzte Tag ist immer enthalten.
+    Returns:
+        np.ndarray: Zeitindex (Zeilen der Pfadmatrix)
+        np.ndarray: Bänder, shape = (len(percentiles), len(Zeitindex))
+        np.ndarray: Mittelwert je Zeitpunkt
+    """
+    days, n_paths = store.shape
+    time_index = np.unique(np.append(np.arange(0, days, step), days - 1))
+    rows_per_block = max(1, block_bytes // (n_paths * store.data.itemsize))
+
+    bands, means = [], []
+    for start in range(0, len(time_index), rows_per_block):
+        rows = np.asarray(store.data[time_index[start:start + rows_per_block]])
+        bands.append(np.percentile(rows, percentiles, axis=1))
+        means.append(rows.mean(axis=1))
+    return time_index, np.concatenate(bands, axis=1), np.concatenate(means)
+
+
+def sample_paths(store, n=20, step=1):
+    """Die ersten n Pfade (jeder step-te Tag) für Diagramme."""
+    return np.array(store.data[::step, :n])
@@ -0,0 +1,317 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from logger import log_info
+from quote_engine import (
+    DEFAULT_SEED, QUOTE_INPUT_KEYS, load_market_parameters, mifid_level, scenario_days,
+    simulate_scenarios, sample_contract_exits, apply_contract_fees, apply_contract_guarantee, contract_statistics,
+    guarantee_tail_metrics, adaptive_quote, mortality_fingerprint
+)
+from result_store import ResultStore
+
+
+class Stage:
+    """
+    Ein Rechenschritt der Pipeline mit deklarierten Eingaben.
+
+    Args:
+        name (str): Name der Stufe (zugleich Name der Ausgabe).
+        func (callable): func(params, upstream) → Ausgabe; `params` enthält nur die
+            deklarierten Parameter, `upstream` die Ausgaben der Vorstufen nach Name.
+        params (tuple): Namen der Eingabeparameter, von denen die Stufe abhängt.
+        depends (tuple): Namen der Vorstufen.
+        volatile (bool): Stufe wird bei jedem Lauf ausgeführt; der Schlüssel der
+            Folgestufen hängt dann von ihrer Ausgabe ab (z.B. Marktdaten, die selbst
+            über market_data zwischengespeichert und nach max_age erneuert werden).
+        persist (bool): Ausgabe zusätzlich im ResultStore der Pipeline ablegen.
+        cache_size (int, optional): Einträge im Speicher (Standard der Pipeline).
+    """
+
+    def __init__(self, name, func, params=(), depends=(), volatile=False, persist=False, cache_size=None):
+        self.name = name
+        self.func = func
+        self.params = tuple(params)
+        self.depends = tuple(depends)
+        self.volatile = volatile
+        self.persist = persist
+        self.cache_size = cache_size
+
+
+class Pipeline:
+    """
+    Gerichtete Folge zwischengespeicherter Stufen.
+
+    Der Schlüssel einer Stufe ist der Hash aus ihren Parametern und den Schlüsseln
+    der Vorstufen. Ändert sich ein Parameter, ändern sich damit nur die Schlüssel
+    der Stufen, die (direkt oder über Vorstufen) davon abhängen – alle anderen
+    werden aus dem Speicher bedient. Vorstufen werden nur berechnet, wenn eine
+    abhängige Stufe nicht im Speicher liegt.
+    """
+
+    def __init__(self, stages, cache_size=2, store=None):
+        self.stages = OrderedDict((stage.name, stage) for stage in stages)
+        for stage in self.stages.values():
+            missing = [d for d in stage.depends if d not in self.stages]
+            if missing:
+                raise ValueError(f"Stufe '{stage.name}': unbekannte Vorstufen {missing}")
+        self.cache_size = cache_size
+        self.store = store
+        self._cache = {name: OrderedDict() for name in self.stages}
+        self.last_run = {}
+        self.last_timings = {}
+
+    def _stage_params(self, stage, params):
+        return {k: params[k] for k in stage.params if k in params}
+
+    def _key(self, name, params, keys, outputs, progress=None):
+        if name in keys:
+            return keys[name]
+        stage = self.stages[name]
+        upstream = []
+        for dep in stage.depends:
+            if self.stages[dep].volatile:
+                # Schlüssel aus der Ausgabe: volatile Stufen werden immer ausgeführt
+                self._evaluate(dep, params, keys, outputs, progress)
+            upstream.append(self._key(dep, params, keys, outputs, progress))
+        if stage.volatile:
+            self._evaluate(name, params, keys, outputs, progress)
+            keys[name] = ResultStore.make_key(stage=name, output=outputs[name])
+        else:
+            keys[name] = ResultStore.make_key(stage=name, params=self._stage_params(stage, params),
+                                              upstream=upstream)
+        return keys[name]
+
+    def _evaluate(self, name, params, keys, outputs, progress=None):
+        if name in outputs:
+            return outputs[name]
+        stage = self.stages[name]
+
+        if not stage.volatile:
+            key = self._key(name, params, keys, outputs, progress)
+            cache = self._cache[name]
+            if key in cache:
+                cache.move_to_end(key)
+                outputs[name] = cache[key]
+                self.last_run[name] = "cached"
+                return outputs[name]
+            if stage.persist and self.store is not None:
+                stored = self.store.get(key)
+                if stored is not None:
+                    self._remember(stage, key, stored)
+                    outputs[name] = stored
+                    self.last_run[name] = "stored"
+                    return stored
+
+        upstream = {dep: self._evaluate(dep, params, keys, outputs, progress) for dep in stage.depends}
+        callback = (progress or {}).get(name)
+        started = time.perf_counter()
+        if callback is not None:
+            output = stage.func(self._stage_params(stage, params), upstream, progress=callback)
+        else:
+            output = stage.func(self._stage_params(stage, params), upstream)
+        outputs[name] = output
+        self.last_run[name] = "computed"
+        self.last_timings[name] = time.perf_counter() - started
+
+        if not stage.volatile:
+            self._remember(stage, key, output)
+            if stage.persist and self.store is not None:
+                self.store.put(key, output)
+        return output
+
+    def _remember(self, stage, key, output):
+        cache = self._cache[stage.name]
+        cache[key] = output
+        cache.move_to_end(key)
+        size = stage.cache_size if stage.cache_size is not None else self.cache_size
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+    def run(self, params, targets=None, progress=None):
+        """
+        Führt die Pipeline für `params` aus.
+
+        Args:
+            params (dict): Alle Eingabeparameter (jede Stufe liest nur ihre eigenen).
+            targets (list, optional): Benötigte Stufen (Standard: alle Endstufen, d.h.
+                Stufen ohne Folgestufen; Vorstufen nur soweit nötig).
+            progress (dict, optional): Stufenname → Callback für Zwischenstände; die
+                Stufenfunktion erhält ihn als `progress` (z.B. Szenarien blockweise).
+        Returns:
+            dict: Ausgaben der ausgewerteten Stufen nach Name. `last_run` hält fest,
+                ob eine Stufe berechnet, aus dem Speicher oder aus dem Store kam,
+                `last_timings` die Rechenzeit (Sekunden, ohne Vorstufen) der berechneten Stufen.
+        """
+        self.last_run = {}
+        self.last_timings = {}
+        keys, outputs = {}, {}
+        if targets is None:
+            needed = {dep for stage in self.stages.values() for dep in stage.depends}
+            targets = [name for name in self.stages if name not in needed]
+        for name in targets:
+            self._evaluate(name, params, keys, outputs, progress)
+        computed = [name for name, how in self.last_run.items() if how == "computed"]
+        log_info(f"Pipeline: ricalcolate {computed or 'nessuna fase'}")
+        return outputs
+
+    def clear(self):
+        for cache in self._cache.values():
+            cache.clear()
+
+
+# ---------------------------------------------------------------------------
+# MiFID-Angebotsstrecke
+# ---------------------------------------------------------------------------
+
+CONTRACT_KEYS = (
+    "age", "death_age", "contribution", "costs_percent", "lock_in_pct",
+    "premium_mode", "annual_premium", "premium_indexation_pct", "guarantee_fee_mode",
+)
+
+
+def _scenarios_stage(params, upstream, progress=None):
+    return simulate_scenarios(upstream["market"], mifid_level(params), scenario_days(params),
+                              int(params["n_paths"]), seed=params.get("seed", DEFAULT_SEED),
+                              on_chunk=progress)
+
+
+def _fees_stage(params, upstream):
+    return apply_contract_fees(
+        upstream["scenarios"], params, params["guarantee_level"], upstream["market"],
+        initial_costs_pct=params.get("initial_costs_pct", 0.0), in_place=False
+    )
+
+
+def _exits_stage(params, upstream):
+    return sample_contract_exits(params, int(params["n_paths"]), seed=params.get("seed", DEFAULT_SEED))
+
+
+def _guarantee_stage(params, upstream):
+    return apply_contract_guarantee(upstream["fees"], upstream["scenarios"], params["guarantee_level"],
+                                    float(params.get("lock_in_pct", 0.0)), exits=upstream["exits"])
+
+
+def _statistics_stage(params, upstream):
+    return contract_statistics(upstream["scenarios"], upstream["fees"], upstream["guarantee"],
+                               upstream["market"], params["guarantee_level"],
+                               float(params.get("lock_in_pct", 0.0)))
+
+
+def _adaptive_statistics_stage(params, upstream, progress=None):
+    return adaptive_quote(params, params["guarantee_level"], upstream["market"],
+                          target_se=params.get("target_se"), target_rel_error=params.get("target_rel_error"),
+                          time_budget=params.get("time_budget", 20.0), seed=params.get("seed", DEFAULT_SEED),
+                          initial_costs_pct=params.get("initial_costs_pct", 0.0), on_chunk=progress)
+
+
+def _tail_risk_stage(params, upstream):
+    return guarantee_tail_metrics(params, params["guarantee_level"], upstream["market"],
+                                  seed=params.get("seed", DEFAULT_SEED),
+                                  initial_costs_pct=params.get("initial_costs_pct", 0.0))
+
+
+def _charts_stage(params, upstream):
+    from results_display import build_paths_figure
+    from ui_components import build_bond_growth_figure
+
+    result = upstream["statistics"]
+    if result["use_bond_simulation"]:
+        years = np.asarray(result["time_index"]) / 252
+        return build_bond_growth_figure(years, result["mean_path"])
+    return build_paths_figure(result["sample_paths"], params["death_age"],
+                              mean_path=result["mean_path"], time_index=result["time_index"])
+
+
+def _report_stage(params, upstream):
+    from summary_mifid import generate_mifid_summary_pdf
+
+    result = upstream["statistics"]
+    level = params["guarantee_level"]
+    tail = upstream.get("tail_risk")
+    n_paths = result["precision"]["n_paths"] if "precision" in result else params["n_paths"]
+    return generate_mifid_summary_pdf(
+        params["age"], result["total_premiums"], params["death_age"], params["mifid_class"],
+        result["mu"], result["sigma"], params["costs_percent"], n_paths,
+        {level: result["final_fund_values"]},
+        floors_by_guarantee={level: result["floors"]},
+        end_values_by_guarantee={level: result["end_values"]},
+        tail_metrics_by_guarantee={level: tail} if tail else None,
+        sensitivities_by_guarantee={level: result["guarantee_sensitivities"]}
+        if result.get("guarantee_sensitivities") else None
+    )
+
+
+def build_quote_pipeline(source=None, store=None, service_url=None, adaptive=False, tail_risk=False):
+    """
+    Stufen der MiFID-Strecke: Marktparameter → Szenarien → Kosten → Garantie
+    (mit Ausscheiden nach exit_model) → Kennzahlen → Grafik → Bericht; mit `tail_risk`
+    daneben die Garantie-Tailrisiken aus Importance Sampling (nur lokal; eine zweite
+    Simulation samt Bootstrap, daher nur auf Wunsch).
+
+    Eine Kostenänderung berechnet so z.B. nur Kosten, Garantie, Kennzahlen, Grafik
+    und Bericht neu, die Szenarien kommen aus dem Speicher. Mit `service_url` werden
+    die Stufen bis einschließlich der Kennzahlen vom Quote-Service gerechnet; mit
+    `adaptive` ersetzt adaptive_quote (Pfadanzahl nach Zielgenauigkeit, Parameter
+    target_se / target_rel_error / time_budget) Szenarien, Kosten, Garantie und Kennzahlen.
+
+    Parameter für run(): die Eingaben von get_user_inputs_mifid sowie
+    guarantee_level, seed und initial_costs_pct.
+    """
+    report_params = ("age", "death_age", "mifid_class", "costs_percent", "n_paths", "guarantee_level")
+    charts = Stage("charts", _charts_stage, params=("death_age",), depends=("statistics",))
+
+    if service_url:
+        from quote_service import request_quote
+
+        def remote_statistics(params, upstream):
+            return request_quote(service_url, params, params["guarantee_level"],
+                                 initial_costs_pct=params.get("initial_costs_pct", 0.0))
+
+        remote = Stage("statistics", remote_statistics,
+                       params=QUOTE_INPUT_KEYS + ("guarantee_level", "initial_costs_pct"))
+        report = Stage("report", _report_stage, params=report_params, depends=("statistics",))
+        return Pipeline([remote, charts, report], store=store)
+
+    market = Stage("market", lambda params, upstream: load_market_parameters(params["mifid_class"], source=source),
+                   params=("mifid_class",), volatile=True)
+    # Sterbetafel als volatile Stufe: ein neu gebauter Tafelspeicher bzw. eine geänderte
+    # CSV ändert die Schlüssel von Ausscheiden, Kennzahlen und Tailrisiken
+    mortality = Stage("mortality", lambda params, upstream: mortality_fingerprint(params.get("exit_model")),
+                      params=("exit_model",), volatile=True)
+    extras = []
+    if tail_risk:
+        extras.append(Stage("tail_risk", _tail_risk_stage,
+                            params=QUOTE_INPUT_KEYS + ("guarantee_level", "seed", "initial_costs_pct"),
+                            depends=("market", "mortality"), persist=True))
+    report = Stage("report", _report_stage, params=report_params,
+                   depends=("statistics", "tail_risk") if tail_risk else ("statistics",))
+
+    if adaptive:
+        # Ergebnis hängt vom Zeitbudget ab → nur im Sitzungsspeicher, nicht im ResultStore
+        statistics = Stage("statistics", _adaptive_statistics_stage,
+                           params=QUOTE_INPUT_KEYS + ("guarantee_level", "seed", "initial_costs_pct",
+                                                      "target_se", "target_rel_error", "time_budget"),
+                           depends=("market", "mortality"))
+        return Pipeline([market, mortality, statistics, *extras, charts, report], store=store)
+
+    stages = [
+        market,
+        mortality,
+        Stage("scenarios", _scenarios_stage,
+              params=("mifid_class", "age", "death_age", "n_paths", "seed"), depends=("market",),
+              cache_size=1),
+        Stage("fees", _fees_stage, params=CONTRACT_KEYS + ("guarantee_level", "initial_costs_pct"),
+              depends=("scenarios", "market")),
+        Stage("exits", _exits_stage, params=("age", "death_age", "n_paths", "seed", "exit_model"),
+              depends=("mortality",)),
+        Stage("guarantee", _guarantee_stage, params=("guarantee_level", "lock_in_pct"),
+              depends=("fees", "scenarios", "exits")),
+        Stage("statistics", _statistics_stage, params=("guarantee_level", "lock_in_pct"),
+              depends=("scenarios", "fees", "guarantee", "market"), persist=True),
+        *extras,
+        charts,
+        report,
+    ]
+    return Pipeline(stages, store=store)
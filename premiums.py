@@ -0,0 +1,87 @@
+import numpy as np
+
+from utils import anniversary_cost_factors
+
+# Zahlungsweise → Abstand der Beitragszahlungen in Börsentagen
+PREMIUM_FREQUENCIES = {
+    "monthly": 21,
+    "quarterly": 63,
+    "annual": 252,
+}
+
+
+def premium_schedule(annual_premium, days, frequency="monthly", indexation_pct=0.0):
+    """
+    Beitragsplan eines Sparvertrags mit laufenden Beiträgen.
+
+    Args:
+        annual_premium (float): Jahresbeitrag im ersten Jahr (EUR).
+        days (int): Laufzeit in Börsentagen.
+        frequency (str): "monthly", "quarterly" oder "annual".
+        indexation_pct (float): Jährliche Dynamik der Beiträge in %.
+    Returns:
+        np.ndarray: Zahlungszeitpunkte (Zeilen der Tagesmatrix)
+        np.ndarray: Beitragshöhe je Zahlung (EUR)
+    """
+    if frequency not in PREMIUM_FREQUENCIES:
+        raise ValueError(f"Unbekannte Zahlungsweise: {frequency}")
+    step = PREMIUM_FREQUENCIES[frequency]
+    rows = np.arange(0, int(days), step)
+    per_payment = annual_premium * step / 252
+    amounts = per_payment * (1 + indexation_pct / 100) ** (rows // 252)
+    return rows, amounts
+
+
+def units_from_premiums(prices, premium_rows, premium_amounts, total_annual_cost=0.0,
+                        premium_costs_pct=0.0, time_index=None):
+    """
+    Wertverlauf eines Vertrags mit laufenden Beiträgen, vollständig vektorisiert.
+
+    Jeder Beitrag kauft (nach Abzug der Beitragskosten) Anteile zum simulierten Kurs
+    seines Zahlungstages. Jährliche Kosten reduzieren den Anteilsbestand an jedem
+    Jahrestag; mit dem kumulierten Kostenfaktor F(t) gilt
+        Anteile(t) = F(t) · Σ_{k: t_k ≤ t} Anteile_k / F(t_k),
+    was sich als kumulierte Summe über die Käufe und ein Gather je Zeile berechnen lässt.
+
+    Args:
+        prices (np.ndarray): Anteilspreise, shape = (Zeilen, n_paths).
+        premium_rows (np.ndarray): Zahlungszeitpunkte als Zeilen der Tagesmatrix.
+        premium_amounts (np.ndarray): Bruttobeiträge (EUR).
+        total_annual_cost (float): Jährliche Kosten in % (an Jahrestagen).
+        premium_costs_pct (float): Kosten in % auf jeden Beitrag.
+        time_index (np.ndarray, optional): Tageszeilen der Preiszeilen (Zeitraster);
+            alle Zahlungszeitpunkte müssen darin enthalten sein.
+    Returns:
+        np.ndarray: Vertragswert, shape wie prices.
+    """
+    if time_index is None:
+        time_index = np.arange(prices.shape[0])
+    time_index = np.asarray(time_index)
+    premium_rows = np.asarray(premium_rows)
+
+    positions = np.searchsorted(time_index, premium_rows)
+    if np.any(positions >= len(time_index)) or np.any(time_index[np.minimum(positions, len(time_index) - 1)] != premium_rows):
+        raise ValueError("Zahlungszeitpunkte liegen nicht auf dem Zeitraster der Kurse.")
+
+    net_amounts = np.asarray(premium_amounts, dtype=float) * (1 - premium_costs_pct / 100)
+    cost_at_purchase = anniversary_cost_factors(premium_rows, total_annual_cost)
+    units_bought = (net_amounts / cost_at_purchase)[:, None] / prices[positions]
+    cumulative_units = np.cumsum(units_bought, axis=0)
+
+    # Letzter Kauf bis einschließlich Zeile t (−1 = noch kein Kauf)
+    last_purchase = np.searchsorted(positions, np.arange(len(time_index)), side="right") - 1
+    units = cumulative_units[np.maximum(last_purchase, 0)]
+    units[last_purchase < 0] = 0.0
+    units *= anniversary_cost_factors(time_index, total_annual_cost)[:, None]
+    units *= prices
+    return units
+
+
+def premiums_paid(premium_rows, premium_amounts, up_to_row=None):
+    """Summe der bis einschließlich `up_to_row` gezahlten Bruttobeiträge (Beitragsgarantie)."""
+    premium_amounts = np.asarray(premium_amounts, dtype=float)
+    if up_to_row is None:
+        return float(premium_amounts.sum())
+    paid = np.cumsum(premium_amounts)
+    idx = np.searchsorted(np.asarray(premium_rows), up_to_row, side="right") - 1
+    return np.where(idx >= 0, paid[np.maximum(idx, 0)], 0.0)
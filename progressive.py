@@ -0,0 +1,265 @@
+import time
+import threading
+
+import numpy as np
+
+from logger import log_error
+
+DEFAULT_CHUNK_PATHS = 256
+FIRST_CHUNK_PATHS = 16   # kleiner erster Block → erste Ergebnisse nach wenigen Millisekunden
+N_PREVIEW_PATHS = 20
+ADAPTIVE_MIN_PATHS = 200
+ADAPTIVE_MAX_PATHS = 5_000_000
+ADAPTIVE_BLOCK_BYTES = 128 * 1024**2  # Obergrenze für den Arbeitsspeicher eines Blocks
+ADAPTIVE_BUDGET_SHARE = 0.9  # Anteil der Restzeit, den der nächste Block nach Schätzung belegen darf
+
+
+class SimulationCancelled(Exception):
+    """Lauf wurde über das Abbruch-Event beendet (z.B. durch einen neuen Klick)."""
+
+
+def chunk_sizes(n_paths, chunk_paths=DEFAULT_CHUNK_PATHS, first_chunk=FIRST_CHUNK_PATHS):
+    """
+    Blockgrößen eines progressiven Laufs: klein beginnend, dann verdoppelt bis chunk_paths.
+    Die Aufteilung hängt nur von den Argumenten ab – bei gleichem Generator sind die
+    Ergebnisse daher reproduzierbar.
+    """
+    sizes = []
+    size = max(1, min(first_chunk, chunk_paths))
+    done = 0
+    while done < n_paths:
+        step = min(size, n_paths - done)
+        sizes.append(step)
+        done += step
+        size = min(size * 2, chunk_paths)
+    return sizes
+
+
+def partial_statistics(paths, done):
+    """Kennzahlen der ersten `done` Pfade (Endwerte = letzte Zeile)."""
+    end_values = paths[-1, :done]
+    std_error = float(np.std(end_values, ddof=1) / np.sqrt(done)) if done > 1 else float("nan")
+    return {
+        "mean": float(np.mean(end_values)),
+        "min": float(np.min(end_values)),
+        "max": float(np.max(end_values)),
+        "std_error": std_error,
+    }
+
+
+def iter_path_chunks(simulate_chunk, n_paths, rng, cancel=None, chunk_paths=DEFAULT_CHUNK_PATHS,
+                     first_chunk=FIRST_CHUNK_PATHS):
+    """
+    Simuliert Pfade blockweise und liefert nach jedem Block einen Zwischenstand.
+
+    Args:
+        simulate_chunk (callable): simulate_chunk(n, rng) → Pfade, shape = (Zeilen, n).
+        n_paths (int): Gesamtzahl der Pfade.
+        rng (np.random.Generator): Zufallsgenerator des Laufs (nicht global geteilt).
+        cancel (threading.Event, optional): gesetzt → SimulationCancelled vor dem nächsten Block.
+    Yields:
+        dict: paths (Zeilen × n_paths, gefüllt bis `done`), done, n_paths, finished,
+            stats (mean, min, max, std_error der Endwerte), mean_path
+    """
+    paths = None
+    done = 0
+    for size in chunk_sizes(n_paths, chunk_paths, first_chunk):
+        if cancel is not None and cancel.is_set():
+            raise SimulationCancelled(f"Simulazione interrotta dopo {done} di {n_paths} scenari.")
+        block = simulate_chunk(size, rng)
+        if paths is None:
+            paths = np.empty((block.shape[0], n_paths))
+        paths[:, done:done + size] = block
+        done += size
+        yield {
+            "paths": paths,
+            "done": done,
+            "n_paths": n_paths,
+            "finished": done == n_paths,
+            "stats": partial_statistics(paths, done),
+            "mean_path": np.mean(paths[:, :done], axis=1),
+        }
+
+
+def estimate_precision(end_values, alpha=0.05, z=1.96):
+    """
+    Erreichte Genauigkeit für Mittelwert und VaR (unteres alpha-Quantil) der Endwerte.
+
+    Der Standardfehler des Mittelwerts ist std/√n; das Konfidenzintervall des VaR
+    kommt verteilungsfrei aus den Ordnungsstatistiken (Binomialapproximation für den
+    Rang des Quantils). Relative Fehler = halbe Intervallbreite / Schätzwert.
+
+    Returns:
+        dict: n_paths, mean, mean_se, mean_rel_error, var, var_ci, var_rel_error
+    """
+    values = np.asarray(end_values, dtype=float)
+    n = values.size
+    mean = float(np.mean(values))
+    mean_se = float(np.std(values, ddof=1) / np.sqrt(n)) if n > 1 else float("inf")
+
+    spread = z * np.sqrt(n * alpha * (1 - alpha))
+    k = int(np.clip(np.ceil(n * alpha) - 1, 0, n - 1))
+    k_lo = int(np.clip(np.floor(n * alpha - spread) - 1, 0, n - 1))
+    k_hi = int(np.clip(np.ceil(n * alpha + spread) - 1, 0, n - 1))
+    var, var_lo, var_hi = np.partition(values, [k_lo, k, k_hi])[[k, k_lo, k_hi]]
+
+    return {
+        "n_paths": n,
+        "mean": mean,
+        "mean_se": mean_se,
+        "mean_rel_error": z * mean_se / abs(mean) if mean else float("inf"),
+        "var": float(var),
+        "var_ci": (float(var_lo), float(var_hi)),
+        "var_rel_error": float((var_hi - var_lo) / 2 / abs(var)) if var else float("inf"),
+    }
+
+
+def precision_reached(precision, target_se=None, target_rel_error=None):
+    """True, wenn alle gesetzten Ziele (Standardfehler in EUR, relativer Fehler) erreicht sind."""
+    if target_se is None and target_rel_error is None:
+        return False
+    if target_se is not None and precision["mean_se"] > target_se:
+        return False
+    if target_rel_error is not None and max(precision["mean_rel_error"], precision["var_rel_error"]) > target_rel_error:
+        return False
+    return True
+
+
+def iter_adaptive_chunks(simulate_chunk, rng, target_se=None, target_rel_error=None, alpha=0.05, time_budget=10.0,
+                         min_paths=ADAPTIVE_MIN_PATHS, max_paths=ADAPTIVE_MAX_PATHS, max_chunk_paths=None,
+                         cancel=None, path_bytes=None, overhead_bytes=0):
+    """
+    Simuliert in wachsenden Blöcken, bis die Zielgenauigkeit erreicht ist, das
+    Zeitbudget abläuft oder max_paths erreicht sind.
+
+    Gespeichert werden nur Werte je Pfad (z.B. Endwerte), die Pfadmatrix eines Blocks
+    wird danach verworfen – der Speicherbedarf hängt daher nicht von der Pfadanzahl ab.
+    Der erste Block hat min_paths Pfade, danach wird die Blockgröße verdoppelt (bis
+    max_chunk_paths, Standard: so viele Pfade, dass overhead_bytes + Pfade · path_bytes
+    in ADAPTIVE_BLOCK_BYTES passt, mindestens min_paths). Aus der Rechenzeit je
+    Pfad des letzten Blocks wird der nächste Block zusätzlich so begrenzt, dass er
+    voraussichtlich noch ins Zeitbudget passt; passt kein Pfad mehr, endet der Lauf.
+
+    Args:
+        simulate_chunk (callable): simulate_chunk(n, rng) → (Pfade (Zeilen × n), dict mit
+            1D-Werten je Pfad; "end_values" ist Pflicht und Grundlage der Genauigkeit).
+        target_se (float, optional): Ziel für den Standardfehler des Mittelwerts.
+        target_rel_error (float, optional): Ziel für den relativen Fehler (95%) von Mittelwert und VaR.
+        time_budget (float): Sekunden.
+        path_bytes (int, optional): Arbeitsspeicher je Pfad eines Blocks (Pfadmatrix und
+            alles, was mit der Pfadanzahl wächst). Ohne Angabe nur die Pfadmatrix
+            (8 Byte je Zeile) – dann eine Untergrenze, Temporärdaten der Simulation kommen hinzu.
+        overhead_bytes (int): von der Blockgröße unabhängiger Arbeitsspeicher (z.B.
+            Temporärdaten der Teilblöcke in iter_path_chunks).
+    Yields:
+        dict: done, values (zusammengeführte 1D-Werte), mean_path, sample_paths (erster Block),
+            precision (siehe estimate_precision), target_met, elapsed, finished
+    """
+    started = time.perf_counter()
+    collected = {}
+    mean_path_sum = None
+    sample_paths = None
+    done = 0
+    size = min_paths
+
+    while True:
+        if cancel is not None and cancel.is_set():
+            raise SimulationCancelled(f"Simulazione interrotta dopo {done} scenari.")
+        size = min(size, max_paths - done)
+        block_started = time.perf_counter()
+        paths, values = simulate_chunk(size, rng)
+
+        if mean_path_sum is None:
+            mean_path_sum = np.zeros(paths.shape[0])
+            sample_paths = paths[:, :N_PREVIEW_PATHS].copy()
+            if max_chunk_paths is None:
+                per_path = path_bytes or 8 * paths.shape[0]
+                max_chunk_paths = max(min_paths, (ADAPTIVE_BLOCK_BYTES - overhead_bytes) // per_path)
+        mean_path_sum += paths.sum(axis=1)
+        for name, value in values.items():
+            collected.setdefault(name, []).append(np.asarray(value))
+        done += size
+        del paths
+
+        merged = {name: np.concatenate(parts) for name, parts in collected.items()}
+        collected = {name: [value] for name, value in merged.items()}
+        precision = estimate_precision(merged["end_values"], alpha=alpha)
+        target_met = precision_reached(precision, target_se, target_rel_error)
+        now = time.perf_counter()
+        elapsed = now - started
+        seconds_per_path = (now - block_started) / size
+        fits = int((time_budget - elapsed) * ADAPTIVE_BUDGET_SHARE / seconds_per_path) if seconds_per_path > 0 \
+            else max_paths
+        finished = target_met or elapsed >= time_budget or done >= max_paths or fits < 1
+
+        yield {
+            "done": done,
+            "values": merged,
+            "mean_path": mean_path_sum / done,
+            "sample_paths": sample_paths,
+            "precision": precision,
+            "target_met": target_met,
+            "elapsed": elapsed,
+            "finished": finished,
+        }
+        if finished:
+            return
+        size = min(size * 2, max_chunk_paths, fits)
+
+
+class ProgressiveRun:
+    """
+    Führt einen progressiven Lauf in einem Hintergrund-Thread aus.
+
+    Der Worker aktualisiert nur `latest`; die Oberfläche fragt den Stand aus ihrem
+    eigenen Thread ab (Tk: root.after, Streamlit: Platzhalter) und greift nie vom
+    Worker aus auf Widgets zu. `cancel()` beendet den Lauf vor dem nächsten Block.
+
+    Args:
+        make_snapshots (callable): make_snapshots(cancel_event) → Iterable der
+            Zwischenstände (z.B. Generator über iter_path_chunks); wird im Worker ausgeführt,
+            blockierende Schritte wie Downloads gehören daher hinein.
+    """
+
+    def __init__(self, make_snapshots):
+        self._make_snapshots = make_snapshots
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._latest = None
+        self.error = None
+        self.finished = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for snapshot in self._make_snapshots(self._cancel):
+                with self._lock:
+                    self._latest = snapshot
+                if self._cancel.is_set():
+                    break
+        except SimulationCancelled:
+            pass
+        except Exception as e:
+            log_error(f"Progressive Simulation fehlgeschlagen: {e}")
+            self.error = e
+        finally:
+            self.finished = True
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def latest(self):
+        """Letzter Zwischenstand (oder None, solange noch kein Block fertig ist)."""
+        with self._lock:
+            return self._latest
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
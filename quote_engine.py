@@ -0,0 +1,729 @@
+import os
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from fund_forecast import GBM_WORKING_ARRAYS, simulate_multiple_paths
+from fund_screening import eligible_funds
+from simulation import simulate_rolling_bond_process
+from premiums import premium_schedule, units_from_premiums, premiums_paid
+from progressive import DEFAULT_CHUNK_PATHS, iter_path_chunks, iter_adaptive_chunks
+from decrements import EXIT_LAPSE, LAPSE_CURVES, qx_from_table, sample_exits, exit_shares
+from utils import (
+    days_between_ages, get_guarantee_cost, get_fonds, apply_annual_costs, apply_moneyness_costs,
+    anniversary_cost_factors, guarantee_floors, lock_in_floor_path, mc_guarantee_cost, weighted_mean_ci,
+    weighted_tail_statistics, get_guarantee_cost_surface, mc_guarantee_greeks
+)
+
+# Simulationsparameter der MiFID-Strecke (app2.py)
+DEFAULT_SEED = 42
+BAND_PERCENTILES = np.array([5, 25, 50, 75, 95])
+N_SAMPLE_PATHS = 20
+BOND_THETA = 0.2
+BOND_ROLL_YEARS = 10
+BOND_GRID_STEP = 21  # Marktwertpfade der Anleihen monatlich
+IS_SHIFTED_FRACTION = 0.5  # Importance Sampling: Anteil verschobener Pfade (Rest unverschoben)
+GUARANTEE_FEE_CAP_PCT = 5.0  # Obergrenze der Garantiegebühr nach Moneyness (% p.a.)
+RISK_FREE_RATE = 0.01  # Zins der Garantiebewertung (wie get_guarantee_cost)
+
+# Eingaben, die das Simulationsergebnis bestimmen (Schlüssel im ResultStore)
+QUOTE_INPUT_KEYS = (
+    "age", "death_age", "contribution", "mifid_class", "costs_percent", "n_paths",
+    "lock_in_pct", "premium_mode", "annual_premium", "premium_indexation_pct", "guarantee_fee_mode",
+    "exit_model",
+)
+
+
+def load_market_parameters(mifid_class, source=None):
+    """
+    (mu, sigma, S0) des ersten Fonds der MiFID-Klasse, der das Screening besteht
+    (fund_screening: Kurse und MiFID-Grenzen für das ganze Universum, zwischengespeichert).
+
+    Returns:
+        dict: ticker, mu, sigma, s0
+    """
+    if not get_fonds(mifid_class):
+        raise ValueError("Nessun fondo disponibile per la classe di rischio selezionata.")
+    funds = eligible_funds(mifid_class, source=source)
+    if not funds:
+        raise ValueError("Nessun fondo della classe di rischio selezionata supera lo screening MiFID.")
+
+    fund = funds[0]
+    return {"ticker": fund["ticker"], "mu": fund["mu"], "sigma": fund["sigma"], "s0": fund["s0"]}
+
+
+def mifid_level(inputs):
+    """MiFID-Klasse als Zahl (z.B. '3 - Bilanciato' → 3)."""
+    return int(str(inputs["mifid_class"]).split(" ")[0])
+
+
+def scenario_days(inputs):
+    """Laufzeit des Vertrags in Börsentagen."""
+    return int(days_between_ages(int(inputs["age"]), int(inputs["death_age"])))
+
+
+def summarize_end_values(end_values):
+    """Kennzahlen der Endwerte wie im MiFID-Report (Mittel, Min/Max, VaR/CVaR 95%)."""
+    var_5 = np.percentile(end_values, 5)
+    return {
+        "mean": float(np.mean(end_values)),
+        "min": float(np.min(end_values)),
+        "max": float(np.max(end_values)),
+        "var_5": float(var_5),
+        "cvar_5": float(np.mean(end_values[end_values <= var_5])),
+    }
+
+
+def shortfall_importance_shift(market, mifid_level, days, target_growth):
+    """
+    Verschiebung der Brownschen Bewegung (pro Jahr) für Importance Sampling, so dass
+    der typische Anteilswert zum Laufzeitende bei `target_growth` (z.B. der Wertfaktor,
+    ab dem die Garantie greift) statt beim erwarteten Wert liegt.
+
+    Fonds (GBM): Median von S_T/S_0 = target_growth. Anleihen (OU): langfristiges
+    Zinsniveau = Rendite, die target_growth über die Laufzeit ergibt. Verschoben wird
+    nur nach unten (in Richtung Unterdeckung), sonst 0.0.
+    """
+    mu, sigma = market["mu"], market["sigma"]
+    T = days / 252
+    if mifid_level <= 2:
+        target_yield = target_growth ** (1 / T) - 1
+        shift = BOND_THETA * (target_yield - mu) / sigma
+    else:
+        shift = (np.log(target_growth) / T - (mu - 0.5 * sigma**2)) / sigma
+    return float(min(shift, 0.0))
+
+
+def simulate_scenarios(market, mifid_level, days, n_paths, seed=DEFAULT_SEED, rng=None, on_chunk=None,
+                       cancel=None, importance_shift=None, importance_fraction=1.0):
+    """
+    Simuliert die Anteilspreise (Fonds: GBM, Klassen 1–2: rollierende Anleihe).
+
+    Das Ergebnis hängt nur von Fondsparametern, Zeitraster, Pfadanzahl und Seed ab
+    und kann daher von mehreren Verträgen gemeinsam genutzt werden. Die Pfade werden
+    blockweise mit einem eigenen Generator (`rng`, sonst default_rng(seed)) gezogen,
+    der globale NumPy-Zustand bleibt unberührt – parallele Läufe sind threadsicher.
+
+    Args:
+        on_chunk (callable, optional): erhält nach jedem Block den Zwischenstand
+            (siehe progressive.iter_path_chunks, zusätzlich unit_s0) für eine vorläufige Anzeige.
+        cancel (threading.Event, optional): Abbruch vor dem nächsten Block (SimulationCancelled).
+        importance_shift (float, optional): Drift der Brownschen Bewegung unter der
+            Stichprobenverteilung (siehe shortfall_importance_shift); die Likelihood-Quotienten
+            stehen dann unter "weights".
+    Returns:
+        dict: time_index, unit_prices (Zeilen × n_paths), unit_s0, asset_label, use_bond_simulation,
+            weights (None ohne Importance Sampling)
+    """
+    use_bond_simulation = mifid_level <= 2
+    mu, sigma, s0 = market["mu"], market["sigma"], market["s0"]
+    rng = rng if rng is not None else np.random.default_rng(seed)
+    weight_chunks = []
+
+    if use_bond_simulation:
+        time_index = None
+
+        def simulate_chunk(n, rng):
+            nonlocal time_index
+            time_index, values, *weights = simulate_rolling_bond_process(
+                y0=mu,  # Simuliere Startzins als mu
+                mu=mu,
+                theta=BOND_THETA,
+                sigma=sigma,
+                total_days=days,
+                n_paths=n,
+                roll_years=BOND_ROLL_YEARS,
+                grid_step=BOND_GRID_STEP,
+                rng=rng,
+                dw_shift=importance_shift,
+                shifted_fraction=importance_fraction
+            )
+            weight_chunks.extend(weights)
+            return values
+
+        unit_s0 = 1.0
+        asset_label = "Obbligazione (roll.)"
+    else:
+        def simulate_chunk(n, rng):
+            if importance_shift is None:
+                return simulate_multiple_paths(s0, mu, sigma, days, n, rng=rng)
+            values, weights = simulate_multiple_paths(s0, mu, sigma, days, n, rng=rng,
+                                                      is_drift=mu + importance_shift * sigma,
+                                                      is_fraction=importance_fraction)
+            weight_chunks.append(weights)
+            return values
+
+        unit_s0 = s0
+        time_index = np.arange(days)
+        asset_label = "Fondo"
+
+    for snapshot in iter_path_chunks(simulate_chunk, n_paths, rng, cancel=cancel):
+        if on_chunk is not None:
+            on_chunk({**snapshot, "unit_s0": unit_s0})
+
+    return {
+        "time_index": time_index,
+        "unit_prices": snapshot["paths"],
+        "unit_s0": unit_s0,
+        "asset_label": asset_label,
+        "use_bond_simulation": use_bond_simulation,
+        "weights": np.concatenate(weight_chunks) if weight_chunks else None,
+    }
+
+
+def risk_neutral_factors(time_index, market, r=RISK_FREE_RATE):
+    """
+    Faktor je Zeile, der die Szenarien auf Drift r statt mu umstellt (gleiche Zufallszahlen).
+
+    Für GBM ist S_t · exp(-(mu - r) · t) exakt der Pfad mit Drift r. Bei der
+    rollierenden Anleihe ist mu die langfristige Rendite; derselbe Faktor nimmt
+    den Ertrag über r heraus.
+    """
+    return np.exp(-(market["mu"] - r) * (np.asarray(time_index) + 1) / 252)
+
+
+def _pricing_rows(time_index, premium_rows=None):
+    """Zeilen für die Garantiebewertung: Jahrestage, letzte Zeile und ggf. Beitragszeilen."""
+    time_index = np.asarray(time_index)
+    needed = (time_index > 0) & (time_index % 252 == 0)
+    needed[-1] = True
+    if premium_rows is not None:
+        needed |= np.isin(time_index, premium_rows)
+    return np.flatnonzero(needed)
+
+
+def _premium_fee_base(prices, premium_rows, premium_amounts, costs_percent, guarantee_cost_pct,
+                      initial_costs_pct, time_index, weights=None, r=RISK_FREE_RATE):
+    """
+    Barwert der Gebührenbasis bei laufenden Beiträgen: Σ_k e^{-r t_k} · E[V_k] mit V_k =
+    Vertragswert am Jahrestag k vor Abzug der Kosten (ohne den an diesem Tag gezahlten
+    Beitrag), bei einer Garantiegebühr von guarantee_cost_pct.
+    """
+    total_cost = costs_percent + guarantee_cost_pct
+    values = units_from_premiums(prices, premium_rows, premium_amounts, total_cost, initial_costs_pct, time_index)
+    anniversaries = (time_index > 0) & (time_index % 252 == 0)
+    anniversary_rows = time_index[anniversaries]
+    new_premium = np.zeros(len(anniversary_rows))
+    paid = np.isin(premium_rows, anniversary_rows)
+    new_premium[np.searchsorted(anniversary_rows, premium_rows[paid])] = \
+        np.asarray(premium_amounts)[paid] * (1 - initial_costs_pct / 100)
+    expected = np.average(values[anniversaries], axis=1, weights=weights)
+    before_costs = (expected - new_premium) / (1 - total_cost / 100)
+    return float(np.sum(np.exp(-r * (anniversary_rows + 1) / 252) * before_costs))
+
+
+def apply_contract_fees(scenarios, inputs, guarantee_level, market, initial_costs_pct=0.0, in_place=False,
+                        guarantee_cost_pct=None):
+    """
+    Vertragswerte nach Beiträgen und jährlichen Kosten (inkl. Garantiegebühr).
+
+    Args:
+        scenarios (dict): Ergebnis von simulate_scenarios (passend zu Laufzeit und Pfadanzahl).
+        inputs (dict): Vertragsdaten wie bei simulate_quote.
+        in_place (bool): Szenariopreise bei Einmalbeitrag direkt überschreiben
+            (nur wenn die Szenarien nicht weiterverwendet werden).
+        guarantee_cost_pct (float, optional): Garantiegebühr vorgeben statt sie bei
+            Lock-in bzw. laufenden Beiträgen aus diesen Szenarien zu schätzen. Geschätzt
+            wird risikoneutral wie bei der statischen Garantie (Black-Scholes): auf
+            denselben Zufallszahlen mit Drift r (risk_neutral_factors), nur auf den
+            Jahrestagen, der letzten Zeile und den Beitragszeilen.
+
+    Mit inputs["guarantee_fee_mode"] == "moneyness" (nur Einmalbeitrag) wird die
+    Garantiegebühr je Pfad und Jahrestag aus dem aktuellen Fondswert gegenüber der
+    Garantie bestimmt (apply_moneyness_costs); guarantee_cost_pct ist dann die im
+    Mittel erhobene Gebühr.
+    Returns:
+        dict: paths_value, guarantee_base, guaranteed_amount, guarantee_cost_pct, total_annual_cost,
+            premiums, net_contribution, fee_mode, fee_base (Barwert der Gebührenbasis bei laufenden
+            Beiträgen, sonst None; siehe mc_guarantee_cost)
+    """
+    age = int(inputs["age"])
+    death_age = int(inputs["death_age"])
+    contribution = inputs["contribution"]
+    costs_percent = inputs["costs_percent"]
+    lock_in_pct = float(inputs.get("lock_in_pct", 0.0))
+    premium_mode = inputs.get("premium_mode", "single")
+    fee_mode = inputs.get("guarantee_fee_mode", "flat")
+
+    days = int(days_between_ages(age, death_age))
+    T = int(death_age - age)
+    sigma = market["sigma"]
+    time_index = scenarios["time_index"]
+    unit_prices = scenarios["unit_prices"]
+    unit_s0 = scenarios["unit_s0"]
+
+    net_contribution = contribution * (1 - initial_costs_pct / 100)
+    fee_base = None
+
+    if premium_mode == "single":
+        guarantee_base = contribution
+        if in_place:
+            paths_value = unit_prices
+            paths_value *= net_contribution / unit_s0
+        else:
+            paths_value = unit_prices * (net_contribution / unit_s0)
+    else:
+        premium_rows, premium_amounts = premium_schedule(
+            inputs["annual_premium"], days, premium_mode, inputs.get("premium_indexation_pct", 0.0)
+        )
+        guarantee_base = premiums_paid(premium_rows, premium_amounts)
+
+    if premium_mode == "single" and fee_mode == "moneyness":
+        fees_charged = apply_moneyness_costs(paths_value, costs_percent, guarantee_base * guarantee_level, T, sigma,
+                                             time_index=time_index, lock_in_pct=lock_in_pct,
+                                             cap_pct=GUARANTEE_FEE_CAP_PCT)
+        guarantee_cost_pct = float(np.average(fees_charged.mean(axis=0), weights=scenarios.get("weights"))) \
+            if fees_charged.size else 0.0
+        total_annual_cost = costs_percent + guarantee_cost_pct
+    elif premium_mode == "single" and lock_in_pct <= 0:
+        guarantee_cost_pct = get_guarantee_cost(contribution, guarantee_level, T, sigma)
+        total_annual_cost = costs_percent + guarantee_cost_pct
+        apply_annual_costs(paths_value, total_annual_cost, days, time_index=time_index)
+    else:
+        # Lock-in bzw. Beitragsgarantie: Garantiekosten aus denselben Szenarien (nach Verwaltungskosten)
+        time_index = np.asarray(time_index)
+        if premium_mode == "single":
+            apply_annual_costs(paths_value, costs_percent, days, time_index=time_index)
+        if guarantee_cost_pct is None:
+            if premium_mode == "single":
+                rows = _pricing_rows(time_index)
+                pricing_values = paths_value[rows] * risk_neutral_factors(time_index[rows], market)[:, None]
+            else:
+                rows = _pricing_rows(time_index, premium_rows)
+                pricing_prices = unit_prices[rows] * risk_neutral_factors(time_index[rows], market)[:, None]
+                pricing_values = units_from_premiums(pricing_prices, premium_rows, premium_amounts, costs_percent,
+                                                     initial_costs_pct, time_index[rows])
+            floors = guarantee_floors(pricing_values, guarantee_base, guarantee_level, lock_in_pct, time_index[rows])
+            guarantee_cost_pct = mc_guarantee_cost(pricing_values[-1], floors, guarantee_base, T, r=RISK_FREE_RATE,
+                                                   weights=scenarios.get("weights"))
+            if premium_mode != "single":
+                # Gebühr wird auf den Vertragswert erhoben, der bei laufenden Beiträgen anfangs weit
+                # unter der Beitragssumme liegt: Satz so, dass ihr Barwert dem Preis entspricht
+                for _ in range(20):
+                    fee_base = _premium_fee_base(pricing_prices, premium_rows, premium_amounts, costs_percent,
+                                                 guarantee_cost_pct, initial_costs_pct, time_index[rows],
+                                                 scenarios.get("weights"))
+                    updated = mc_guarantee_cost(pricing_values[-1], floors, guarantee_base, T, r=RISK_FREE_RATE,
+                                                weights=scenarios.get("weights"), fee_base=fee_base)
+                    converged = abs(updated - guarantee_cost_pct) < 1e-8
+                    guarantee_cost_pct = updated
+                    if converged:
+                        break
+        total_annual_cost = costs_percent + guarantee_cost_pct
+        if premium_mode == "single":
+            apply_annual_costs(paths_value, guarantee_cost_pct, days, time_index=time_index)
+        else:
+            paths_value = units_from_premiums(unit_prices, premium_rows, premium_amounts, total_annual_cost,
+                                              initial_costs_pct, time_index)
+
+    return {
+        "paths_value": paths_value,
+        "guarantee_base": guarantee_base,
+        "guaranteed_amount": guarantee_base * guarantee_level,
+        "guarantee_cost_pct": guarantee_cost_pct,
+        "total_annual_cost": total_annual_cost,
+        "premiums": (premium_rows, premium_amounts) if premium_mode != "single" else None,
+        "net_contribution": net_contribution,
+        "fee_mode": fee_mode,
+        "fee_base": fee_base,
+    }
+
+
+@lru_cache(maxsize=2)
+def _load_default_qx(source, mtime_ns):
+    from mortality_store import load_mortality_table
+    return qx_from_table(load_mortality_table())
+
+
+def _default_qx():
+    """qx der Standardtafel (zwischengespeichert, nach Neuaufbau des Speichers bzw. Änderung der CSV neu geladen)."""
+    from mortality_store import MORTALITY_STORE_DIR
+    source = os.path.join(MORTALITY_STORE_DIR, "index.json")
+    if not os.path.exists(source):
+        source = "Tavole_di_mortalita.csv"
+    mtime_ns = os.stat(source).st_mtime_ns if os.path.exists(source) else None
+    return _load_default_qx(os.path.abspath(source), mtime_ns)
+
+
+def mortality_fingerprint(exit_model=None):
+    """
+    Kurzer Hash der Sterbetafel, die sample_contract_exits für `exit_model` nutzt
+    (None ohne Ausscheiden) – für Cache-Schlüssel gespeicherter Ergebnisse.
+    """
+    if (exit_model or "none") == "none":
+        return None
+    return hashlib.sha256(np.ascontiguousarray(_default_qx()).tobytes()).hexdigest()[:16]
+
+
+def sample_contract_exits(inputs, n_paths, seed=DEFAULT_SEED, rng=None, qx=None):
+    """
+    Ausscheiden je Pfad nach inputs["exit_model"]: None/"none" (Leistung zum Zielalter),
+    "mortality" (nur Tod) oder ein Stornoprofil aus LAPSE_CURVES (Tod und Storno).
+
+    Ohne rng wird ein eigener Zufallsstrom aus `seed` abgeleitet, die Szenarien
+    bleiben dadurch unverändert.
+
+    Returns:
+        dict | None: Ergebnis von decrements.sample_exits
+    """
+    exit_model = inputs.get("exit_model") or "none"
+    if exit_model == "none":
+        return None
+    lapse_curve = "none" if exit_model == "mortality" else exit_model
+    if lapse_curve not in LAPSE_CURVES:
+        raise ValueError(f"Modello di uscita sconosciuto: {exit_model}")
+    if rng is None:
+        rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(1)[0])
+    term = int(inputs["death_age"]) - int(inputs["age"])
+    return sample_exits(int(inputs["age"]), term, qx if qx is not None else _default_qx(),
+                        lapse_curve=lapse_curve, rng=rng, n=n_paths)
+
+
+def apply_contract_guarantee(fees, scenarios, guarantee_level, lock_in_pct=0.0, exits=None):
+    """
+    Garantie je Pfad (statisch oder Lock-in) und Endwerte nach Garantie.
+
+    Mit `exits` (sample_contract_exits) wird die Leistung je Pfad zum Ausscheiden
+    bewertet: Fondswert am Ausscheidetag, bei Tod und Ablauf mindestens die bis
+    dahin erreichte Garantie (auf die bis dahin gezahlten Beiträge), bei Storno
+    nur der Fondswert.
+
+    Returns:
+        dict: floors, final_fund_values, end_values (mit exits zusätzlich exit_days, exit_cause)
+    """
+    paths_value = fees["paths_value"]
+    time_index = scenarios["time_index"]
+    if exits is None:
+        if lock_in_pct > 0:
+            floors = guarantee_floors(paths_value, fees["guarantee_base"], guarantee_level, lock_in_pct, time_index)
+        else:
+            floors = np.full(paths_value.shape[1], fees["guaranteed_amount"])
+
+        final_fund_values = paths_value[-1, :].copy()
+        return {
+            "floors": floors,
+            "final_fund_values": final_fund_values,
+            "end_values": np.maximum(final_fund_values, floors),
+        }
+
+    exit_rows = np.asarray(exits["exit_days"]) - 1  # Tageszeile des Ausscheidens
+    rows = np.clip(np.searchsorted(time_index, exit_rows, side="right") - 1, 0, len(time_index) - 1)
+    cols = np.arange(paths_value.shape[1])
+    final_fund_values = paths_value[rows, cols]
+
+    if fees["premiums"] is not None:
+        floors = guarantee_level * premiums_paid(*fees["premiums"], up_to_row=exit_rows)
+    else:
+        floors = np.full(paths_value.shape[1], fees["guaranteed_amount"])
+    if lock_in_pct > 0:
+        # nur der Lock-in-Anteil; der Sockel sind die bis zum Ausscheiden gezahlten Beiträge
+        anniversary_rows, floor_path = lock_in_floor_path(paths_value, 0.0, guarantee_level, lock_in_pct, time_index)
+        passed = np.searchsorted(np.asarray(time_index)[anniversary_rows], exit_rows, side="right")
+        locked = floor_path[np.maximum(passed - 1, 0), cols] if floor_path.shape[0] else floors
+        floors = np.where(passed > 0, np.maximum(floors, locked), floors)
+
+    cause = np.asarray(exits["cause"])
+    return {
+        "floors": floors,
+        "final_fund_values": final_fund_values,
+        "end_values": np.where(cause == EXIT_LAPSE, final_fund_values, np.maximum(final_fund_values, floors)),
+        "exit_days": np.asarray(exits["exit_days"]),
+        "exit_cause": cause,
+    }
+
+
+def guarantee_sensitivities(scenarios, fees, market, guarantee_level, lock_in_pct=0.0):
+    """
+    Sensitivitäten der Garantie für Risikobericht und Anzeige.
+
+    Analytisch (get_guarantee_cost_surface, Black-Scholes wie get_guarantee_cost) für
+    jeden Vertrag; zusätzlich pathwise aus dem Lauf (mc_guarantee_greeks, reale Drift),
+    wenn der Garantiewert nur vom Endwert eines GBM-Fonds abhängt: Einmalbeitrag,
+    statische Garantie, pauschale Garantiegebühr.
+
+    Returns:
+        dict: cost_pct, cost_vega, cost_rho (%-Punkte p.a. je 1.00), price, delta,
+            vega, rho, theta (EUR); mc (dict aus mc_guarantee_greeks oder None)
+    """
+    T = (int(np.asarray(scenarios["time_index"])[-1]) + 1) / 252
+    surface = get_guarantee_cost_surface(fees["guarantee_base"], [guarantee_level], [T], market["sigma"])
+    result = {name: float(surface[name][0, 0])
+              for name in ("cost_pct", "cost_vega", "cost_rho", "price", "delta", "vega", "rho", "theta")}
+
+    result["mc"] = None
+    if (not scenarios["use_bond_simulation"] and fees["premiums"] is None and lock_in_pct <= 0
+            and fees["fee_mode"] != "moneyness"):
+        # Endwert nach Kosten = Anteilspreis × deterministischer Faktor → effektiver Startwert
+        s0 = fees["net_contribution"] * anniversary_cost_factors(scenarios["time_index"][-1],
+                                                                 fees["total_annual_cost"])
+        result["mc"] = mc_guarantee_greeks(fees["paths_value"][-1], s0, fees["guaranteed_amount"], T,
+                                           market["sigma"], mu=market["mu"])
+    return result
+
+
+def contract_statistics(scenarios, fees, guarantee, market, guarantee_level, lock_in_pct=0.0):
+    """Fasst Endwerte, Perzentilbänder, Beispielpfade und Kennzahlen zum Ergebnis-dict zusammen."""
+    paths_value = fees["paths_value"]
+    floors = guarantee["floors"]
+    final_fund_values = guarantee["final_fund_values"]
+    end_values = guarantee["end_values"]
+
+    return {
+        "final_fund_values": final_fund_values,
+        "end_values": end_values,
+        "time_index": scenarios["time_index"],
+        "band_percentiles": BAND_PERCENTILES,
+        "bands": np.percentile(paths_value, BAND_PERCENTILES, axis=1),
+        "mean_path": np.mean(paths_value, axis=1),
+        "sample_paths": paths_value[:, :N_SAMPLE_PATHS].copy(),
+        "ticker": market["ticker"],
+        "mu": market["mu"],
+        "sigma": market["sigma"],
+        "use_bond_simulation": scenarios["use_bond_simulation"],
+        "asset_label": scenarios["asset_label"],
+        "guarantee_level": guarantee_level,
+        "guaranteed_amount": fees["guaranteed_amount"],
+        "total_premiums": float(fees["guarantee_base"]),
+        "lock_in_pct": lock_in_pct,
+        "floors": floors,
+        "mean_floor": float(np.mean(floors)),
+        "guarantee_cost_pct": float(fees["guarantee_cost_pct"]),
+        "total_annual_cost": float(fees["total_annual_cost"]),
+        "guarantee_sensitivities": guarantee_sensitivities(scenarios, fees, market, guarantee_level, lock_in_pct),
+        "mean_fund": float(np.mean(final_fund_values)),
+        "stats": summarize_end_values(end_values),
+        **exit_statistics(guarantee),
+    }
+
+
+def exit_statistics(guarantee):
+    """Ausscheidezeitpunkte, -ursachen und ihre Anteile (leer ohne Ausscheidemodell)."""
+    if "exit_cause" not in guarantee:
+        return {}
+    return {
+        "exit_days": guarantee["exit_days"],
+        "exit_cause": guarantee["exit_cause"],
+        "exit_shares": exit_shares(guarantee["exit_cause"]),
+        "mean_exit_years": float(np.mean(guarantee["exit_days"]) / 252),
+    }
+
+
+def value_contract(scenarios, inputs, guarantee_level, market, initial_costs_pct=0.0, in_place=False,
+                   exits=None):
+    """
+    Bewertet einen Vertrag auf gegebenen Szenarien: Beiträge, Kosten, Garantie, Kennzahlen.
+
+    Returns:
+        dict: Endwerte, Perzentilbänder, Beispielpfade und Kennzahlen.
+    """
+    lock_in_pct = float(inputs.get("lock_in_pct", 0.0))
+    fees = apply_contract_fees(scenarios, inputs, guarantee_level, market,
+                               initial_costs_pct=initial_costs_pct, in_place=in_place)
+    guarantee = apply_contract_guarantee(fees, scenarios, guarantee_level, lock_in_pct, exits=exits)
+    return contract_statistics(scenarios, fees, guarantee, market, guarantee_level, lock_in_pct)
+
+
+def simulate_quote(inputs, guarantee_level, market, seed=DEFAULT_SEED, initial_costs_pct=0.0):
+    """
+    Führt die Simulation der MiFID-Strecke für einen Garantielevel aus.
+
+    Args:
+        inputs (dict): Eingaben wie von get_user_inputs_mifid (age, death_age, contribution,
+            mifid_class, costs_percent, n_paths; optional lock_in_pct sowie premium_mode,
+            annual_premium, premium_indexation_pct für laufende Beiträge, exit_model für
+            Ausscheiden durch Tod bzw. Storno vor dem Zielalter).
+        guarantee_level (float): Garantielevel (z.B. 0.9).
+        market (dict): Ergebnis von load_market_parameters.
+        seed (int): Seed für Reproduzierbarkeit.
+    Returns:
+        dict: Endwerte, Perzentilbänder, Beispielpfade und Kennzahlen.
+    """
+    scenarios = simulate_scenarios(market, mifid_level(inputs), scenario_days(inputs),
+                                   int(inputs["n_paths"]), seed=seed)
+    exits = sample_contract_exits(inputs, int(inputs["n_paths"]), seed=seed)
+    return value_contract(scenarios, inputs, guarantee_level, market,
+                          initial_costs_pct=initial_costs_pct, in_place=True, exits=exits)
+
+
+def guarantee_tail_metrics(inputs, guarantee_level, market, seed=DEFAULT_SEED, initial_costs_pct=0.0,
+                           importance=True, alpha=0.05):
+    """
+    Seltene-Ereignis-Kennzahlen der Garantie mit Konfidenzintervallen (95%).
+
+    Mit `importance` wird die Hälfte der Szenarien mit einer nach unten verschobenen
+    Drift gezogen (Garantiefall wird häufig), die andere Hälfte unverändert; über die
+    Likelihood-Quotienten der Mischung wird auf die reale Verteilung zurückgewichtet. So sind Eintrittswahrscheinlichkeit, Garantiekosten
+    und VaR/CVaR auch für 80%/90%-Garantien mit wenigen hundert Pfaden stabil, wo
+    gewöhnliches Monte Carlo fast nie eine Unterdeckung sieht. Ausscheiden durch Tod
+    bzw. Storno (inputs["exit_model"]) wird wie in simulate_quote berücksichtigt.
+
+    Returns:
+        dict: shortfall_prob(_ci), expected_shortfall(_ci) (EUR, diskontiert),
+            guarantee_cost_pct(_ci), var(_ci), cvar(_ci) der Fondswerte vor Garantie
+            (unteres alpha-Quantil), ess, importance_shift
+    """
+    days = scenario_days(inputs)
+    T = days / 252
+    level = mifid_level(inputs)
+    lock_in_pct = float(inputs.get("lock_in_pct", 0.0))
+
+    shift = None
+    if importance:
+        years = (days - 1) // 252
+        cost_factor = (1 - inputs["costs_percent"] / 100) ** years
+        target_growth = guarantee_level / ((1 - initial_costs_pct / 100) * cost_factor)
+        shift = shortfall_importance_shift(market, level, days, target_growth)
+
+    scenarios = simulate_scenarios(market, level, days, int(inputs["n_paths"]), seed=seed,
+                                   importance_shift=shift, importance_fraction=IS_SHIFTED_FRACTION)
+    fees = apply_contract_fees(scenarios, inputs, guarantee_level, market,
+                               initial_costs_pct=initial_costs_pct, in_place=True)
+    exits = sample_contract_exits(inputs, int(inputs["n_paths"]), seed=seed)
+    guarantee = apply_contract_guarantee(fees, scenarios, guarantee_level, lock_in_pct, exits=exits)
+
+    weights = scenarios["weights"]
+    final_values = guarantee["final_fund_values"]
+    # Garantieleistung je Pfad (bei Storno keine), diskontiert ab Ausscheiden bzw. Ablauf wie mc_guarantee_cost
+    exit_years = T if exits is None else np.asarray(exits["exit_days"]) / 252
+    discount = np.exp(-RISK_FREE_RATE * exit_years)
+    shortfall = guarantee["end_values"] - final_values
+
+    prob, prob_ci = weighted_mean_ci(shortfall > 0, weights)
+    expected, expected_ci = weighted_mean_ci(discount * shortfall, weights)
+    prob_ci = (max(prob_ci[0], 0.0), prob_ci[1])
+    expected_ci = (max(expected_ci[0], 0.0), expected_ci[1])
+    # gleiche Umrechnung in % p.a. wie mc_guarantee_cost (bei laufenden Beiträgen über die Gebührenbasis)
+    fee_base = fees["fee_base"]
+    to_cost_pct = 100 / fee_base if fee_base is not None and fee_base > 0 else 100 / (fees["guarantee_base"] * T)
+    tail = weighted_tail_statistics(final_values, weights, alpha=alpha, seed=seed)
+
+    return {
+        "shortfall_prob": prob,
+        "shortfall_prob_ci": prob_ci,
+        "expected_shortfall": expected,
+        "expected_shortfall_ci": expected_ci,
+        "guarantee_cost_pct": expected * to_cost_pct,
+        "guarantee_cost_pct_ci": (expected_ci[0] * to_cost_pct, expected_ci[1] * to_cost_pct),
+        "alpha": alpha,
+        "importance_shift": shift if shift is not None else 0.0,
+        **tail,
+    }
+
+
+def adaptive_block_bytes(level, days):
+    """
+    Arbeitsspeicher eines adaptiven Blocks (Schätzung, Bytes): je Pfad und unabhängig
+    von der Blockgröße.
+
+    Je Pfad bleibt die Preismatrix (GBM: Tageszeilen, Anleihe: Monatsraster), die
+    Kosten werden darauf angewendet. Dazu kommen die Temporärdaten eines Teilblocks
+    von DEFAULT_CHUNK_PATHS Pfaden in iter_path_chunks: bei GBM Normalzahlen,
+    Schocks, Log-Renditen, kumulierte Summe und Kurse über alle Tage, bei der
+    Anleihe Zinsinkremente und Zinspfade eines Rollsegments.
+
+    Returns:
+        tuple: (path_bytes, overhead_bytes) für progressive.iter_adaptive_chunks
+    """
+    if level <= 2:
+        rows = days // BOND_GRID_STEP + 1
+        return 8 * rows, 8 * DEFAULT_CHUNK_PATHS * (rows + 4 * BOND_ROLL_YEARS * 252)
+    return 8 * days, 8 * DEFAULT_CHUNK_PATHS * GBM_WORKING_ARRAYS * days
+
+
+def adaptive_quote(inputs, guarantee_level, market, target_se=None, target_rel_error=None, time_budget=20.0,
+                   seed=DEFAULT_SEED, initial_costs_pct=0.0, on_chunk=None, cancel=None):
+    """
+    Angebotsrechnung mit genauigkeitsgesteuerter Pfadanzahl.
+
+    Es wird in wachsenden Blöcken simuliert (progressive.iter_adaptive_chunks), bis der
+    Standardfehler der mittleren Leistung `target_se` (EUR) bzw. der relative Fehler von
+    mittlerer Leistung und VaR 95% `target_rel_error` erreicht ist oder das Zeitbudget
+    abläuft. Je Block werden nur Endwerte behalten; einfache Verträge enden nach wenigen
+    hundert Pfaden, schwierige laufen bis in die Millionen.
+
+    Die Garantiegebühr bei Lock-in bzw. laufenden Beiträgen wird im ersten Block
+    geschätzt und für alle weiteren übernommen. Perzentilbänder und Beispielpfade
+    stammen aus dem ersten Block, der Mittelwertpfad aus allen.
+
+    Returns:
+        dict: wie simulate_quote, zusätzlich precision (n_paths, mean_se, mean_rel_error,
+            var_ci, var_rel_error, target_met, elapsed)
+    """
+    days = scenario_days(inputs)
+    level = mifid_level(inputs)
+    lock_in_pct = float(inputs.get("lock_in_pct", 0.0))
+    first = {}
+
+    def simulate_chunk(n, rng):
+        scenarios = simulate_scenarios(market, level, days, n, rng=rng)
+        fees = apply_contract_fees(scenarios, inputs, guarantee_level, market,
+                                   initial_costs_pct=initial_costs_pct, in_place=True,
+                                   guarantee_cost_pct=first["fees"]["guarantee_cost_pct"] if first else None)
+        exits = sample_contract_exits(inputs, n, rng=rng)
+        guarantee = apply_contract_guarantee(fees, scenarios, guarantee_level, lock_in_pct, exits=exits)
+        if not first:
+            first["result"] = contract_statistics(scenarios, fees, guarantee, market, guarantee_level, lock_in_pct)
+            first["fees"] = fees
+        values = {name: guarantee[name] for name in ("end_values", "final_fund_values", "floors",
+                                                     "exit_days", "exit_cause") if name in guarantee}
+        return fees["paths_value"], values
+
+    path_bytes, overhead_bytes = adaptive_block_bytes(level, days)
+    for snapshot in iter_adaptive_chunks(simulate_chunk, np.random.default_rng(seed), target_se=target_se,
+                                         target_rel_error=target_rel_error, time_budget=time_budget,
+                                         cancel=cancel, path_bytes=path_bytes, overhead_bytes=overhead_bytes):
+        if on_chunk is not None:
+            on_chunk(snapshot)
+
+    values = snapshot["values"]
+    result = dict(first["result"])
+    result.update({
+        "final_fund_values": values["final_fund_values"],
+        "end_values": values["end_values"],
+        "floors": values["floors"],
+        "mean_path": snapshot["mean_path"],
+        "mean_floor": float(np.mean(values["floors"])),
+        "mean_fund": float(np.mean(values["final_fund_values"])),
+        "stats": summarize_end_values(values["end_values"]),
+        **exit_statistics(values),
+        "precision": {
+            **snapshot["precision"],
+            "target_met": snapshot["target_met"],
+            "elapsed": snapshot["elapsed"],
+        },
+    })
+    return result
+
+
+def run_mifid_quote(inputs, guarantee_level, seed=DEFAULT_SEED, store=None, source=None,
+                    initial_costs_pct=0.0):
+    """
+    Marktdaten laden, Ergebnis aus dem ResultStore bedienen oder neu simulieren.
+
+    Der Schlüssel umfasst alle Eingaben der Simulation (Fondsparameter, Seed,
+    Pfadanzahl, Zeitraster, Kosten, Garantie, Sterbetafel bei Ausscheiden), identische Anfragen werden daher
+    sitzungs- und prozessübergreifend aus dem Speicher beantwortet.
+    """
+    market = load_market_parameters(inputs["mifid_class"], source=source)
+
+    key = None
+    if store is not None:
+        key = store.make_key(
+            engine="mifid_quote",
+            market=market,
+            seed=seed,
+            inputs={k: inputs[k] for k in QUOTE_INPUT_KEYS if k in inputs},
+            initial_costs_pct=initial_costs_pct,
+            guarantee_level=guarantee_level,
+            mortality=mortality_fingerprint(inputs.get("exit_model")),
+        )
+        cached = store.get(key)
+        if cached is not None:
+            return cached
+
+    result = simulate_quote(inputs, guarantee_level, market, seed=seed,
+                            initial_costs_pct=initial_costs_pct)
+    if store is not None:
+        store.put(key, result)
+    return result
@@ -0,0 +1,251 @@
+import json
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from logger import log_info, log_error
+from quote_engine import (
+    DEFAULT_SEED, QUOTE_INPUT_KEYS, load_market_parameters, mifid_level, scenario_days,
+    simulate_scenarios, sample_contract_exits, mortality_fingerprint, value_contract
+)
+from result_store import ResultStore
+
+# Ergebnisfelder, die als Arrays übertragen werden (Client wandelt sie zurück)
+ARRAY_FIELDS = (
+    "final_fund_values", "end_values", "time_index", "band_percentiles",
+    "bands", "mean_path", "sample_paths", "floors", "exit_days", "exit_cause",
+)
+
+
+class ServiceBusy(RuntimeError):
+    """Warteschlange voll – Anfrage später erneut senden (HTTP 503)."""
+
+
+def to_jsonable(value):
+    """Wandelt Ergebnis-dicts mit NumPy-Werten in JSON-taugliche Objekte."""
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class QuoteService:
+    """
+    Angebotsrechnung als Dienst: begrenzter Worker-Pool, Rückstau und Bündelung.
+
+    Anfragen mit gleichen Fondsparametern und gleichem Zeitraster (Laufzeit,
+    Pfadanzahl, Seed), die innerhalb von `batch_window` Sekunden eintreffen,
+    werden zu einer Simulation zusammengefasst; die Szenarien werden danach je
+    Vertrag bewertet. Sind mehr als `max_pending` Verträge offen, wird ServiceBusy
+    ausgelöst.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, batch_window=0.05, store=None, source=None,
+                 seed=DEFAULT_SEED):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quote-worker")
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.store = store
+        self.source = source
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._open_batches = {}
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, inputs, guarantee_level, initial_costs_pct=0.0):
+        """Reiht einen Vertrag ein und liefert ein Future mit dem Ergebnis-dict."""
+        market = load_market_parameters(inputs["mifid_class"], source=self.source)
+        future = Future()
+
+        key = None
+        if self.store is not None:
+            key = self.store.make_key(
+                engine="mifid_quote",
+                market=market,
+                seed=self.seed,
+                inputs={k: inputs[k] for k in QUOTE_INPUT_KEYS if k in inputs},
+                initial_costs_pct=initial_costs_pct,
+                guarantee_level=guarantee_level,
+                mortality=mortality_fingerprint(inputs.get("exit_model")),
+            )
+            cached = self.store.get(key)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+
+        batch_key = (
+            tuple(sorted(market.items())), mifid_level(inputs), scenario_days(inputs),
+            int(inputs["n_paths"]), self.seed,
+        )
+        contract = (inputs, guarantee_level, initial_costs_pct, key, future)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ServiceBusy(f"{self._pending} richieste in coda – riprovare più tardi.")
+            self._pending += 1
+
+            batch = self._open_batches.get(batch_key)
+            if batch is None:
+                batch = {"market": market, "contracts": []}
+                self._open_batches[batch_key] = batch
+                timer = threading.Timer(self.batch_window, self._dispatch, args=(batch_key,))
+                timer.daemon = True
+                timer.start()
+            batch["contracts"].append(contract)
+        return future
+
+    def quote(self, inputs, guarantee_level, initial_costs_pct=0.0, timeout=None):
+        """Synchrone Variante von submit."""
+        return self.submit(inputs, guarantee_level, initial_costs_pct).result(timeout=timeout)
+
+    def _dispatch(self, batch_key):
+        with self._lock:
+            batch = self._open_batches.pop(batch_key)
+        self.executor.submit(self._run_batch, batch_key, batch)
+
+    def _run_batch(self, batch_key, batch):
+        _, level, days, n_paths, seed = batch_key
+        contracts = batch["contracts"]
+        try:
+            scenarios = simulate_scenarios(batch["market"], level, days, n_paths, seed=seed)
+            log_info(f"Quote-Batch: {len(contracts)} contratti su {n_paths} scenari ({days} giorni)")
+            for inputs, guarantee_level, initial_costs_pct, key, future in contracts:
+                try:
+                    exits = sample_contract_exits(inputs, n_paths, seed=seed)
+                    result = value_contract(scenarios, inputs, guarantee_level, batch["market"],
+                                            initial_costs_pct=initial_costs_pct, exits=exits)
+                    if self.store is not None:
+                        self.store.put(key, result)
+                    future.set_result(result)
+                except Exception as e:
+                    future.set_exception(e)
+        except Exception as e:
+            log_error(f"Quote-Batch fehlgeschlagen: {e}")
+            for *_, future in contracts:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending -= len(contracts)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class QuoteRequestHandler(BaseHTTPRequestHandler):
+    """POST /quote mit JSON {"inputs": {...}, "guarantee_level": 0.9}; GET /health."""
+
+    service = None  # wird von make_server gesetzt
+    request_timeout = 300
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(to_jsonable(payload)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "pending": self.service.pending})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/quote":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            future = self.service.submit(
+                request["inputs"], float(request["guarantee_level"]),
+                float(request.get("initial_costs_pct", 0.0))
+            )
+            result = future.result(timeout=self.request_timeout)
+        except ServiceBusy as e:
+            self._send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+        except (KeyError, ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            log_error(f"Quote-Anfrage fehlgeschlagen: {e}")
+            self._send_json(500, {"error": str(e)})
+        else:
+            self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8765, service=None):
+    """Erstellt den HTTP-Server (Port 0 = freien Port wählen); Start mit serve_forever()."""
+    handler = type("BoundQuoteRequestHandler", (QuoteRequestHandler,), {"service": service or QuoteService()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def request_quote(url, inputs, guarantee_level, initial_costs_pct=0.0, timeout=300):
+    """
+    Client für den Quote-Dienst (z.B. aus app2.py): liefert das Ergebnis-dict wie
+    run_mifid_quote, Array-Felder als np.ndarray.
+    """
+    payload = json.dumps(to_jsonable({
+        "inputs": {k: inputs[k] for k in QUOTE_INPUT_KEYS if k in inputs},
+        "guarantee_level": guarantee_level,
+        "initial_costs_pct": initial_costs_pct,
+    })).encode("utf-8")
+    request = urllib.request.Request(
+        url.rstrip("/") + "/quote", data=payload, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            result = json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        message = json.loads(e.read() or b"{}").get("error", e.reason)
+        raise RuntimeError(f"Servizio quotazioni ({e.code}): {message}") from e
+
+    for field in ARRAY_FIELDS:
+        if field in result:
+            result[field] = np.asarray(result[field])
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servizio HTTP per le quotazioni MiFID")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--batch-window", type=float, default=0.05)
+    parser.add_argument("--cache-dir", default="sim_cache")
+    args = parser.parse_args()
+
+    service = QuoteService(
+        max_workers=args.workers, max_pending=args.max_pending,
+        batch_window=args.batch_window, store=ResultStore(args.cache_dir)
+    )
+    server = make_server(args.host, args.port, service)
+    log_info(f"Quote-Service su http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
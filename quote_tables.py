@@ -0,0 +1,266 @@
+import os
+import time
+import json
+import argparse
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from logger import log_info, log_warning
+from quote_engine import (
+    DEFAULT_SEED, BOND_ROLL_YEARS, load_market_parameters, scenario_days, simulate_scenarios, value_contract,
+    simulate_quote
+)
+
+QUOTE_TABLE_PATH = "quote_table.npz"
+TABLE_CONTRIBUTION = 10_000.0  # Bezugsbeitrag; Geldbeträge werden je Euro Beitrag gespeichert
+
+# Standardraster: Laufzeit (Jahre, kurze Laufzeiten dichter) und laufende Kosten (%)
+TABLE_CLASSES = (1, 2, 3, 4, 5)
+TABLE_GUARANTEES = (0.8, 0.9, 1.0)
+TABLE_TERMS = (1, 2, 3, 4, 5, 7, 10, 12, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 70, 80, 90, 102)
+TABLE_COSTS = tuple(np.round(np.arange(0.0, 5.01, 0.5), 1))
+TABLE_STATS = ("mean", "var_5", "cvar_5", "mean_fund", "guarantee_cost_pct")
+MONEY_STATS = ("mean", "var_5", "cvar_5", "mean_fund")
+
+_SPOT_CHECK_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-spot-check")
+
+
+def build_quote_table(path=QUOTE_TABLE_PATH, classes=TABLE_CLASSES, guarantees=TABLE_GUARANTEES, terms=TABLE_TERMS,
+                      costs=TABLE_COSTS, n_paths=1000, seed=DEFAULT_SEED, source=None):
+    """
+    Offline-Job: Kennzahlen der Einmalbeitrags-Strecke auf dem ganzen Raster vorberechnen.
+
+    Die Simulation hängt nur von Klasse und Laufzeit ab (Eintrittsalter und Zielalter
+    gehen ausschließlich über die Differenz ein); je Klasse und Laufzeit wird daher
+    einmal simuliert und für alle Garantien und Kosten bewertet. Alle Rasterpunkte
+    nutzen denselben Seed – die Monte-Carlo-Streuung ist so zwischen Nachbarpunkten
+    gleich und die Interpolation glatt.
+
+    Returns:
+        QuoteTable: die geschriebene Tabelle.
+    """
+    values = np.full((len(TABLE_STATS), len(classes), len(guarantees), len(terms), len(costs)), np.nan,
+                     dtype=np.float32)
+    markets = []
+    started = time.perf_counter()
+    for c, level in enumerate(classes):
+        market = load_market_parameters(str(level), source=source)
+        markets.append(market)
+        for t, term in enumerate(terms):
+            scenarios = simulate_scenarios(market, level, int(term * 252), n_paths, seed=seed)
+            for g, guarantee in enumerate(guarantees):
+                for k, cost in enumerate(costs):
+                    inputs = {"age": 0, "death_age": term, "contribution": TABLE_CONTRIBUTION,
+                              "mifid_class": str(level), "costs_percent": float(cost), "n_paths": n_paths}
+                    result = value_contract(scenarios, inputs, guarantee, market)
+                    values[:, c, g, t, k] = _table_stats(result)
+        log_info(f"Tabella quotazioni: classe {level} pronta ({time.perf_counter() - started:.0f} s)")
+
+    meta = {
+        "classes": list(classes), "guarantees": list(guarantees), "terms": list(terms),
+        "costs": [float(c) for c in costs], "stats": list(TABLE_STATS), "n_paths": n_paths, "seed": seed,
+        "markets": markets, "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, values=values, meta=np.array(json.dumps(meta)))
+    os.replace(tmp_path, path)
+    return load_quote_table(path)
+
+
+def _table_stats(result):
+    stats = result["stats"]
+    row = [stats["mean"], stats["var_5"], stats["cvar_5"], result["mean_fund"], result["guarantee_cost_pct"]]
+    return [value / TABLE_CONTRIBUTION if name in MONEY_STATS else value for name, value in zip(TABLE_STATS, row)]
+
+
+def _bracket(grid, x):
+    """Index des linken Rasterpunkts und Gewicht des rechten für lineare Interpolation."""
+    i = min(max(bisect_right(grid, x) - 1, 0), len(grid) - 2)
+    w = (x - grid[i]) / (grid[i + 1] - grid[i])
+    return i, w
+
+
+def _bond_rolls(term):
+    """Vollständige Rollsegmente der Anleihesimulation für eine Laufzeit (Jahre)."""
+    return scenario_days({"age": 0, "death_age": term}) // int(BOND_ROLL_YEARS * 252)
+
+
+class QuoteTable:
+    """
+    Vorberechnete Kennzahlen (Klasse × Garantie × Laufzeit × Kosten) mit
+    multilinearer Interpolation über Laufzeit und Kosten.
+
+    lookup beantwortet Anfragen auf dem Raster in Mikrosekunden und liefert None
+    außerhalb (laufende Beiträge, Lock-in, Garantiegebühr nach Moneyness, Einstiegskosten, unbekannte Klasse oder
+    Garantie, Laufzeit bzw. Kosten außerhalb des Rasters, Anleiheklassen über einen
+    Rolltermin hinweg, geänderte Marktdaten) –
+    dann wird live simuliert. Stichproben gegen Live-Simulationen halten den
+    Interpolationsfehler fest (spot_check, error_summary).
+    """
+
+    def __init__(self, values, meta, path=None):
+        self.values = values
+        self.meta = meta
+        self.path = path
+        self.classes = [int(c) for c in meta["classes"]]
+        self.guarantees = [float(g) for g in meta["guarantees"]]
+        self.terms = [float(t) for t in meta["terms"]]
+        self.costs = [float(c) for c in meta["costs"]]
+        self.checks = deque(maxlen=1000)
+
+    def on_grid(self, inputs, guarantee_level, initial_costs_pct=0.0, market=None):
+        """Position im Raster (Klasse, Garantie) oder None, wenn die Anfrage nicht abgedeckt ist."""
+        if inputs.get("premium_mode", "single") != "single" or float(inputs.get("lock_in_pct", 0.0)) > 0:
+            return None
+        if inputs.get("guarantee_fee_mode", "flat") != "flat" or (inputs.get("exit_model") or "none") != "none":
+            return None
+        if initial_costs_pct:
+            return None
+        level = int(str(inputs["mifid_class"]).split(" ")[0])
+        if level not in self.classes:
+            return None
+        c = self.classes.index(level)
+        matches = [g for g, value in enumerate(self.guarantees) if abs(value - guarantee_level) < 1e-9]
+        if not matches:
+            return None
+        term = float(inputs["death_age"]) - float(inputs["age"])
+        cost = float(inputs["costs_percent"])
+        if not (self.terms[0] <= term <= self.terms[-1] and self.costs[0] <= cost <= self.costs[-1]):
+            return None
+        if level <= 2:
+            # Rollierende Anleihe: der Wert springt mit jedem vollständigen Rollsegment,
+            # zwischen Rasterpunkten mit verschiedener Segmentzahl nicht interpolierbar
+            i, w = _bracket(self.terms, term)
+            if 0 < w < 1 and _bond_rolls(self.terms[i]) != _bond_rolls(self.terms[i + 1]):
+                return None
+        if market is not None:
+            built = self.meta["markets"][c]
+            if built["ticker"] != market["ticker"] or not np.isclose([built["mu"], built["sigma"]],
+                                                                     [market["mu"], market["sigma"]]).all():
+                return None  # Tabelle mit anderen Marktdaten gerechnet
+        return c, matches[0], term, cost
+
+    def lookup(self, inputs, guarantee_level, initial_costs_pct=0.0, market=None):
+        """
+        Interpolierte Kennzahlen oder None (außerhalb des Rasters).
+
+        Returns:
+            dict: mean, var_5, cvar_5, mean_fund (EUR, auf den Beitrag skaliert),
+                guarantee_cost_pct, total_annual_cost, n_paths (der Tabelle), source="table"
+        """
+        position = self.on_grid(inputs, guarantee_level, initial_costs_pct, market)
+        if position is None:
+            return None
+        c, g, term, cost = position
+        i, wi = _bracket(self.terms, term)
+        k, wk = _bracket(self.costs, cost)
+        corners = self.values[:, c, g, i:i + 2, k:k + 2].astype(float)
+        if np.isnan(corners).any():
+            return None
+        weights = np.outer([1 - wi, wi], [1 - wk, wk])
+        interpolated = (corners * weights).sum(axis=(1, 2))
+
+        contribution = float(inputs["contribution"])
+        quote = {name: float(value * contribution) if name in MONEY_STATS else float(value)
+                 for name, value in zip(TABLE_STATS, interpolated)}
+        quote["total_annual_cost"] = cost + quote["guarantee_cost_pct"]
+        quote["n_paths"] = self.meta["n_paths"]
+        quote["source"] = "table"
+        return quote
+
+    def spot_check(self, inputs, guarantee_level, market=None, source=None):
+        """
+        Vergleicht lookup mit einer Live-Simulation (Pfadanzahl und Seed der Tabelle,
+        d.h. gleiche Zufallszahlen: die Abweichung ist der reine Interpolationsfehler).
+
+        Returns:
+            dict: relative Abweichung je Geldkennzahl, absolute Abweichung (Prozentpunkte)
+                der Garantiekosten; None außerhalb des Rasters
+        """
+        market = market or load_market_parameters(inputs["mifid_class"], source=source)
+        quote = self.lookup(inputs, guarantee_level, market=market)
+        if quote is None:
+            return None
+        live_inputs = {**inputs, "n_paths": self.meta["n_paths"]}
+        live = simulate_quote(live_inputs, guarantee_level, market, seed=self.meta["seed"])
+        reference = {**live["stats"], "mean_fund": live["mean_fund"], "guarantee_cost_pct": live["guarantee_cost_pct"]}
+        errors = {}
+        for name in TABLE_STATS:
+            if name in MONEY_STATS:
+                errors[name] = abs(quote[name] - reference[name]) / max(abs(reference[name]), 1e-9)
+            else:  # Garantiekosten: absolute Abweichung in Prozentpunkten (oft nahe 0)
+                errors[name] = abs(quote[name] - reference[name])
+        self.checks.append(errors)
+        if max(errors.values()) > 0.05:
+            log_warning(f"Tabella quotazioni: scarto {max(errors.values()):.3f} per {inputs['mifid_class']}, "
+                        f"durata {float(inputs['death_age']) - float(inputs['age']):g}, "
+                        f"costi {inputs['costs_percent']}%")
+        return errors
+
+    def maybe_spot_check(self, inputs, guarantee_level, rate=0.05, rng=None, market=None):
+        """Stichprobe mit Wahrscheinlichkeit `rate` im Hintergrund (blockiert die Anfrage nicht)."""
+        rng = rng if rng is not None else np.random.default_rng()
+        if rng.random() >= rate:
+            return None
+        return _SPOT_CHECK_POOL.submit(self.spot_check, dict(inputs), guarantee_level, market)
+
+    def error_summary(self):
+        """Mittlerer und maximaler Interpolationsfehler je Kennzahl über alle Stichproben."""
+        if not self.checks:
+            return {"n_checks": 0}
+        summary = {"n_checks": len(self.checks)}
+        for name in TABLE_STATS:
+            errors = np.array([check[name] for check in self.checks])
+            summary[name] = {"mean": float(errors.mean()), "max": float(errors.max())}
+        return summary
+
+
+@lru_cache(maxsize=4)
+def _load_cached(path, mtime_ns):
+    with np.load(path, allow_pickle=False) as data:
+        return QuoteTable(data["values"], json.loads(str(data["meta"])), path=path)
+
+
+def load_quote_table(path=QUOTE_TABLE_PATH):
+    """Geladene Tabelle (je Prozess zwischengespeichert, nach Neuaufbau neu geladen) oder None."""
+    if not os.path.exists(path):
+        return None
+    return _load_cached(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+
+def quote(inputs, guarantee_level, table=None, market=None, initial_costs_pct=0.0, seed=DEFAULT_SEED,
+          source=None):
+    """
+    Kennzahlen aus der Tabelle, außerhalb des Rasters per Live-Simulation
+    (source="live"; gleiche Schlüssel wie lookup).
+    """
+    table = table if table is not None else load_quote_table()
+    if table is not None:
+        result = table.lookup(inputs, guarantee_level, initial_costs_pct, market)
+        if result is not None:
+            return result
+    market = market or load_market_parameters(inputs["mifid_class"], source=source)
+    live = simulate_quote(inputs, guarantee_level, market, seed=seed, initial_costs_pct=initial_costs_pct)
+    return {
+        **live["stats"],
+        "mean_fund": live["mean_fund"],
+        "guarantee_cost_pct": live["guarantee_cost_pct"],
+        "total_annual_cost": live["total_annual_cost"],
+        "n_paths": int(inputs["n_paths"]),
+        "source": "live",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcola la tabella delle quotazioni MiFID")
+    parser.add_argument("--out", default=QUOTE_TABLE_PATH)
+    parser.add_argument("--n-paths", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    table = build_quote_table(args.out, n_paths=args.n_paths, seed=args.seed)
+    print(f"Tabella salvata in {args.out}: {table.values.shape} ({table.values.nbytes / 1024:.0f} KB)")
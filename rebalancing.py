@@ -0,0 +1,125 @@
+import numpy as np
+
+# Umschichtungsrhythmus → Abstand der Umschichtungstermine in Börsentagen
+REBALANCE_FREQUENCIES = {
+    "monthly": 21,
+    "quarterly": 63,
+    "annual": 252,
+}
+
+
+def rebalance_rows(days, frequency):
+    """Umschichtungstermine als Zeilen der Tagesmatrix (nach jedem vollen Intervall, ohne Beginn)."""
+    if frequency not in REBALANCE_FREQUENCIES:
+        raise ValueError(f"Unbekannter Umschichtungsrhythmus: {frequency}")
+    return np.arange(REBALANCE_FREQUENCIES[frequency], int(days), REBALANCE_FREQUENCIES[frequency])
+
+
+def _rebalance_blocks(prices, s0, weights, net_contribution, step, transaction_cost_pct):
+    """
+    Umschichtung an jedem Termin ohne Bandbreite, ohne Schleife über die Termine.
+
+    Alle Termine liegen im Abstand `step`, die Tagesmatrix zerfällt damit in gleich
+    lange Blöcke mit festem Anteilsbestand. Der Portfoliowert zu Blockbeginn ist das
+    kumulierte Produkt der Blockfaktoren G_k · (1 − Kosten_k) mit
+    G_k = Σ_f w_f · P_f(Termin k) / P_f(Termin k−1); daraus folgen die Anteile je
+    Block und Fonds, die in einem einsum über eine Blocksicht der Kurse (ohne Kopie)
+    ausmultipliziert werden. Kosten: transaction_cost_pct auf den Umsatz Σ_f |w_f − w_f vor Umschichtung|.
+    """
+    n_funds, days, n_paths = prices.shape
+    rows = np.arange(step, days, step)
+    base = np.concatenate([np.broadcast_to(s0[:, None, None], (n_funds, 1, n_paths)), prices[:, rows]], axis=1)
+    drifted = weights[:, None, None] * (base[:, 1:] / base[:, :-1])
+    block_growth = drifted.sum(axis=0)
+    turnover = np.abs(drifted / block_growth - weights[:, None, None]).sum(axis=0)
+
+    block_value = np.empty((len(rows) + 1, n_paths))
+    block_value[0] = net_contribution
+    np.cumprod(block_growth * (1 - transaction_cost_pct / 100 * turnover), axis=0, out=block_value[1:])
+    block_value[1:] *= net_contribution
+    units = weights[:, None, None] * block_value / base  # Anteile je Fonds, Block und Pfad
+
+    values = np.empty((days, n_paths))
+    n_full = days // step
+    blocks = prices[:, :n_full * step].reshape(n_funds, n_full, step, n_paths)
+    np.einsum("fkp,fksp->ksp", units[:, :n_full], blocks, out=values[:n_full * step].reshape(n_full, step, n_paths))
+    if n_full * step < days:  # angebrochener letzter Block
+        np.einsum("fp,ftp->tp", units[:, -1], prices[:, n_full * step:], out=values[n_full * step:])
+    return values
+
+
+def _rebalance_events(prices, s0, weights, net_contribution, rows, band, transaction_cost_pct,
+                      premium_rows=None, net_premiums=None):
+    """
+    Umschichtung mit Bandbreite bzw. laufenden Beiträgen: Schleife über die Termine,
+    je Termin vektorisiert über Fonds und Pfade.
+
+    Ein Pfad wird nur umgeschichtet, wenn ein Fondsgewicht um mehr als `band` vom
+    Zielgewicht abweicht; Beiträge kaufen Anteile nach Zielgewichten.
+    """
+    n_funds, days, n_paths = prices.shape
+    units = np.broadcast_to((weights * net_contribution / s0)[:, None], (n_funds, n_paths)).copy()
+    premiums = dict(zip(np.asarray(premium_rows if premium_rows is not None else [], dtype=int),
+                        np.asarray(net_premiums if net_premiums is not None else [], dtype=float)))
+    rebalance = set(np.asarray(rows, dtype=int).tolist())
+    events = sorted(rebalance | set(premiums) | {days - 1})
+    target = weights[:, None]
+
+    values = np.empty((days, n_paths))
+    start = 0
+    for row in events:
+        values[start:row + 1] = np.einsum("fp,ftp->tp", units, prices[:, start:row + 1])
+        if row in premiums:
+            units += target * premiums[row] / prices[:, row]
+        if row in rebalance:
+            fund_values = units * prices[:, row]
+            total = fund_values.sum(axis=0)
+            current = np.divide(fund_values, total, out=np.zeros_like(fund_values), where=total > 0)
+            deviation = np.abs(current - target)
+            trade = (total > 0) & (deviation.max(axis=0) > band)
+            total_after = total * (1 - transaction_cost_pct / 100 * deviation.sum(axis=0))
+            units = np.where(trade, target * total_after / prices[:, row], units)
+        values[row] = (units * prices[:, row]).sum(axis=0)
+        start = row + 1
+    return values
+
+
+def rebalanced_portfolio(prices, s0, weights, contribution, rows, band=0.0, transaction_cost_pct=0.0,
+                         premiums=None, premium_costs_pct=0.0):
+    """
+    Wertverlauf eines Mehrfondsportfolios mit periodischer Umschichtung auf Zielgewichte.
+
+    Ohne Bandbreite und laufende Beiträge (und bei gleichabständigen Terminen) wird
+    in einer Blockstruktur über die Umschichtungstermine gerechnet (kumuliertes
+    Produkt der Blockfaktoren); sonst hängt die Umschichtung vom Pfadverlauf ab und
+    die Termine werden nacheinander, aber vektorisiert über Fonds und Pfade, abgearbeitet.
+
+    Args:
+        prices (np.ndarray): Kurse je Fonds, shape = (Fonds, days, n_paths).
+        s0 (np.ndarray): Startkurse je Fonds (Kauf zu Beginn).
+        weights (np.ndarray): Zielgewichte je Fonds (Summe 1).
+        contribution (float): Einmalanlage nach Einstiegskosten (0 bei laufenden Beiträgen).
+        rows (np.ndarray): Umschichtungstermine (siehe rebalance_rows).
+        band (float): Bandbreite als absolute Gewichtsabweichung (z.B. 0.05 = 5 Prozentpunkte).
+        transaction_cost_pct (float): Kosten in % des umgeschichteten Volumens.
+        premiums (tuple, optional): (Zahlungszeilen, Beiträge) aus premiums.premium_schedule.
+        premium_costs_pct (float): Kosten in % auf jeden Beitrag.
+    Returns:
+        np.ndarray: Portfoliowert, shape = (days, n_paths)
+    """
+    prices = np.asarray(prices, dtype=float)
+    s0 = np.asarray(s0, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    rows = np.asarray(rows, dtype=int)
+    if not np.isclose(weights.sum(), 1.0):
+        raise ValueError("Die Zielgewichte müssen sich zu 100% summieren.")
+    step = int(rows[0]) if len(rows) else prices.shape[1]
+    regular = np.array_equal(rows, np.arange(step, prices.shape[1], step))
+    if premiums is None and band <= 0 and regular:
+        return _rebalance_blocks(prices, s0, weights, contribution, step, transaction_cost_pct)
+    premium_rows, net_premiums = (None, None)
+    if premiums is not None:
+        premium_rows = np.asarray(premiums[0], dtype=int)
+        net_premiums = np.asarray(premiums[1], dtype=float) * (1 - premium_costs_pct / 100)
+    return _rebalance_events(prices, s0, weights, contribution, rows, band, transaction_cost_pct,
+                             premium_rows, net_premiums)
@@ -0,0 +1,115 @@
+import os
+import json
+import glob
+import hashlib
+import threading
+
+import numpy as np
+
+from logger import log_warning
+
+# Bei inkompatiblen Änderungen der Simulationslogik erhöhen → alte Einträge werden ignoriert
+STORE_VERSION = 13
+
+
+def _normalize(value):
+    """Bringt Eingaben in eine stabile, JSON-serialisierbare Form (für den Hash)."""
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return [_normalize(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultStore:
+    """
+    Persistenter, inhaltsadressierter Speicher für Simulationsergebnisse.
+
+    Jeder Eintrag ist eine komprimierte .npz-Datei, deren Name der Hash aller
+    Eingaben ist. Arrays werden direkt gespeichert, alle übrigen Werte als JSON.
+    Überschreitet das Verzeichnis `max_bytes`, werden die am längsten nicht
+    genutzten Einträge gelöscht (LRU über die Änderungszeit der Dateien).
+    Schreibvorgänge sind atomar, der Speicher kann daher von mehreren
+    Sitzungen und Prozessen gleichzeitig genutzt werden.
+    """
+
+    def __init__(self, root="sim_cache", max_bytes=500 * 1024**2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(**inputs):
+        """Erzeugt den Schlüssel (SHA-256) aus allen Simulationseingaben."""
+        payload = json.dumps(
+            {"version": STORE_VERSION, "inputs": _normalize(inputs)},
+            sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.npz")
+
+    def get(self, key):
+        """Liefert das gespeicherte Ergebnis als dict oder None."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                result = {name: data[name] for name in data.files if name != "__meta__"}
+                meta = json.loads(str(data["__meta__"]))
+        except Exception as e:
+            log_warning(f"Ergebnis-Cache {key[:12]} nicht lesbar, wird verworfen: {e}")
+            self._remove(path)
+            return None
+
+        result.update(meta)
+        try:
+            os.utime(path)  # als zuletzt genutzt markieren
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Speichert ein Ergebnis-dict (ndarray-Werte als Arrays, Rest als JSON)."""
+        arrays = {k: v for k, v in result.items() if isinstance(v, np.ndarray)}
+        meta = {k: _normalize(v) for k, v in result.items() if not isinstance(v, np.ndarray)}
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(tmp_path, __meta__=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for path in glob.glob(os.path.join(self.root, "*.npz")):
+                if ".tmp" in os.path.basename(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+            # Der jüngste Eintrag bleibt immer erhalten
+            for _, size, path in entries[:-1]:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
@@ -2,7 +2,23 @@ import streamlit as st
 import matplotlib.pyplot as plt
 import numpy as np
 
-def display_results(end_values, total_paths, death_age):
+def build_paths_figure(total_paths, death_age, mean_path=None, time_index=None):
+    """Matplotlib-Grafik der Beispielpfade und des Mittelwerts (ohne Anzeige)."""
+    # Pfade auf einem Zeitraster: x-Achse = Tage laut time_index
+    x = np.arange(total_paths.shape[0]) if time_index is None else time_index
+    fig, ax = plt.subplots(figsize=(8, 4))
+    for i in range(min(total_paths.shape[1], 20)):
+        ax.plot(x, total_paths[:, i], alpha=0.2, linewidth=0.7)
+    if mean_path is None:
+        mean_path = np.mean(total_paths, axis=1)
+    ax.plot(x, mean_path, linewidth=2, label='Media')
+    ax.set_title(f"Portafoglio – Simulazione Monte Carlo fino a {death_age} anni")
+    ax.set_xlabel("Giorni")
+    ax.set_ylabel("Valore del portafoglio")
+    ax.legend()
+    return fig
+
+def display_results(end_values, total_paths, death_age, mean_path=None, time_index=None, fig=None):
     st.markdown(
         f"### 📈 Prestazione in caso di morte (valore finale massimo)\n"
         f"- **Media:** {np.mean(end_values):,.2f} €\n"
@@ -10,20 +26,35 @@ def display_results(end_values, total_paths, death_age):
         f"- **Massimo:** {np.max(end_values):,.2f} €"
     )
 
-    fig, ax = plt.subplots(figsize=(8, 4))
-    for i in range(min(total_paths.shape[1], 20)):
-        ax.plot(total_paths[:, i], alpha=0.2, linewidth=0.7)
-    ax.plot(np.mean(total_paths, axis=1), linewidth=2, label='Media')
-    ax.set_title(f"Portafoglio – Simulazione Monte Carlo fino a {death_age} anni")
-    ax.set_xlabel("Giorni")
-    ax.set_ylabel("Valore del portafoglio")
-    ax.legend()
+    if fig is None:
+        fig = build_paths_figure(total_paths, death_age, mean_path=mean_path, time_index=time_index)
     st.pyplot(fig)
 
-def display_costs_summary(costs_percent, guarantee_cost_pct, total_annual_cost):
+def display_costs_summary(costs_percent, guarantee_cost_pct, total_annual_cost, sensitivities=None):
     with st.expander("🌐 Dettagli sui costi annuali stimati"):
         st.markdown(
             f"- **Costi di gestione:** {costs_percent:.2f}% annuo\n"
             f"- **Costo della garanzia (Black-Scholes):** {guarantee_cost_pct:.2f}% annuo\n"
             f"- **Totale stimato:** {total_annual_cost:.2f}% annuo"
         )
+        if sensitivities:
+            st.markdown(
+                f"- **Sensibilità costo garanzia:** {sensitivities['cost_vega'] / 100:+.4f} pp per +1% volatilità, "
+                f"{sensitivities['cost_rho'] / 100:+.4f} pp per +1% tasso"
+            )
+
+def display_tail_metrics(tail):
+    """Garantie-Tailrisiken (Importance Sampling) mit 95%-Konfidenzintervallen."""
+    with st.expander("🎯 Rischio di coda della garanzia (importance sampling)"):
+        lo, hi = tail["shortfall_prob_ci"]
+        cost_lo, cost_hi = tail["guarantee_cost_pct_ci"]
+        var_lo, var_hi = tail["var_ci"]
+        cvar_lo, cvar_hi = tail["cvar_ci"]
+        level = int((1 - tail["alpha"]) * 100)
+        st.markdown(
+            f"- **Probabilità di intervento:** {tail['shortfall_prob']:.4%} (IC 95%: {lo:.4%} – {hi:.4%})\n"
+            f"- **Costo della garanzia:** {tail['guarantee_cost_pct']:.4f}% annuo "
+            f"(IC 95%: {cost_lo:.4f} – {cost_hi:.4f})\n"
+            f"- **VaR {level}% fondo:** {tail['var']:,.0f} € (IC 95%: {var_lo:,.0f} – {var_hi:,.0f})\n"
+            f"- **CVaR {level}% fondo:** {tail['cvar']:,.0f} € (IC 95%: {cvar_lo:,.0f} – {cvar_hi:,.0f})"
+        )
@@ -0,0 +1,187 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow ist optional – ohne pyarrow kein Export
+    pa = None
+
+from logger import log_info
+
+EXPORT_DIR = "exports"
+EXPORT_TABLES = ("terminal", "bands", "contracts")
+FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+# Skalare Kennzahlen je Vertrag (Schlüssel des Ergebnis-dicts von contract_statistics)
+CONTRACT_FIELDS = (
+    "ticker", "mu", "sigma", "use_bond_simulation", "guarantee_level", "guaranteed_amount",
+    "total_premiums", "lock_in_pct", "mean_floor", "guarantee_cost_pct", "total_annual_cost", "mean_fund",
+)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Export Arrow/Parquet richiede pyarrow (pip install pyarrow).")
+
+
+def _column(values):
+    """NumPy → Arrow ohne Kopie (zusammenhängende numerische Arrays ohne Nullwerte)."""
+    return pa.array(np.ascontiguousarray(values))
+
+
+def _terminal_batch(label, result):
+    end_values = np.asarray(result["end_values"])
+    n = len(end_values)
+    return pa.record_batch({
+        "contract": pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32), [label]),
+        "path": _column(np.arange(n, dtype=np.int64)),
+        "end_value": _column(end_values),
+        "final_fund_value": _column(result["final_fund_values"]),
+        "floor": _column(np.broadcast_to(result["floors"], n)),
+    })
+
+
+def _bands_batch(label, result):
+    time_index = np.asarray(result["time_index"])
+    n = len(time_index)
+    columns = {
+        "contract": pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32), [label]),
+        "day": _column(time_index.astype(np.int64, copy=False)),
+        "mean": _column(result["mean_path"]),
+    }
+    # Zeilen der Perzentilmatrix sind zusammenhängend → je Band eine Spalte ohne Kopie
+    for pct, band in zip(result["band_percentiles"], result["bands"]):
+        columns[f"p{int(pct)}"] = _column(band)
+    return pa.record_batch(columns)
+
+
+def _contracts_table(results):
+    rows = {"contract": list(results)}
+    for field in CONTRACT_FIELDS:
+        rows[field] = [result.get(field) for result in results.values()]
+    rows["n_paths"] = [len(result["end_values"]) for result in results.values()]
+    for name in ("mean", "min", "max", "var_5", "cvar_5"):
+        rows[f"end_{name}"] = [result["stats"][name] for result in results.values()]
+    precision = [result.get("precision") or {} for result in results.values()]
+    if any(precision):
+        for name in ("mean_se", "mean_rel_error", "var_rel_error", "target_met"):
+            rows[name] = [p.get(name) for p in precision]
+    sensitivities = [result.get("guarantee_sensitivities") or {} for result in results.values()]
+    if any(sensitivities):
+        for name in ("cost_vega", "cost_rho", "delta", "vega", "rho", "theta"):
+            rows[f"guarantee_{name}"] = [sens.get(name) for sens in sensitivities]
+    return pa.table(rows)
+
+
+def _unify_dictionaries(batches):
+    """Gleiche Vertrags-Dictionary für alle Batches (IPC verlangt ein gemeinsames Schema)."""
+    labels = pa.array([batch.column(0).dictionary[0].as_py() for batch in batches])
+    unified = []
+    for i, batch in enumerate(batches):
+        contract = pa.DictionaryArray.from_arrays(np.full(batch.num_rows, i, dtype=np.int32), labels)
+        unified.append(batch.set_column(0, "contract", contract))
+    return unified
+
+
+def build_tables(results):
+    """
+    Ergebnisse als Arrow-Tabellen: terminal (Endwerte je Pfad), bands
+    (Perzentilbänder und Mittelwert je Zeitpunkt) und contracts (Kennzahlen je Vertrag).
+
+    Die numerischen Spalten verweisen auf die Puffer der NumPy-Arrays, je Vertrag
+    ein Record Batch – es wird nichts kopiert.
+
+    Args:
+        results (dict): Bezeichnung → Ergebnis-dict (z.B. simulate_quote bzw. die
+            Stufe "statistics" der Pipeline); ein einzelnes Ergebnis-dict ist erlaubt.
+    """
+    _require_pyarrow()
+    if "end_values" in results:
+        results = {"contract": results}
+    labels = [str(label) for label in results]
+    results = dict(zip(labels, results.values()))
+    terminal = _unify_dictionaries([_terminal_batch(label, r) for label, r in results.items()])
+    bands = _unify_dictionaries([_bands_batch(label, r) for label, r in results.items()])
+    return {
+        "terminal": pa.Table.from_batches(terminal),
+        "bands": pa.Table.from_batches(bands),
+        "contracts": _contracts_table(results),
+    }
+
+
+def export_results(results, path=None, fmt="arrow"):
+    """
+    Schreibt Endwerte, Perzentilbänder und Vertragskennzahlen in ein Verzeichnis
+    (terminal, bands, contracts als .arrow oder .parquet).
+
+    Arrow-IPC-Dateien werden unkomprimiert geschrieben und lassen sich mit
+    read_results speicherabgebildet und ohne Deserialisierung öffnen; Parquet ist
+    kompakter und für Analysewerkzeuge ohne Arrow-IPC gedacht.
+
+    Returns:
+        str: Verzeichnis des Exports.
+    """
+    _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato di esportazione sconosciuto: {fmt} (ammessi: {', '.join(FORMATS)})")
+    if path is None:
+        path = os.path.join(EXPORT_DIR, datetime.now().strftime("%Y%m%d_%H%M%S"))
+    os.makedirs(path, exist_ok=True)
+
+    for name, table in build_tables(results).items():
+        file_path = os.path.join(path, name + FORMATS[fmt])
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        if fmt == "arrow":
+            with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, tmp_path)
+        os.replace(tmp_path, file_path)
+    log_info(f"Risultati esportati ({fmt}): {path}")
+    return path
+
+
+def read_results(path):
+    """
+    Öffnet einen Export wieder als Arrow-Tabellen nach Name.
+
+    Arrow-IPC-Dateien werden speicherabgebildet gelesen: die Spalten verweisen direkt
+    auf die Datei, geladen wird nur, was tatsächlich gelesen wird. Parquet wird mit
+    memory_map dekodiert.
+    """
+    _require_pyarrow()
+    tables = {}
+    for name in EXPORT_TABLES:
+        arrow_path = os.path.join(path, name + FORMATS["arrow"])
+        parquet_path = os.path.join(path, name + FORMATS["parquet"])
+        if os.path.exists(arrow_path):
+            tables[name] = ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+        elif os.path.exists(parquet_path):
+            tables[name] = pq.read_table(parquet_path, memory_map=True)
+    if not tables:
+        raise FileNotFoundError(f"Nessun export trovato in {path}")
+    return tables
+
+
+def contract_arrays(table, contract):
+    """
+    Numerische Spalten eines Vertrags als NumPy-Arrays; bei Arrow-IPC-Exporten ohne
+    Kopie (ein Record Batch je Vertrag).
+    """
+    labels = table.column("contract").chunk(0).dictionary.to_pylist()
+    i = labels.index(str(contract))
+    columns = {}
+    for name in table.column_names:
+        if name == "contract":
+            continue
+        column = table.column(name)
+        if column.num_chunks == len(labels):
+            columns[name] = column.chunk(i).to_numpy()
+        else:  # Parquet: Zeilen des Vertrags filtern
+            mask = np.asarray(table.column("contract").combine_chunks().indices) == i
+            columns[name] = column.to_numpy()[mask]
+    return columns
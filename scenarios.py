@@ -0,0 +1,263 @@
+import numpy as np
+
+from config import MIFID_FONDS
+from fund_forecast import get_mu_sigma_many
+from simulation import simulate_rolling_bond_process
+from quote_engine import DEFAULT_SEED, BOND_THETA, BOND_ROLL_YEARS
+from mortality import simulate_death_ages
+from bootstrap import BOOTSTRAP_BLOCK_DAYS, historical_log_returns, block_bootstrap_paths
+from fx import BASE_CURRENCY, fund_currency, calibrate_joint, simulate_correlated_gbm, convert_to_base
+from logger import log_info
+
+ESG_GRID_STEP = 21         # gemeinsames Zeitraster: monatlich (Börsentage)
+BOOK_BLOCK_POLICIES = 4096  # Verträge je Block bei der Bestandsbewertung
+
+
+def mifid_universe():
+    """Alle Fonds aus config.MIFID_FONDS als Liste (Ticker, MiFID-Klasse, Währung), ohne Duplikate."""
+    universe = []
+    seen = set()
+    for mifid_class, fonds in MIFID_FONDS.items():
+        for fond in fonds:
+            ticker = fond["ticker"] if isinstance(fond, dict) else fond
+            if ticker not in seen:
+                seen.add(ticker)
+                universe.append((ticker, mifid_class, fund_currency(fond)))
+    return universe
+
+
+def _gbm_on_grid(mu, sigma, elapsed_days, n_paths, rng):
+    """GBM-Wertfaktoren (Start 1.0) exakt auf einem beliebigen Tagesraster."""
+    dt = np.diff(elapsed_days) / 252
+    log_returns = (mu - 0.5 * sigma**2) * dt[:, None] + sigma * np.sqrt(dt)[:, None] * rng.standard_normal((len(dt), n_paths))
+    values = np.empty((len(elapsed_days), n_paths))
+    values[0] = 1.0
+    np.exp(np.cumsum(log_returns, axis=0), out=values[1:])
+    return values
+
+
+def build_scenario_set(n_paths=1000, years=60, seed=DEFAULT_SEED, grid_step=ESG_GRID_STEP, source=None,
+                       store=None, dtype=np.float32, model="gbm", block_days=BOOTSTRAP_BLOCK_DAYS,
+                       base_currency=BASE_CURRENCY):
+    """
+    Ökonomischer Szenariosatz: jeder Fonds aus MIFID_FONDS einmal auf einem gemeinsamen Raster.
+
+    Modell "gbm": Fonds der Klassen 1–2 laufen wie in der MiFID-Strecke als
+    rollierende Anleihe, alle übrigen als GBM; je Fonds wird ein eigener
+    Zufallsstrom aus SeedSequence(seed) abgeleitet. Modell "bootstrap": alle Fonds
+    gemeinsam per Block-Bootstrap der historischen Log-Renditen mit denselben
+    Blockindizes (erhält Abhängigkeiten, dicke Ränder und Volatilitäts-Cluster).
+    Der Satz ist in beiden Fällen reproduzierbar und kann im ResultStore abgelegt werden.
+
+    Mit `base_currency` werden die benötigten Wechselkurse (fx.py) mitsimuliert und
+    die Fonds in Fremdwährung in die Basiswährung umgerechnet: bei "gbm" ziehen
+    Aktienfonds und Wechselkurse gemeinsam korreliert (die Anleihefonds bleiben beim
+    eigenen Zinsmodell), beim Bootstrap laufen die Wechselkurse mit denselben
+    Blockindizes. Ohne (None) bleiben die Werte in Fondswährung, wie früher.
+
+    Args:
+        n_paths (int): Szenarien je Fonds.
+        years (int): Horizont in Jahren.
+        grid_step (int): Rasterweite in Börsentagen.
+        store (ResultStore, optional): Szenariosatz speichern bzw. von dort laden.
+        dtype: Speichertyp der Wertfaktoren (Standard float32, halber Speicherbedarf).
+        model (str): "gbm" oder "bootstrap".
+        block_days (int): Blocklänge des Bootstraps in Börsentagen.
+        base_currency (str | None): Währung der Werte (Standard EUR).
+    Returns:
+        dict: tickers, mifid_classes, currencies, mu, sigma (in Fondswährung),
+            elapsed_days (Raster ab Tag 0), values (Fonds × Rasterpunkte × Pfade;
+            Wertfaktor seit Tag 0, Start 1.0), fx_tickers, base_currency, model
+    """
+    if model not in ("gbm", "bootstrap"):
+        raise ValueError(f"Unbekanntes Szenariomodell: {model}")
+    universe = mifid_universe()
+    tickers = [ticker for ticker, _, _ in universe]
+    bonds = np.array([int(mifid_class) <= 2 for _, mifid_class, _ in universe])
+    fx_tickers = []
+    if base_currency is not None:
+        joint = calibrate_joint(tickers, [currency for _, _, currency in universe], base=base_currency, source=source)
+        fx_tickers, fx_index = joint["fx_tickers"], joint["fx_index"]
+        mu, sigma = joint["mu"][:len(tickers)], joint["sigma"][:len(tickers)]
+    else:
+        params = get_mu_sigma_many(tickers, source=source)
+        mu = np.array([params[t][0] for t in tickers], dtype=float)
+        sigma = np.array([params[t][1] for t in tickers], dtype=float)
+        sigma = np.where((sigma > 0) & ~np.isnan(sigma), sigma, 0.15)
+
+    key = None
+    if store is not None:
+        # mit Basiswährung auch μ/σ der Wechselkurse (gehen in die FX-Pfade ein)
+        key_mu, key_sigma = (joint["mu"], joint["sigma"]) if base_currency is not None else (mu, sigma)
+        key = store.make_key(engine="scenario_set", tickers=tickers, mu=key_mu, sigma=key_sigma, n_paths=n_paths,
+                             years=years, seed=seed, grid_step=grid_step, dtype=np.dtype(dtype).name,
+                             model=model, block_days=block_days if model == "bootstrap" else None,
+                             base_currency=base_currency, fx_tickers=fx_tickers,
+                             corr=joint["corr"] if base_currency is not None and model == "gbm" else None)
+        cached = store.get(key)
+        if cached is not None:
+            return cached
+
+    total_days = int(years * 252)
+    elapsed_days = np.unique(np.append(np.arange(0, total_days, grid_step), total_days))
+    values = np.empty((len(tickers), len(elapsed_days), n_paths), dtype=dtype)
+
+    fx_values = None
+    if model == "bootstrap":
+        history = historical_log_returns(tickers + fx_tickers, source=source)["log_returns"]
+        paths = block_bootstrap_paths(history, total_days, n_paths, block_days, rows=elapsed_days[1:] - 1,
+                                      dtype=dtype, seed=seed)
+        values[:, 0] = 1.0
+        values[:, 1:] = paths[:len(tickers)]
+        if fx_tickers:
+            fx_values = np.ones((len(fx_tickers), len(elapsed_days), n_paths), dtype=dtype)
+            fx_values[:, 1:] = paths[len(tickers):]
+    else:
+        streams = np.random.SeedSequence(seed).spawn(len(tickers) + 1)
+        joint_values = None
+        if base_currency is not None:
+            # Aktienfonds und Wechselkurse in einem korrelierten Zug (eigener Zufallsstrom)
+            joint_assets = np.concatenate([np.flatnonzero(~bonds), len(tickers) + np.arange(len(fx_tickers))])
+            joint_values = simulate_correlated_gbm(joint["mu"][joint_assets], joint["sigma"][joint_assets],
+                                                   joint["corr"][np.ix_(joint_assets, joint_assets)],
+                                                   elapsed_days, n_paths, np.random.default_rng(streams[-1]))
+            fx_values = joint_values[int((~bonds).sum()):]
+        equity = 0
+        for i, (ticker, mifid_class, _) in enumerate(universe):
+            rng = np.random.default_rng(streams[i])
+            if bonds[i]:
+                _, bond_values = simulate_rolling_bond_process(
+                    y0=mu[i], mu=mu[i], theta=BOND_THETA, sigma=sigma[i], total_days=total_days,
+                    n_paths=n_paths, roll_years=BOND_ROLL_YEARS, rng=rng, time_index=elapsed_days[1:] - 1
+                )
+                values[i, 0] = 1.0
+                values[i, 1:] = bond_values
+            elif joint_values is not None:
+                values[i] = joint_values[equity]
+                equity += 1
+            else:
+                values[i] = _gbm_on_grid(mu[i], sigma[i], elapsed_days, n_paths, rng)
+
+    if fx_values is not None:
+        convert_to_base(values, fx_values, fx_index)
+
+    scenario_set = {
+        "tickers": tickers,
+        "mifid_classes": [mifid_class for _, mifid_class, _ in universe],
+        "currencies": [currency for _, _, currency in universe],
+        "mu": mu,
+        "sigma": sigma,
+        "elapsed_days": elapsed_days,
+        "values": values,
+        "fx_tickers": fx_tickers,
+        "base_currency": base_currency,
+        "seed": seed,
+        "model": model,
+    }
+    log_info(f"Szenariosatz ({model}): {len(tickers)} fondi × {len(elapsed_days)} punti × {n_paths} scenari")
+    if store is not None:
+        store.put(key, scenario_set)
+    return scenario_set
+
+
+def grid_rows(scenario_set, days):
+    """Nächster Rasterpunkt zu Tagen seit Szenariobeginn (begrenzt auf den Horizont)."""
+    elapsed_days = scenario_set["elapsed_days"]
+    step = elapsed_days[1] - elapsed_days[0]
+    rows = np.rint(np.asarray(days, dtype=float) / step).astype(int)
+    return np.clip(rows, 0, len(elapsed_days) - 1)
+
+
+def value_book(scenario_set, book, r=0.01, confidence=0.995, block_policies=BOOK_BLOCK_POLICIES):
+    """
+    Garantiebelastung eines ganzen Bestands auf einem gemeinsamen Szenariosatz.
+
+    Je Vertrag wird der Wertfaktor seines Fonds zwischen Beginn und Ablauf (Tod bzw.
+    Vertragsende) per Gather aus dem Szenariosatz gelesen – ohne neue Simulation.
+    Jährliche Kosten wirken an jedem vollen Vertragsjahr, die Fehlbeträge
+    max(Garantie − Fondswert, 0) werden mit `r` auf heute abgezinst.
+
+    Args:
+        scenario_set (dict): Ergebnis von build_scenario_set.
+        book (dict | pd.DataFrame): Spalten ticker, contribution, guarantee_level,
+            exit_days (Laufzeit bis Tod/Ablauf in Börsentagen); optional entry_days
+            (Beginn ab Szenariostart, Standard 0) und annual_cost_pct (Standard 0).
+        confidence (float): Niveau für VaR/CVaR des Gesamtfehlbetrags.
+    Returns:
+        dict: book_shortfall (Barwert je Szenario), expected_shortfall, var, cvar,
+            policy_expected_shortfall, policy_shortfall_prob (je Vertrag)
+    """
+    ticker_index = {ticker: i for i, ticker in enumerate(scenario_set["tickers"])}
+    try:
+        fund = np.array([ticker_index[t] for t in np.asarray(book["ticker"])], dtype=int)
+    except KeyError as e:
+        raise ValueError(f"Fonds {e} nicht im Szenariosatz enthalten.") from None
+
+    contribution = np.asarray(book["contribution"], dtype=float)
+    guaranteed = contribution * np.asarray(book["guarantee_level"], dtype=float)
+    exit_days = np.asarray(book["exit_days"], dtype=float)
+    n_policies = len(fund)
+    entry_days = np.asarray(book["entry_days"], dtype=float) if "entry_days" in book else np.zeros(n_policies)
+    cost = np.asarray(book["annual_cost_pct"], dtype=float) if "annual_cost_pct" in book else np.zeros(n_policies)
+
+    horizon = scenario_set["elapsed_days"][-1]
+    if np.any(entry_days + exit_days > horizon):
+        raise ValueError("Mindestens ein Vertrag läuft über den Horizont des Szenariosatzes hinaus.")
+
+    entry_row = grid_rows(scenario_set, entry_days)
+    exit_row = grid_rows(scenario_set, entry_days + exit_days)
+    cost_factor = (1 - cost / 100) ** (exit_days // 252)
+    discount = np.exp(-r * (entry_days + exit_days) / 252)
+
+    values = scenario_set["values"]
+    n_paths = values.shape[2]
+    book_shortfall = np.zeros(n_paths)
+    policy_expected_shortfall = np.empty(n_policies)
+    policy_shortfall_prob = np.empty(n_policies)
+
+    for start in range(0, n_policies, block_policies):
+        stop = min(start + block_policies, n_policies)
+        f = fund[start:stop]
+        growth = values[f, exit_row[start:stop]].astype(float) / values[f, entry_row[start:stop]]
+        fund_value = growth * (contribution[start:stop] * cost_factor[start:stop])[:, None]
+        shortfall = np.maximum(guaranteed[start:stop, None] - fund_value, 0.0)
+        shortfall *= discount[start:stop, None]
+
+        book_shortfall += shortfall.sum(axis=0)
+        policy_expected_shortfall[start:stop] = shortfall.mean(axis=1)
+        policy_shortfall_prob[start:stop] = (shortfall > 0).mean(axis=1)
+
+    var = np.percentile(book_shortfall, confidence * 100)
+    tail = book_shortfall[book_shortfall >= var]
+    return {
+        "book_shortfall": book_shortfall,
+        "expected_shortfall": float(np.mean(book_shortfall)),
+        "var": float(var),
+        "cvar": float(np.mean(tail)),
+        "confidence": confidence,
+        "policy_expected_shortfall": policy_expected_shortfall,
+        "policy_shortfall_prob": policy_shortfall_prob,
+        "n_policies": n_policies,
+    }
+
+
+def sample_book(scenario_set, n_policies, df_mortality, rng=None, maturity_age=90,
+                contribution_range=(5_000, 100_000), guarantee_levels=(0.8, 0.9, 1.0), annual_cost_pct=1.5):
+    """
+    Synthetischer Bestand für Tests und Belastungsrechnungen: zufällige Fonds,
+    Beiträge, Garantien und Eintrittsalter; Ablauf bei Tod (Sterbetafel) oder
+    spätestens mit `maturity_age`.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    horizon_years = scenario_set["elapsed_days"][-1] // 252
+    ages = rng.integers(max(18, maturity_age - horizon_years), maturity_age - 1, n_policies)
+    death_ages = simulate_death_ages(ages, df_mortality, rng=rng)
+    exit_ages = np.clip(np.minimum(death_ages, maturity_age), ages + 1, None)
+
+    return {
+        "ticker": rng.choice(np.array(scenario_set["tickers"]), n_policies),
+        "contribution": rng.uniform(*contribution_range, n_policies).round(-2),
+        "guarantee_level": rng.choice(np.array(guarantee_levels), n_policies),
+        "exit_days": (exit_ages - ages) * 252,
+        "annual_cost_pct": np.full(n_policies, float(annual_cost_pct)),
+    }
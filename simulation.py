@@ -1,4 +1,9 @@
-from fund_forecast import get_mu_sigma, simulate_multiple_paths
+from fund_forecast import get_mu_sigma_many, simulate_multiple_paths
+from path_storage import MemmapPaths, write_gbm_paths
+from kernels import ou_recursion
+from premiums import units_from_premiums
+from rebalancing import rebalanced_portfolio, rebalance_rows
+from utils import brownian_likelihood_ratio, shifted_columns
 import numpy as np
 
 
@@ -12,13 +17,14 @@ def simulate_paths_for_all_guarantees(contribution, fonds_weights, n_paths, days
     """
     total_paths_by_guarantee = {}
     sigma_by_guarantee = {}
+    params = get_mu_sigma_many([fond for fond, _ in fonds_weights])
 
     for guarantee in guarantee_levels:
         total_paths = None
         total_sigma = 0
 
         for fond, weight in fonds_weights:
-            mu, sigma, s0 = get_mu_sigma(fond)
+            mu, sigma, s0 = params[fond]
             total_sigma += sigma * (weight / 100)
             fund_contribution = contribution * (weight / 100)
             scaling_factor = fund_contribution / s0
@@ -37,27 +43,71 @@ def simulate_paths_for_all_guarantees(contribution, fonds_weights, n_paths, days
     return total_paths_by_guarantee, sigma_by_guarantee
 
 
-def run_simulation(contribution, fonds_weights, n_paths, days, initial_costs_pct=0.0):
+def run_simulation(contribution, fonds_weights, n_paths, days, initial_costs_pct=0.0,
+                   memmap_path=None, seed=None, premiums=None, rebalance=None, rebalance_band=0.0,
+                   transaction_cost_pct=0.0):
     """
     🧮 Simuliert die Entwicklung eines Portfolios aus Fondsanteilen.
 
+    Mit `memmap_path` werden die Pfade blockweise in eine speicherabgebildete
+    .npy-Datei geschrieben (siehe path_storage), statt im RAM gehalten.
+    Mit `premiums` = (Zahlungszeilen, Beiträge) werden laufende Beiträge statt der
+    Einmalanlage `contribution` investiert (initial_costs_pct gilt je Beitrag).
+    Mit `rebalance` ("monthly", "quarterly", "annual") wird periodisch auf die
+    Gewichte aus `fonds_weights` zurückgeschichtet (siehe rebalancing), optional nur
+    bei Abweichung über `rebalance_band` und mit Kosten `transaction_cost_pct`
+    (% des Umsatzes); ohne `rebalance` bleiben die Anteile ab Beginn fest.
+
     Returns:
-        ndarray: Wertverlauf des Portfolios [days, n_paths]
+        ndarray | MemmapPaths: Wertverlauf des Portfolios [days, n_paths]
         float: Durchschnittliche Volatilität (gewichtetes sigma)
     """
     total_paths = None
     total_sigma = 0
     net_contribution = contribution * (1 - initial_costs_pct / 100)
+    params = get_mu_sigma_many([fond for fond, _ in fonds_weights])
+
+    if memmap_path is not None and premiums is not None:
+        raise ValueError("Laufende Beiträge werden im Memmap-Modus nicht unterstützt.")
+    if rebalance is not None:
+        if memmap_path is not None:
+            raise ValueError("Umschichtung wird im Memmap-Modus nicht unterstützt.")
+        prices = np.empty((len(fonds_weights), int(days), n_paths))
+        for i, (fond, weight) in enumerate(fonds_weights):
+            mu, sigma, s0 = params[fond]
+            total_sigma += sigma * weight / 100
+            prices[i] = simulate_multiple_paths(s0, mu, sigma, days, n_paths, seed=seed if i == 0 else None)
+        s0 = np.array([params[fond][2] for fond, _ in fonds_weights])
+        weights = np.array([weight for _, weight in fonds_weights], dtype=float) / 100
+        total_paths = rebalanced_portfolio(
+            prices, s0, weights, 0.0 if premiums is not None else net_contribution, rebalance_rows(days, rebalance),
+            band=rebalance_band, transaction_cost_pct=transaction_cost_pct, premiums=premiums,
+            premium_costs_pct=initial_costs_pct
+        )
+        return total_paths, total_sigma
+    if memmap_path is not None:
+        total_paths = MemmapPaths.create(memmap_path, days, n_paths)
+        fund_seeds = np.random.SeedSequence(seed).spawn(len(fonds_weights))
 
-    for fond, weight in fonds_weights:
-        mu, sigma, s0 = get_mu_sigma(fond)
+    for i, (fond, weight) in enumerate(fonds_weights):
+        mu, sigma, s0 = params[fond]
         weight_ratio = weight / 100
         total_sigma += sigma * weight_ratio
         fund_contribution = net_contribution * weight_ratio
         n_shares = fund_contribution / s0
 
-        paths = simulate_multiple_paths(s0, mu, sigma, days, n_paths)
-        paths_value = paths * n_shares
+        if memmap_path is not None:
+            write_gbm_paths(total_paths, s0, mu, sigma, scale=n_shares,
+                            seed=fund_seeds[i], accumulate=True)
+            continue
+
+        paths = simulate_multiple_paths(s0, mu, sigma, days, n_paths, seed=seed if i == 0 else None)
+        if premiums is not None:
+            premium_rows, premium_amounts = premiums
+            paths_value = units_from_premiums(paths, premium_rows, np.asarray(premium_amounts) * weight_ratio,
+                                              premium_costs_pct=initial_costs_pct)
+        else:
+            paths_value = paths * n_shares
 
         if total_paths is None:
             total_paths = paths_value
@@ -68,40 +118,105 @@ def run_simulation(contribution, fonds_weights, n_paths, days, initial_costs_pct
 
 
 
-def simulate_ou_process(s0, mu, theta, sigma, days, n_paths, dt=1/252, seed=None):
+def simulate_ou_process(s0, mu, theta, sigma, days, n_paths, dt=1/252, seed=None, backend=None, rng=None,
+                        dw_shift=None):
     """
     Simuliert einen Ornstein-Uhlenbeck-Prozess.
     Liefert realistische Anleihe-Wertentwicklungen rund um den Startwert `s0`.
+    Mit `rng` (np.random.Generator) statt des globalen NumPy-Zustands.
+
+    Mit `dw_shift` (Importance Sampling; Skalar oder je Pfad) werden die Brownschen
+    Inkremente um dw_shift·dt verschoben – das langfristige Niveau wandert damit um
+    σ·dw_shift/θ – und zusätzlich die Summe der Inkremente je Pfad (W_T) geliefert.
     """
-    if seed is not None:
+    if rng is None and seed is not None:
         np.random.seed(seed)
+    random = rng if rng is not None else np.random
 
-    steps = days
-    X = np.zeros((steps + 1, n_paths))
-    X[0] = s0
-
-    for t in range(steps):
-        dW = np.random.normal(0, np.sqrt(dt), size=n_paths)
-        X[t + 1] = X[t] + theta * (mu - X[t]) * dt + sigma * dW
+    # Gleicher Zufallsstrom wie schrittweises Ziehen, Rekursion im Kernel (Numba/NumPy)
+    dW = random.normal(0, np.sqrt(dt), size=(days, n_paths))
+    if dw_shift is None:
+        return ou_recursion(s0, mu, theta, sigma, dW, dt, backend=backend)  # Shape: (days+1, n_paths)
 
-    return X  # Shape: (days+1, n_paths)
+    dW += np.asarray(dw_shift) * dt
+    return ou_recursion(s0, mu, theta, sigma, dW, dt, backend=backend), dW.sum(axis=0)
 
-def simulate_rolling_bond_process(y0, mu, theta, sigma, total_days, n_paths, roll_years=10):
+def simulate_rolling_bond_process(y0, mu, theta, sigma, total_days, n_paths, roll_years=10, seed=None,
+                                  grid_step=None, rng=None, time_index=None, dw_shift=None,
+                                  shifted_fraction=1.0):
     """
     Simuliert Bond-Rebalancing mit wachsendem Portfoliowert.
+
+    Ohne `grid_step` werden nur die Endwachstumsfaktoren geliefert (shape = (n_paths,)).
+    Mit `grid_step` (Tage) zusätzlich die Marktwertpfade auf dem Zeitraster: innerhalb
+    eines Rollsegments wird die Auszahlung des Segments, (1 + Endrendite)^roll_years,
+    mit der erwarteten Endrendite (OU-Erwartung ab der aktuellen Rendite) angesetzt
+    und mit der aktuellen Rendite über die Restlaufzeit abgezinst. Steigende Renditen
+    senken den Wert damit über die Duration (bis die Restlaufzeit kurz wird); am
+    Segmentbeginn ist der Faktor 1, am Segmentende entspricht er exakt dem Endfaktor.
+    Mit `rng` (np.random.Generator) statt des globalen NumPy-Zustands; ein eigenes
+    Zeitraster (aufsteigende Zeilen < total_days) kann über `time_index` übergeben werden.
+    Mit `dw_shift` (Importance Sampling, siehe simulate_ou_process) wird als weiteres
+    Ergebnis der Likelihood-Quotient je Pfad angehängt; verschoben wird ein Anteil
+    `shifted_fraction` der Pfade (defensive Mischung, siehe brownian_likelihood_ratio).
+
+    Returns:
+        np.ndarray: Wachstumsfaktoren (n_paths,)  – ohne grid_step
+        np.ndarray, np.ndarray: Zeitindex (Zeilen der Tagesmatrix, Tag = Index + 1)
+            und Wertpfade (len(Zeitindex), n_paths) – mit grid_step
     """
+    if rng is None and seed is not None:
+        np.random.seed(seed)
+
     roll_days = int(roll_years * 252)
     n_rolls = total_days // roll_days
     value = np.ones((n_paths,))  # Start bei 1.0 EUR
 
-    for _ in range(n_rolls):
+    on_grid = grid_step is not None or time_index is not None
+    if on_grid:
+        if time_index is None:
+            time_index = np.unique(np.append(np.arange(0, total_days, grid_step), total_days - 1))
+        time_index = np.asarray(time_index)
+        elapsed_days = time_index + 1
+        roll_of_row = (elapsed_days - 1) // roll_days
+        value_paths = np.empty((len(time_index), n_paths))
+
+    path_shift = None
+    if dw_shift is not None:
+        mask, fraction = shifted_columns(n_paths, shifted_fraction)
+        path_shift = np.where(mask, dw_shift, 0.0)
+        w_sum = np.zeros(n_paths)
+
+    for k in range(n_rolls):
         rates = simulate_ou_process(
             s0=y0, mu=mu, theta=theta, sigma=sigma,
-            days=roll_days, n_paths=n_paths
+            days=roll_days, n_paths=n_paths, rng=rng, dw_shift=path_shift
         )
+        if dw_shift is not None:
+            rates, roll_w_sum = rates
+            w_sum += roll_w_sum
+        if on_grid:
+            rows = np.flatnonzero(roll_of_row == k)
+            held_days = elapsed_days[rows] - k * roll_days
+            current = rates[held_days, :]
+            remaining = (roll_years - held_days / 252)[:, None]  # Restlaufzeit in Jahren
+            expected_end = current + (mu - current) * -np.expm1(-theta * remaining)
+            value_paths[rows] = value * (1 + expected_end) ** roll_years / (1 + current) ** remaining
+
         # Letzter Zins pro Pfad:
         end_yield = rates[-1, :]
         bond_return = (1 + end_yield) ** roll_years  # diskreter Zinseszins
         value *= bond_return
 
-    return value
+    weights = None
+    if dw_shift is not None:
+        weights = brownian_likelihood_ratio(w_sum, dw_shift, n_rolls * roll_days / 252, fraction)
+
+    if not on_grid:
+        return value if weights is None else (value, weights)
+
+    # Resttage nach dem letzten vollständigen Segment: Wert bleibt konstant
+    value_paths[roll_of_row >= n_rolls] = value
+    if weights is not None:
+        return time_index, value_paths, weights
+    return time_index, value_paths
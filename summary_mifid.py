@@ -24,7 +24,9 @@ class StyledPDF(FPDF):
         self.set_font("Helvetica", "I", 8)
         self.cell(0, 10, f"Pagina {self.page_no()}", 0, 0, "C")
 
-def generate_mifid_summary_pdf(age, contribution, death_age, mifid_class, mu, sigma, costs_percent, n_paths, total_paths_by_guarantee):
+def generate_mifid_summary_pdf(age, contribution, death_age, mifid_class, mu, sigma, costs_percent, n_paths, total_paths_by_guarantee,
+                               floors_by_guarantee=None, tail_metrics_by_guarantee=None,
+                               sensitivities_by_guarantee=None, end_values_by_guarantee=None):
     pdf = StyledPDF()
     pdf.add_page()
 
@@ -61,9 +63,16 @@ def generate_mifid_summary_pdf(age, contribution, death_age, mifid_class, mu, si
         pdf.set_font("Helvetica", "B", 12)
         pdf.cell(0, 10, sanitize_text_for_pdf(f"Garanzia {int(guarantee * 100)}%"), ln=True, fill=True)
 
-        final_values = paths[-1, :]
+        # Akzeptiert Pfadmatrix (Tage × Pfade) oder bereits die Endwerte
+        final_values = np.asarray(paths)
+        if final_values.ndim == 2:
+            final_values = final_values[-1, :]
         guaranteed_amount = contribution * guarantee
-        end_values = np.maximum(final_values, guaranteed_amount)
+        # Lock-in-Garantie: Garantie je Pfad statt statischem Betrag
+        floors = (floors_by_guarantee or {}).get(guarantee, guaranteed_amount)
+        # Leistungen der Engine übernehmen (bei Storno ohne Garantie); nur ohne sie hier bilden
+        end_values = (end_values_by_guarantee or {}).get(guarantee)
+        end_values = np.maximum(final_values, floors) if end_values is None else np.asarray(end_values)
 
         mean = np.mean(end_values)
         min_ = np.min(end_values)
@@ -74,13 +83,39 @@ def generate_mifid_summary_pdf(age, contribution, death_age, mifid_class, mu, si
         pdf.set_font("Helvetica", "", 11)
         details = [
             f"- Capitale garantito: {guaranteed_amount:,.2f} EUR",
+            f"- Garanzia media con lock-in: {np.mean(floors):,.2f} EUR" if np.ndim(floors) else None,
             f"- Prestazione media simulata: {mean:,.2f} EUR",
             f"- Minimo / Massimo: {min_:,.2f} EUR / {max_:,.2f} EUR",
             f"- VaR 95%: {var_5:,.2f} EUR",
             f"- CVaR (media sotto 5%): {cvar:,.2f} EUR"
         ]
+        # Seltene Ereignisse aus Importance Sampling (quote_engine.guarantee_tail_metrics)
+        tail = (tail_metrics_by_guarantee or {}).get(guarantee)
+        if tail:
+            lo, hi = tail["shortfall_prob_ci"]
+            cost_lo, cost_hi = tail["guarantee_cost_pct_ci"]
+            details += [
+                f"- Probabilità di intervento della garanzia: {tail['shortfall_prob']:.4%} "
+                f"(IC 95%: {lo:.4%} – {hi:.4%})",
+                f"- Costo garanzia (importance sampling): {tail['guarantee_cost_pct']:.4f}% annuo "
+                f"(IC 95%: {cost_lo:.4f} – {cost_hi:.4f})",
+            ]
+        # Sensitivitäten der Garantie (quote_engine.guarantee_sensitivities)
+        sens = (sensitivities_by_guarantee or {}).get(guarantee)
+        if sens:
+            details.append(
+                f"- Sensibilità costo garanzia: {sens['cost_vega'] / 100:+.4f} pp per +1% volatilità, "
+                f"{sens['cost_rho'] / 100:+.4f} pp per +1% tasso"
+            )
+            if sens.get("mc"):
+                mc = sens["mc"]
+                details.append(
+                    f"- Delta / Vega garanzia (Monte Carlo): {mc['delta']:+.3f} / "
+                    f"{mc['vega'] / 100:+,.2f} EUR per +1% volatilità (±{mc['vega_se'] / 100:,.2f})"
+                )
         for line in details:
-            pdf.cell(0, 8, sanitize_text_for_pdf(line), ln=True)
+            if line:
+                pdf.cell(0, 8, sanitize_text_for_pdf(line), ln=True)
         pdf.ln(2)
 
         # Plausibilitätsprüfung sammeln
@@ -98,7 +133,7 @@ def generate_mifid_summary_pdf(age, contribution, death_age, mifid_class, mu, si
 
     folder = "pdf_output"
     os.makedirs(folder, exist_ok=True)
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")  # eindeutig auch bei parallelen Sitzungen
     file_path = os.path.join(folder, f"mifid_simulation_{timestamp}.pdf")
     pdf.output(file_path)
     return file_path
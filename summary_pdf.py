@@ -3,7 +3,7 @@ import tempfile
 import numpy as np
 from utils import get_guarantee_cost, price_guarantee_put
 from fund_forecast import get_mu_sigma
-from utils import days_between_ages
+from utils import days_between_ages, apply_annual_costs
 
 def generate_summary_pdf(age, contribution, death_age, fonds_weights, total_sigma,
                           costs_percent, n_paths, df_mortality, total_paths_by_guarantee):
@@ -53,15 +53,9 @@ def generate_summary_pdf(age, contribution, death_age, fonds_weights, total_sigm
             guarantee_cost_pct = get_guarantee_cost(contribution, guarantee, T, total_sigma)
             total_annual_cost = costs_percent + guarantee_cost_pct
 
-            paths = total_paths_by_guarantee[guarantee]
-
-            if total_annual_cost > 0:
-                for year in range(1, days // 252 + 1):
-                    idx = year * 252
-                    if idx < paths.shape[0]:
-                        paths[idx:] *= (1 - total_annual_cost / 100)
-
-            final_fund_values = paths[-1]
+            # Tagesmatrix oder nur Endwerte (1D)
+            paths = apply_annual_costs(total_paths_by_guarantee[guarantee], total_annual_cost, days)
+            final_fund_values = paths[-1] if paths.ndim == 2 else paths
             guaranteed_amount = contribution * guarantee
             end_values = np.maximum(final_fund_values, guaranteed_amount)
 
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pytest
+
+import pipeline
+import quote_engine
+import quote_service
+import summary_mifid
+from decrements import EXIT_DEATH, EXIT_LAPSE, EXIT_MATURITY
+from quote_engine import (
+    apply_contract_fees, apply_contract_guarantee, guarantee_tail_metrics, run_mifid_quote, sample_contract_exits,
+    scenario_days, simulate_quote, simulate_scenarios
+)
+from result_store import ResultStore
+
+# Feste Marktparameter statt Kursabruf
+MARKET = {"ticker": "TEST", "mu": 0.04, "sigma": 0.2, "s0": 100.0}
+QX = np.full(121, 0.02)
+
+
+def contract(**overrides):
+    inputs = {"age": 40, "death_age": 60, "contribution": 10_000.0, "mifid_class": "4 - Test",
+              "costs_percent": 2.5, "n_paths": 2000, "lock_in_pct": 0.0, "premium_mode": "single",
+              "exit_model": "high"}
+    inputs.update(overrides)
+    return inputs
+
+
+@pytest.fixture
+def repo_dir(monkeypatch):
+    """Standard-Sterbetafel (Tavole_di_mortalita.csv) liegt im Repository."""
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_no_exit_model_samples_no_exits():
+    assert sample_contract_exits(contract(exit_model="none"), 100, qx=QX) is None
+    assert sample_contract_exits(contract(exit_model=None), 100, qx=QX) is None
+
+
+def test_mortality_model_has_no_lapses():
+    exits = sample_contract_exits(contract(exit_model="mortality"), 5000, qx=QX)
+    assert set(np.unique(exits["cause"])) <= {EXIT_MATURITY, EXIT_DEATH}
+    assert np.all(exits["exit_days"] <= scenario_days(contract()))
+
+
+def test_floor_applies_only_at_maturity_and_death():
+    inputs = contract()
+    scenarios = simulate_scenarios(MARKET, 4, scenario_days(inputs), inputs["n_paths"], seed=7)
+    fees = apply_contract_fees(scenarios, inputs, 1.0, MARKET)
+    exits = sample_contract_exits(inputs, inputs["n_paths"], seed=7, qx=QX)
+    guarantee = apply_contract_guarantee(fees, scenarios, 1.0, exits=exits)
+
+    cause = guarantee["exit_cause"]
+    fund, floors, end = guarantee["final_fund_values"], guarantee["floors"], guarantee["end_values"]
+    lapse = cause == EXIT_LAPSE
+    assert np.any(lapse & (fund < floors)), "Testfall ohne Storno unter der Garantie"
+    assert np.any(~lapse & (fund < floors)), "Testfall ohne Garantiefall bei Tod/Ablauf"
+    np.testing.assert_array_equal(end[lapse], fund[lapse])
+    np.testing.assert_array_equal(end[~lapse], np.maximum(fund, floors)[~lapse])
+
+
+def test_tail_metrics_account_for_exits(repo_dir):
+    inputs = contract(n_paths=1000)
+    with_lapse = guarantee_tail_metrics(inputs, 1.0, MARKET, seed=3, importance=False)
+    without = guarantee_tail_metrics(contract(n_paths=1000, exit_model="none"), 1.0, MARKET, seed=3,
+                                     importance=False)
+    # Storno verfällt die Garantie → weniger Garantiefälle
+    assert with_lapse["shortfall_prob"] < without["shortfall_prob"]
+    assert with_lapse["expected_shortfall"] < without["expected_shortfall"]
+
+
+def test_service_and_local_quote_agree_and_share_the_store(repo_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(quote_service, "load_market_parameters", lambda mifid_class, source=None: MARKET)
+    monkeypatch.setattr(quote_engine, "load_market_parameters", lambda mifid_class, source=None: MARKET)
+    store = ResultStore(str(tmp_path))
+    inputs = contract(n_paths=500, exit_model="standard")
+
+    service = quote_service.QuoteService(store=store, batch_window=0.0)
+    try:
+        remote = service.quote(inputs, 1.0, timeout=120)
+    finally:
+        service.shutdown()
+    local = simulate_quote(inputs, 1.0, MARKET)
+
+    np.testing.assert_allclose(remote["end_values"], local["end_values"])
+    assert remote["exit_shares"] == pytest.approx(local["exit_shares"])
+    assert remote["exit_shares"]["riscatto"] > 0
+
+    # gleicher Schlüssel → aus dem Store; ohne Ausscheiden ein anderes Ergebnis
+    stored = run_mifid_quote(inputs, 1.0, store=store)
+    np.testing.assert_allclose(stored["end_values"], local["end_values"])
+    no_exits = run_mifid_quote({**inputs, "exit_model": "none"}, 1.0, store=store)
+    assert "exit_shares" not in no_exits
+    assert no_exits["stats"]["mean"] != pytest.approx(local["stats"]["mean"])
+
+
+def test_report_uses_engine_end_values(monkeypatch):
+    captured = {}
+    monkeypatch.setattr(summary_mifid, "generate_mifid_summary_pdf", lambda *args, **kwargs: captured.update(kwargs))
+    end_values = np.array([50.0, 120.0])  # Storno unter der Garantie bleibt bei 50
+    result = {"total_premiums": 100.0, "mu": 0.04, "sigma": 0.2, "final_fund_values": np.array([50.0, 120.0]),
+              "floors": np.array([100.0, 100.0]), "end_values": end_values}
+    params = {"age": 40, "death_age": 60, "mifid_class": "4 - Test", "costs_percent": 1.0, "n_paths": 2,
+              "guarantee_level": 1.0}
+    pipeline._report_stage(params, {"statistics": result})
+    np.testing.assert_array_equal(captured["end_values_by_guarantee"][1.0], end_values)
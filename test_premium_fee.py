@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from premiums import premium_schedule, units_from_premiums
+from quote_engine import (
+    RISK_FREE_RATE, _premium_fee_base, _pricing_rows, apply_contract_fees, risk_neutral_factors, scenario_days,
+    simulate_scenarios
+)
+from utils import guarantee_floors, mc_guarantee_cost
+
+MARKET = {"ticker": "TEST", "mu": 0.06, "sigma": 0.18, "s0": 100.0}
+
+
+def regular_premium_contract(**overrides):
+    inputs = {"age": 40, "death_age": 60, "contribution": 0.0, "mifid_class": "4 - Test", "costs_percent": 1.5,
+              "n_paths": 2000, "lock_in_pct": 0.0, "premium_mode": "annual", "annual_premium": 1200.0,
+              "premium_indexation_pct": 0.0}
+    inputs.update(overrides)
+    return inputs
+
+
+@pytest.fixture(scope="module")
+def priced():
+    inputs = regular_premium_contract()
+    days = scenario_days(inputs)
+    scenarios = simulate_scenarios(MARKET, 4, days, inputs["n_paths"], seed=11)
+    fees = apply_contract_fees(scenarios, inputs, 1.0, MARKET)
+    return inputs, days, scenarios, fees
+
+
+def test_regular_premium_fee_pv_covers_guarantee_price(priced):
+    inputs, days, scenarios, fees = priced
+    premium_rows, premium_amounts = premium_schedule(inputs["annual_premium"], days, "annual")
+    time_index = np.asarray(scenarios["time_index"])
+    rows = _pricing_rows(time_index, premium_rows)
+    prices = scenarios["unit_prices"][rows] * risk_neutral_factors(time_index[rows], MARKET)[:, None]
+    values = units_from_premiums(prices, premium_rows, premium_amounts, inputs["costs_percent"], 0.0, time_index[rows])
+    floors = guarantee_floors(values, fees["guarantee_base"], 1.0, 0.0, time_index[rows])
+    T = inputs["death_age"] - inputs["age"]
+    price = np.exp(-RISK_FREE_RATE * T) * np.mean(np.maximum(floors - values[-1], 0.0))
+
+    rate = fees["guarantee_cost_pct"]
+    fee_base = _premium_fee_base(prices, premium_rows, premium_amounts, inputs["costs_percent"], rate, 0.0,
+                                 time_index[rows])
+    assert price > 0
+    # Barwert der erhobenen Gebühr = Preis der Garantie
+    assert rate / 100 * fee_base == pytest.approx(price, rel=1e-6)
+
+
+def test_regular_premium_rate_uses_premium_weighted_fee_base(priced):
+    inputs, _, _, fees = priced
+    T = inputs["death_age"] - inputs["age"]
+    # Vertragswert liegt anfangs weit unter der Beitragssumme → kleinere Basis, höherer Satz
+    assert fees["fee_base"] is not None
+    assert 0 < fees["fee_base"] < fees["guarantee_base"] * T
+    assert fees["total_annual_cost"] == pytest.approx(inputs["costs_percent"] + fees["guarantee_cost_pct"])
+
+
+def test_single_premium_has_no_fee_base():
+    inputs = regular_premium_contract(premium_mode="single", contribution=10_000.0)
+    scenarios = simulate_scenarios(MARKET, 4, scenario_days(inputs), 200, seed=1)
+    assert apply_contract_fees(scenarios, inputs, 1.0, MARKET)["fee_base"] is None
+
+
+def test_fee_base_conversion_matches_mc_guarantee_cost():
+    final_values = np.array([80.0, 120.0])
+    floors = np.array([100.0, 100.0])
+    price = np.exp(-RISK_FREE_RATE * 10) * 10.0
+    assert mc_guarantee_cost(final_values, floors, 100.0, 10, r=RISK_FREE_RATE, fee_base=500.0) == \
+        pytest.approx(price / 500.0 * 100)
+    assert mc_guarantee_cost(final_values, floors, 100.0, 10, r=RISK_FREE_RATE) == \
+        pytest.approx(price / (100.0 * 10) * 100)
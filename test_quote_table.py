@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import quote_tables
+from quote_engine import simulate_quote
+from quote_tables import build_quote_table
+
+FUND = {"ticker": "FUND", "mu": 0.05, "sigma": 0.15, "s0": 100.0}
+BOND = {"ticker": "BOND", "mu": 0.02, "sigma": 0.01, "s0": 1.0}
+
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    markets = {"4": FUND, "1": BOND}
+    patch = pytest.MonkeyPatch()
+    patch.setattr(quote_tables, "load_market_parameters", lambda mifid_class, source=None: markets[mifid_class])
+    root = tmp_path_factory.mktemp("quote_tables")
+    try:
+        fund = build_quote_table(str(root / "fund.npz"), classes=(4,), guarantees=(0.9, 1.0), terms=(5, 10),
+                                 costs=(1.0, 2.0), n_paths=300)
+        bond = build_quote_table(str(root / "bond.npz"), classes=(1,), guarantees=(1.0,), terms=(5, 12),
+                                 costs=(1.0, 2.0), n_paths=300)
+    finally:
+        patch.undo()
+    return fund, bond
+
+
+def contract(term, cost, mifid_class="4 - Test", **overrides):
+    inputs = {"age": 50, "death_age": 50 + term, "contribution": 20_000.0, "mifid_class": mifid_class,
+              "costs_percent": cost, "n_paths": 300}
+    inputs.update(overrides)
+    return inputs
+
+
+def live_quote(table, inputs, guarantee, market):
+    live = simulate_quote({**inputs, "n_paths": table.meta["n_paths"]}, guarantee, market, seed=table.meta["seed"])
+    return {**live["stats"], "mean_fund": live["mean_fund"], "guarantee_cost_pct": live["guarantee_cost_pct"]}
+
+
+@pytest.mark.parametrize("term,cost,guarantee", [(5, 1.0, 1.0), (10, 2.0, 0.9)])
+def test_lookup_on_grid_point_equals_full_simulation(tables, term, cost, guarantee):
+    fund, _ = tables
+    inputs = contract(term, cost)
+    quote = fund.lookup(inputs, guarantee, market=FUND)
+    live = live_quote(fund, inputs, guarantee, FUND)
+    assert quote["source"] == "table"
+    for name in quote_tables.TABLE_STATS:
+        assert quote[name] == pytest.approx(live[name], rel=1e-5, abs=1e-5)
+
+
+def test_lookup_between_grid_points_stays_close_to_full_simulation(tables):
+    fund, _ = tables
+    inputs = contract(7, 1.5)
+    quote = fund.lookup(inputs, 1.0, market=FUND)
+    live = live_quote(fund, inputs, 1.0, FUND)
+    assert quote["mean"] == pytest.approx(live["mean"], rel=0.05)
+    assert quote["mean_fund"] == pytest.approx(live["mean_fund"], rel=0.05)
+
+
+@pytest.mark.parametrize("overrides", [
+    {"exit_model": "standard"}, {"lock_in_pct": 0.8}, {"premium_mode": "monthly"},
+    {"guarantee_fee_mode": "moneyness"}, {"death_age": 70}, {"costs_percent": 4.0},
+])
+def test_requests_outside_the_table_fall_back_to_simulation(tables, overrides):
+    fund, _ = tables
+    assert fund.lookup(contract(7, 1.5, **overrides), 1.0, market=FUND) is None
+
+
+def test_lookup_rejects_table_built_on_other_market_data(tables):
+    fund, _ = tables
+    moved = {**FUND, "sigma": FUND["sigma"] + 0.05}
+    assert fund.lookup(contract(7, 1.5), 1.0, market=FUND) is not None
+    assert fund.lookup(contract(7, 1.5), 1.0, market=moved) is None
+    assert fund.lookup(contract(7, 1.5), 1.0, market={**FUND, "ticker": "OTHER"}) is None
+
+
+def test_bond_quotes_are_not_interpolated_across_a_roll_date(tables):
+    _, bond = tables
+    assert bond.lookup(contract(8, 1.0, mifid_class="1 - Test"), 1.0, market=BOND) is None
+    on_grid = contract(12, 1.0, mifid_class="1 - Test")
+    quote = bond.lookup(on_grid, 1.0, market=BOND)
+    assert quote["mean"] == pytest.approx(live_quote(bond, on_grid, 1.0, BOND)["mean"], rel=1e-5)
+
+
+def test_spot_check_measures_interpolation_error(tables):
+    fund, _ = tables
+    errors = fund.spot_check(contract(10, 1.0), 1.0, market=FUND)
+    assert max(errors.values()) < 1e-4
+    assert fund.error_summary()["n_checks"] >= 1
+    assert np.isfinite(fund.error_summary()["mean"]["max"])
@@ -3,6 +3,7 @@ from config import FONDS, GARANTIEN
 import matplotlib.pyplot as plt
 import numpy as np
 from simulation import simulate_ou_process
+from progressive import ADAPTIVE_MIN_PATHS
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -40,6 +41,19 @@ def get_user_inputs():
     if not ready:
         st.sidebar.warning("⚠️ La somma delle allocazioni deve essere 100%.")
 
+    rebalance_modes = {
+        "Nessuno (buy and hold)": None,
+        "Mensile": "monthly",
+        "Trimestrale": "quarterly",
+        "Annuale": "annual",
+    }
+    rebalance = rebalance_modes[st.sidebar.selectbox("🔄 Ribilanciamento", list(rebalance_modes.keys()))]
+    rebalance_band = 0.0
+    transaction_cost_pct = 0.0
+    if rebalance is not None:
+        rebalance_band = st.sidebar.slider("Banda di tolleranza (punti %)", 0.0, 10.0, 0.0, step=0.5) / 100
+        transaction_cost_pct = st.sidebar.slider("Costi di transazione (% del volume)", 0.0, 1.0, 0.1, step=0.05)
+
     return {
         "age": age,
         "death_age": death_age,
@@ -49,6 +63,9 @@ def get_user_inputs():
         "fonds_weights": fonds_weights,
         "costs_percent": costs_percent,
         "n_paths": n_paths,
+        "rebalance": rebalance,
+        "rebalance_band": rebalance_band,
+        "transaction_cost_pct": transaction_cost_pct,
         "ready": ready
     }
 
@@ -65,6 +82,22 @@ def get_user_inputs_mifid():
         death_age = st.number_input("Età target (durata contratto)", min_value=age + 1, max_value=120, value=85)
         costs_percent = st.slider("Costi annuali (%)", 0.0, 5.0, 1.0, step=0.1)
 
+    premium_modes = {
+        "Premio unico": "single",
+        "Premi mensili": "monthly",
+        "Premi trimestrali": "quarterly",
+        "Premi annuali": "annual",
+    }
+    premium_mode = premium_modes[st.selectbox("💶 Tipo di premio", list(premium_modes.keys()))]
+    annual_premium = 0.0
+    premium_indexation_pct = 0.0
+    if premium_mode != "single":
+        col3, col4 = st.columns(2)
+        with col3:
+            annual_premium = st.number_input("Premio annuo (EUR)", 120, 100_000, step=120, value=1_200)
+        with col4:
+            premium_indexation_pct = st.slider("Indicizzazione annua dei premi (%)", 0.0, 5.0, 0.0, step=0.5)
+
     st.subheader("🧠 Profilo di rischio (MiFID II)")
     mifid_class = st.selectbox(
         "Seleziona il profilo:",
@@ -80,7 +113,46 @@ def get_user_inputs_mifid():
     }
 
     params = mifid_parameters[mifid_class]
-    n_paths = st.slider("Numero di simulazioni (Monte Carlo)", 10, 200, 100, step=10)
+    precision_modes = [
+        "Numero fisso",
+        "Precisione obiettivo (errore relativo)",
+        "Precisione obiettivo (errore standard)",
+    ]
+    precision_mode = st.selectbox("🎯 Numero di simulazioni", precision_modes)
+    target_rel_error = None
+    target_se = None
+    time_budget = 20.0
+    if precision_mode == precision_modes[0]:
+        n_paths = st.slider("Numero di simulazioni (Monte Carlo)", 10, 200, 100, step=10)
+    else:
+        n_paths = ADAPTIVE_MIN_PATHS  # nur für die Tail-Kennzahlen (Importance Sampling)
+        col5, col6 = st.columns(2)
+        with col5:
+            if precision_mode == precision_modes[1]:
+                target_rel_error = st.slider("Errore relativo obiettivo (media e VaR, %)", 0.1, 5.0, 1.0, step=0.1) / 100
+            else:
+                target_se = st.number_input("Errore standard obiettivo della media (EUR)", 1.0, 10_000.0, value=50.0, step=10.0)
+        with col6:
+            time_budget = float(st.slider("Tempo massimo (secondi)", 5, 120, 20, step=5))
+    lock_in_label = st.selectbox(
+        "🔒 Consolidamento garanzia (lock-in sul valore massimo annuo)",
+        ["Nessuno", "80%", "90%", "100%"]
+    )
+    lock_in_pct = 0.0 if lock_in_label == "Nessuno" else int(lock_in_label.rstrip("%")) / 100
+    guarantee_fee_mode = "flat"
+    if premium_mode == "single":
+        fee_modes = {
+            "Fissa (calcolata all'emissione)": "flat",
+            "In base al valore del fondo (a ogni ricorrenza)": "moneyness",
+        }
+        guarantee_fee_mode = fee_modes[st.selectbox("🛡️ Commissione di garanzia", list(fee_modes.keys()))]
+    exit_models = {
+        "Nessuna (prestazione all'età obiettivo)": None,
+        "Solo decesso": "mortality",
+        "Decesso e riscatti (standard)": "standard",
+        "Decesso e riscatti (elevati)": "high",
+    }
+    exit_model = exit_models[st.selectbox("🚪 Uscite prima della scadenza", list(exit_models.keys()))]
     ready = True if contribution > 0 else False
 
     return {
@@ -93,6 +165,15 @@ def get_user_inputs_mifid():
         "sigma": params["sigma"],
         "costs_percent": costs_percent,
         "n_paths": n_paths,
+        "target_rel_error": target_rel_error,
+        "target_se": target_se,
+        "time_budget": time_budget,
+        "lock_in_pct": lock_in_pct,
+        "premium_mode": premium_mode,
+        "annual_premium": annual_premium,
+        "premium_indexation_pct": premium_indexation_pct,
+        "guarantee_fee_mode": guarantee_fee_mode,
+        "exit_model": exit_model,
         "ready": ready
     }
 
@@ -163,26 +244,11 @@ def plot_rolling_bond_segments(s0, mu, theta, sigma, roll_years, total_years, n_
     st.plotly_chart(fig, use_container_width=True)
 
     st.markdown("ℹ️ Ogni barra rappresenta il valore medio simulato di un'obbligazione zero-coupon reinvestita ogni 10 anni, su base 1.000 EUR.")
-def plot_bond_growth_over_time(s0, mu, theta, sigma, total_years, n_paths, roll_years=10, initial_investment=10_000):
-    """
-    Zeigt die simulierte Entwicklung eines rollierenden Anleiheinvestments über die Zeit.
-    """
-    roll_days = int(roll_years * 252)
-    n_rolls = total_years // roll_years
-    time_points = [i * roll_years for i in range(n_rolls + 1)]
-    values = np.ones((n_paths,)) * initial_investment
-    avg_growth = [initial_investment]
-
-    for _ in range(n_rolls):
-        rates = simulate_ou_process(s0=s0, mu=mu, theta=theta, sigma=sigma, days=roll_days, n_paths=n_paths)
-        end_yield = np.clip(rates[-1, :], 0, None)
-        bond_growth = (1 + end_yield) ** roll_years
-        values *= bond_growth
-        avg_growth.append(np.mean(values))
-
+def build_bond_growth_figure(years, mean_values):
+    """Plotly-Grafik des mittleren Anleihewerts über die Jahre (ohne Anzeige)."""
     df = pd.DataFrame({
-        "Anno": time_points,
-        "Valore medio stimato (€)": avg_growth
+        "Anno": years,
+        "Valore medio stimato (€)": mean_values
     })
 
     fig = go.Figure()
@@ -209,4 +275,25 @@ def plot_bond_growth_over_time(s0, mu, theta, sigma, total_years, n_paths, roll_
 
     fig.update_yaxes(tickprefix="€", separatethousands=True)
 
+    return fig
+
+
+def plot_bond_growth_over_time(s0, mu, theta, sigma, total_years, n_paths, roll_years=10, initial_investment=10_000):
+    """
+    Zeigt die simulierte Entwicklung eines rollierenden Anleiheinvestments über die Zeit.
+    """
+    roll_days = int(roll_years * 252)
+    n_rolls = total_years // roll_years
+    time_points = [i * roll_years for i in range(n_rolls + 1)]
+    values = np.ones((n_paths,)) * initial_investment
+    avg_growth = [initial_investment]
+
+    for _ in range(n_rolls):
+        rates = simulate_ou_process(s0=s0, mu=mu, theta=theta, sigma=sigma, days=roll_days, n_paths=n_paths)
+        end_yield = np.clip(rates[-1, :], 0, None)
+        bond_growth = (1 + end_yield) ** roll_years
+        values *= bond_growth
+        avg_growth.append(np.mean(values))
+
+    fig = build_bond_growth_figure(time_points, avg_growth)
     st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
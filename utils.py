@@ -41,28 +41,348 @@ def price_guarantee_put(S0, K, T, sigma, r=0.01):
     put_price = K * np.exp(-r * T) * norm.cdf(-d2) - S0 * norm.cdf(-d1)
     return max(put_price, 0)
 
-def apply_annual_costs(paths, total_annual_cost, days):
+
+def guarantee_put_greeks(S0, K, T, sigma, r=0.01):
+    """
+    Vektorisierte Black-Scholes-Sensitivitäten der Garantie-Put-Option.
+
+    Alle Parameter dürfen Skalare oder Arrays sein und werden gegeneinander
+    gebroadcastet, z.B. Garantiebeträge als Spalte und Laufzeiten als Zeile.
+
+    Rückgabe:
+        dict mit 'price', 'delta', 'vega', 'rho', 'theta' (je ndarray).
+        Vega/Rho je 1.00 Vol bzw. Zins, Theta = Wertänderung pro Jahr Zeitablauf.
+    """
+    S0, K, T, sigma, r = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (S0, K, T, sigma, r))
+    )
+    live = (T > 0) & (sigma > 0)
+    T_ = np.where(live, T, 1.0)
+    sigma_ = np.where(live, sigma, 1.0)
+    sqrt_T = np.sqrt(T_)
+
+    d1 = (np.log(S0 / K) + (r + 0.5 * sigma_**2) * T_) / (sigma_ * sqrt_T)
+    d2 = d1 - sigma_ * sqrt_T
+    discount = np.exp(-r * T_)
+    n_d1 = norm.pdf(d1)
+    k_disc = K * discount * norm.cdf(-d2)
+
+    price = np.maximum(k_disc - S0 * norm.cdf(-d1), 0)
+    delta = norm.cdf(d1) - 1
+    vega = S0 * n_d1 * sqrt_T
+    rho = -T_ * k_disc
+    theta = -S0 * n_d1 * sigma_ / (2 * sqrt_T) + r * k_disc
+
+    # Abgelaufene oder volatilitätsfreie Garantie: innerer Wert wie price_guarantee_put
+    return {
+        "price": np.where(live, price, np.maximum(K - S0, 0)),
+        "delta": np.where(live, delta, -(K > S0).astype(float)),
+        "vega": np.where(live, vega, 0.0),
+        "rho": np.where(live, rho, 0.0),
+        "theta": np.where(live, theta, 0.0),
+    }
+
+
+def get_guarantee_cost_surface(contribution, guarantee_levels, terms, sigma, r=0.01):
+    """
+    Garantiekosten und Sensitivitäten über das Raster Garantieniveau × Laufzeit.
+
+    Zeilen entsprechen `guarantee_levels`, Spalten `terms` (Jahre). 'cost_pct'
+    entspricht get_guarantee_cost, 'cost_vega'/'cost_rho' sind dessen Ableitungen
+    nach sigma bzw. r (in %-Punkten p.a. je 1.00).
+    """
+    levels = np.asarray(guarantee_levels, dtype=float)[:, None]
+    terms = np.asarray(terms, dtype=float)[None, :]
+    greeks = guarantee_put_greeks(contribution, contribution * levels, terms, sigma, r)
+
+    scale = 100 / (contribution * terms)
+    surface = dict(greeks)
+    surface["guarantee_levels"] = levels[:, 0]
+    surface["terms"] = terms[0]
+    surface["cost_pct"] = greeks["price"] * scale
+    surface["cost_vega"] = greeks["vega"] * scale
+    surface["cost_rho"] = greeks["rho"] * scale
+    return surface
+
+
+def mc_guarantee_greeks(terminal_values, S0, K, T, sigma, r=0.01, mu=None):
+    """
+    Pathwise-Monte-Carlo-Sensitivitäten der Garantie aus einem bestehenden GBM-Lauf.
+
+    Parameter:
+        terminal_values – simulierte Endwerte S_T (vor Kosten und Garantie)
+        S0, K, T, sigma – wie price_guarantee_put
+        mu              – Drift des Laufs; None = risikoneutral (Drift r)
+
+    Rückgabe:
+        dict mit 'price', 'delta', 'vega', 'rho', 'theta' und je '<name>_se'
+        (Standardfehler). Bei realer Drift (mu gesetzt) enthält Rho nur den
+        Diskontierungseffekt. Abgelaufene oder volatilitätsfreie Garantie (T bzw.
+        sigma ≤ 0): innerer Wert, Vega/Rho/Theta 0 wie guarantee_put_greeks.
+    """
+    S_T = np.asarray(terminal_values, dtype=float)
+    drift = r if mu is None else mu
+    live = T > 0 and sigma > 0
+    if not live:
+        T, r = 0.0, 0.0  # nur innerer Wert, kein Zins- und Zeiteffekt
+    discount = np.exp(-r * T)
+
+    itm = (S_T < K).astype(float)
+    payoff = np.maximum(K - S_T, 0)
+    dlnS_dsigma = dlnS_dT = dlnS_dr = 0.0
+    if live:
+        log_return = np.log(S_T / S0)
+        dlnS_dsigma = (log_return - (drift + 0.5 * sigma**2) * T) / sigma
+        dlnS_dT = (drift - 0.5 * sigma**2) + (log_return - (drift - 0.5 * sigma**2) * T) / (2 * T)
+        dlnS_dr = T if mu is None else 0.0
+
+    samples = {
+        "price": discount * payoff,
+        "delta": -discount * itm * S_T / S0,
+        "vega": -discount * itm * S_T * dlnS_dsigma,
+        "rho": -T * discount * payoff - discount * itm * S_T * dlnS_dr,
+        "theta": r * discount * payoff + discount * itm * S_T * dlnS_dT,
+    }
+
+    n = S_T.size
+    result = {}
+    for name, values in samples.items():
+        result[name] = float(np.mean(values))
+        result[f"{name}_se"] = float(np.std(values, ddof=1) / np.sqrt(n)) if n > 1 else float("nan")
+    return result
+
+def anniversary_cost_factors(time_index, total_annual_cost):
+    """Kumulierter Kostenfaktor je Zeile: (1 - Kosten) hoch Anzahl vergangener Jahrestage."""
+    return (1 - total_annual_cost / 100) ** (np.asarray(time_index) // 252)
+
+
+def apply_annual_costs(paths, total_annual_cost, days, time_index=None):
     """
     Wendet jährliche Kosten auf die simulierten Pfade an (nur an Jahrestagen).
+
+    Akzeptiert eine Tagesmatrix (days × n_paths), Pfade auf einem Zeitraster
+    (mit `time_index` = Zeilen der Tagesmatrix) oder nur Endwerte (1D, Tag days - 1).
+    Die Kosten werden direkt im übergebenen Array abgezogen.
     """
     if total_annual_cost > 0:
-        for year in range(1, days // 252 + 1):
-            idx = year * 252
-            if idx < paths.shape[0]:
-                paths[idx:] *= (1 - total_annual_cost / 100)
+        if paths.ndim == 1:
+            paths *= anniversary_cost_factors(days - 1, total_annual_cost)
+        else:
+            if time_index is None:
+                time_index = np.arange(paths.shape[0])
+            paths *= anniversary_cost_factors(time_index, total_annual_cost)[:, None]
     return paths
 
+def moneyness_guarantee_fee(fund_values, floors, T_remaining, sigma, r=0.01, cap_pct=None):
+    """
+    Garantiegebühr (jährlicher %-Wert) je Pfad nach aktueller Moneyness.
+
+    Wie get_guarantee_cost, aber mit dem aktuellen Fondswert statt des Beitrags:
+    Put-Preis (vektorisiert über guarantee_put_greeks) je Euro Fondswert und Jahr
+    Restlaufzeit. Weit über der Garantie fällt die Gebühr gegen 0, nahe oder unter
+    der Garantie steigt sie (optional begrenzt auf cap_pct).
+    """
+    values = np.maximum(np.asarray(fund_values, dtype=float), 1e-9)
+    price = guarantee_put_greeks(values, floors, T_remaining, sigma, r)["price"]
+    fee = price / values / np.maximum(T_remaining, 1) * 100
+    return fee if cap_pct is None else np.minimum(fee, cap_pct)
+
+
+def apply_moneyness_costs(paths, costs_percent, floor, T, sigma, time_index=None, lock_in_pct=0.0, r=0.01,
+                          cap_pct=None):
+    """
+    Jährliche Verwaltungskosten und Garantiegebühr nach Moneyness in einem Durchlauf.
+
+    Zu jedem Jahrestag wird je Pfad die Gebühr aus dem Fondswert (vor Abzug) und
+    der Garantie (bei Lock-in: höchster bisheriger Jahrestagswert × lock_in_pct,
+    mindestens `floor`) bestimmt; der kumulierte Kostenfaktor wirkt dann auf alle
+    Zeilen bis zum nächsten Jahrestag. Die Schleife läuft nur über die Jahre, alle
+    Pfade werden je Jahr gemeinsam bewertet. Die Kosten werden direkt im Array abgezogen.
+
+    Returns:
+        np.ndarray: erhobene Garantiegebühr in %, shape = (Jahrestage, n_paths)
+    """
+    if time_index is None:
+        time_index = np.arange(paths.shape[0])
+    years = np.asarray(time_index) // 252
+    starts = np.searchsorted(years, np.arange(1, years[-1] + 1), side="left")
+    bounds = list(starts) + [paths.shape[0]]
+
+    factor = np.ones(paths.shape[1])
+    floors = np.full(paths.shape[1], float(floor))
+    running_high = None
+    fees = np.empty((len(starts), paths.shape[1]))
+    for k, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]), 1):
+        value = paths[start] * factor  # Fondswert am Jahrestag vor Abzug
+        if lock_in_pct > 0:
+            running_high = value if running_high is None else np.maximum(running_high, value)
+            floors = np.maximum(float(floor), lock_in_pct * running_high)
+        fees[k - 1] = moneyness_guarantee_fee(value, floors, T - k, sigma, r, cap_pct)
+        factor *= 1 - (costs_percent + fees[k - 1]) / 100
+        paths[start:stop] *= factor
+    return fees
+
+
+def lock_in_floor_path(paths, contribution, guarantee_level, lock_in_pct, time_index=None):
+    """
+    Verlauf der Lock-in-Garantie je Pfad über die Jahrestage (ein vektorisierter Durchlauf).
+
+    Die Garantie steigt auf `lock_in_pct` × höchster bisheriger Jahrestagswert,
+    fällt aber nie unter Beitrag × Garantielevel.
+
+    Returns:
+        np.ndarray: Zeilenindex der Jahrestage in `paths`
+        np.ndarray: Garantie je Jahrestag und Pfad, shape = (Jahrestage, n_paths)
+    """
+    if time_index is None:
+        time_index = np.arange(paths.shape[0])
+    time_index = np.asarray(time_index)
+    rows = np.flatnonzero((time_index > 0) & (time_index % 252 == 0))
+
+    static_floor = contribution * guarantee_level
+    if rows.size == 0 or lock_in_pct <= 0:
+        return rows, np.full((rows.size, paths.shape[1]), static_floor)
+    running_high = np.maximum.accumulate(paths[rows], axis=0)
+    return rows, np.maximum(static_floor, lock_in_pct * running_high)
+
+
+def guarantee_floors(paths, contribution, guarantee_level, lock_in_pct=0.0, time_index=None):
+    """Garantiebetrag je Pfad am Laufzeitende (statisch oder Lock-in)."""
+    _, floor_path = lock_in_floor_path(paths, contribution, guarantee_level, lock_in_pct, time_index)
+    if floor_path.shape[0] == 0:
+        return np.full(paths.shape[1], contribution * guarantee_level)
+    return floor_path[-1]
+
+
+def mc_guarantee_cost(final_values, floors, contribution, T, r=0.01, weights=None, fee_base=None):
+    """
+    Garantiekosten (jährlicher %-Wert wie get_guarantee_cost) aus simulierten Endwerten:
+    diskontierte mittlere Unterdeckung max(Garantie - Fondswert, 0).
+    Mit `weights` (Likelihood-Quotienten aus Importance Sampling) gewichtet.
+
+    Mit `fee_base` (Barwert der Gebührenbasis, Σ_k e^{-r t_k} · E[V_k] über die
+    Jahrestage) ist der Satz Preis / fee_base, d.h. der Barwert der auf den
+    Vertragswert erhobenen Gebühr entspricht dem Preis; sonst Preis / (Beitrag · T).
+    """
+    shortfall = np.maximum(np.asarray(floors) - np.asarray(final_values), 0)
+    if weights is not None:
+        shortfall = shortfall * weights
+    price = np.exp(-r * T) * np.mean(shortfall)
+    if fee_base is not None and fee_base > 0:
+        return price / fee_base * 100
+    return (price / contribution) * (1 / T) * 100
+
+def brownian_likelihood_ratio(w_sum, shift, T, shifted_fraction=1.0):
+    """
+    Likelihood-Quotient dP/dQ für Importance Sampling über eine Drift `shift` (pro Jahr)
+    der Brownschen Bewegung (Girsanov).
+
+    Q ist die Mischung aus (1 - shifted_fraction) unverschobenen und shifted_fraction
+    verschobenen Pfaden (defensives Importance Sampling: Gewichte ≤ 1 / (1 - f));
+    mit shifted_fraction = 1 ergibt sich exp(-shift · W_T + shift² · T / 2).
+
+    Args:
+        w_sum (np.ndarray): Summe der tatsächlich verwendeten Inkremente je Pfad (W_T).
+        T (float): Laufzeit in Jahren.
+    """
+    log_q_over_p = shift * np.asarray(w_sum) - 0.5 * shift**2 * T
+    return 1.0 / ((1 - shifted_fraction) + shifted_fraction * np.exp(log_q_over_p))
+
+def shifted_columns(n_paths, shifted_fraction):
+    """Maske der verschobenen Pfade (die ersten round(f · n)) und tatsächlicher Anteil."""
+    n_shifted = int(round(shifted_fraction * n_paths))
+    mask = np.arange(n_paths) < n_shifted
+    return mask, (n_shifted / n_paths if n_paths else 0.0)
+
+def weighted_mean_ci(samples, weights=None, z=1.96):
+    """Schätzer mean(w·f) mit Konfidenzintervall (Normalapproximation)."""
+    values = np.asarray(samples, dtype=float)
+    if weights is not None:
+        values = values * weights
+    mean = float(np.mean(values))
+    se = float(np.std(values, ddof=1) / np.sqrt(values.size)) if values.size > 1 else float("nan")
+    return mean, (mean - z * se, mean + z * se)
+
+def _weighted_var_cvar(values, weights, alpha):
+    order = np.argsort(values)
+    sorted_values = values[order]
+    sorted_weights = weights[order]
+    cdf = np.cumsum(sorted_weights) / values.size
+    k = min(int(np.searchsorted(cdf, alpha)), values.size - 1)
+    var = sorted_values[k]
+    tail_w = sorted_weights[:k + 1]
+    cvar = np.sum(tail_w * sorted_values[:k + 1]) / np.sum(tail_w)
+    return var, cvar
+
+def weighted_tail_statistics(values, weights=None, alpha=0.05, n_boot=200, seed=0):
+    """
+    VaR und CVaR (unteres `alpha`-Quantil bzw. Mittelwert darunter) aus gewichteten
+    Stichproben, mit Bootstrap-Konfidenzintervallen (95%).
+
+    Die Verteilungsfunktion wird unnormiert geschätzt, F(x) = 1/n · Σ w_i · 1{x_i ≤ x};
+    das ist bei Importance Sampling im Tail genauer als die selbstnormierte Variante.
+    Ohne `weights` entspricht das gewöhnlichem Monte Carlo.
+
+    Returns:
+        dict: var, var_ci, cvar, cvar_ci, ess (effektive Stichprobengröße)
+    """
+    values = np.asarray(values, dtype=float)
+    weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=float)
+    var, cvar = _weighted_var_cvar(values, weights, alpha)
+
+    rng = np.random.default_rng(seed)
+    boot = np.empty((n_boot, 2))
+    for b in range(n_boot):
+        idx = rng.integers(0, values.size, values.size)
+        boot[b] = _weighted_var_cvar(values[idx], weights[idx], alpha)
+    lo, hi = np.percentile(boot, [2.5, 97.5], axis=0)
+
+    return {
+        "var": float(var),
+        "var_ci": (float(lo[0]), float(hi[0])),
+        "cvar": float(cvar),
+        "cvar_ci": (float(lo[1]), float(hi[1])),
+        "ess": float(np.sum(weights) ** 2 / np.sum(weights**2)),
+    }
+
 def days_between_ages(start_age, end_age):
     return int((end_age - start_age) * 252)
 
+# MiFID-Grenzen je Klasse: Mindestrendite und Höchstvolatilität p.a. (Klassen ohne Eintrag: keine Grenze)
+MIFID_LIMITS = {
+    "1": {"min_mu": 0.0, "max_sigma": 0.05},
+    "2": {"max_sigma": 0.10},
+    "3": {"max_sigma": 0.20},
+}
+
+def mifid_class_key(mifid_class):
+    """Klassenschlüssel aus Angaben wie '1', '1 - Prudente', 3 → '1', '1', '3'."""
+    return str(mifid_class).strip().split()[0]
+
+def mifid_valid_mask(mifid_classes, mu, sigma):
+    """
+    Vektorisierte MiFID-Prüfung für ein ganzes Fondsuniversum: True, wenn mu und
+    sigma die Grenzen der jeweiligen Klasse einhalten (fehlende oder nicht
+    positive Volatilität gilt als ungültig).
+    """
+    limits = [MIFID_LIMITS.get(mifid_class_key(c), {}) for c in mifid_classes]
+    min_mu = np.array([limit.get("min_mu", -np.inf) for limit in limits])
+    max_sigma = np.array([limit.get("max_sigma", np.inf) for limit in limits])
+    mu, sigma = np.asarray(mu, dtype=float), np.asarray(sigma, dtype=float)
+    return np.isfinite(mu) & np.isfinite(sigma) & (sigma > 0) & (mu >= min_mu) & (sigma <= max_sigma)
+
 def is_mifid_fund_valid(mifid_class, mu, sigma):
-   if mifid_class.startswith("1") and (mu < 0 or sigma > 0.05):
-       return False
-   if mifid_class.startswith("2") and sigma > 0.10:
-       return False
-   if mifid_class.startswith("3") and sigma > 0.20:
-       return False
-   return True
+    return bool(mifid_valid_mask([mifid_class], [mu], [sigma])[0])
+
+def normalize_fund(entry, mifid_class=None):
+    """Fondseintrag aus MIFID_FONDS (dict oder Ticker-String) als dict mit ticker, name, isin, mifid_class."""
+    fund = dict(entry) if isinstance(entry, dict) else {"ticker": entry}
+    fund["ticker"] = str(fund.get("ticker") or "").strip()
+    fund.setdefault("name", fund["ticker"])
+    fund.setdefault("isin", None)
+    if mifid_class is not None:
+        fund["mifid_class"] = mifid_class_key(mifid_class)
+    return fund
 
 def get_fonds(mifid_class):
     """
@@ -72,8 +392,7 @@ def get_fonds(mifid_class):
     if not mifid_class:
         return []
 
-    key = str(mifid_class).strip().split()[0]  # nur Zahl extrahieren
-    return MIFID_FONDS.get(key, [])
+    return MIFID_FONDS.get(mifid_class_key(mifid_class), [])
 
 def plausibility_check(guaranteed_amount, mean_final, mu, sigma, label=""):
     warnings = []